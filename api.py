@@ -3,6 +3,11 @@ import sys
 import logging
 from flask import Blueprint, jsonify, request
 from datetime import datetime
+from operator import itemgetter
+import stat as stat_module
+from listing_cache import listing_cache
+from sizeindex import size_index
+from searchindex import search_index
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG, stream=sys.stderr)
@@ -37,7 +42,108 @@ def format_datetime(timestamp):
     return "Invalid Date"
 
 
-def get_directory_data(base_root_path, current_subpath, show_dotfiles=False, sort_by='name', order='asc'):
+def _build_item(name, ui_path, is_dir, stat):
+    ext = None
+    if not is_dir:
+        _, ext = os.path.splitext(name)
+        ext = ext.lstrip('.').lower()
+
+    return {
+        'name': name,
+        'is_directory': is_dir,
+        'size': stat.st_size,
+        'last_modified': stat.st_mtime,
+        'created': stat.st_ctime,
+        'file_extension': ext,
+        'subpath': ui_path,
+    }
+
+
+def _format_item(item):
+    """Adds the display strings; only done for the rows actually sent to the client."""
+    if item['name'] == '..':
+        return item
+    formatted = dict(item)
+    formatted['formatted_size'] = format_size(item['size'])
+    formatted['formatted_modified'] = format_datetime(item['last_modified'])
+    formatted['formatted_created'] = format_datetime(item['created'])
+    return formatted
+
+
+def _sort_key(item, sort_key):
+    """Precomputed sort tuple: the requested column first, then the name as tiebreaker."""
+    val = item.get(sort_key)
+    if isinstance(val, str):
+        val = val.lower()
+    elif val is None:
+        val = -1
+    return (val, item['name'].lower())
+
+
+def _scan_directory(abs_path, clean_subpath, show_dotfiles, sort_key, reverse):
+    dirs, files = [], []
+
+    with os.scandir(abs_path) as entries:
+        for entry in entries:
+            name = entry.name
+            if not show_dotfiles and name.startswith('.'):
+                continue
+
+            rel_path = os.path.join(clean_subpath, name).replace('\\', '/')
+
+            try:
+                # entry.stat() is the only syscall per entry; is_dir() reuses the
+                # d_type from readdir, or the cached stat result for symlinks.
+                stat = entry.stat()
+                is_dir = entry.is_dir()
+            except OSError:
+                continue
+
+            info = _build_item(name, '/' + rel_path, is_dir, stat)
+            (dirs if is_dir else files).append((_sort_key(info, sort_key), info))
+
+    dirs.sort(key=itemgetter(0), reverse=reverse)
+    files.sort(key=itemgetter(0), reverse=reverse)
+
+    return [info for _, info in dirs] + [info for _, info in files]
+
+
+def _get_sorted_listing(abs_path, clean_subpath, show_dotfiles, sort_key, reverse):
+    """
+    Returns (snapshot_id, items) for a directory. Sorted listings are kept in the
+    inotify-invalidated listing cache, so later pages and repeat listings of a directory
+    don't re-list and re-sort it. The snapshot id changes whenever the rows may have.
+    """
+    def scan():
+        # The directory changed (or was never listed): have its indexed size re-checked soon
+        size_index.mark_stale(abs_path)
+        search_index.mark_dirty(abs_path)
+        dir_mtime = os.stat(abs_path).st_mtime_ns
+        return dir_mtime, _scan_directory(abs_path, clean_subpath, show_dotfiles, sort_key, reverse)
+
+    return listing_cache.get(abs_path, sort_key, reverse, show_dotfiles, scan)
+
+
+def _apply_indexed_sizes(abs_path, items):
+    """
+    Replaces the size of directory rows with their recursive size from the persistent
+    size index, where known. `items` must be formatted copies, never cached items.
+    """
+    dir_items = [item for item in items if item['is_directory'] and item['name'] != '..']
+    if not dir_items:
+        return items
+    indexed = size_index.lookup(os.path.join(abs_path, item['name']) for item in dir_items)
+    for item in dir_items:
+        known = indexed.get(os.path.join(abs_path, item['name']))
+        if known is not None:
+            item['size'] = known['total_size_bytes']
+            item['formatted_size'] = format_size(known['total_size_bytes'])
+            item['size_recursive'] = True
+    return items
+
+
+def get_directory_data(base_root_path, current_subpath, show_dotfiles=False, sort_by='name', order='asc',
+                       offset=0, limit=None):
     clean_subpath = current_subpath.strip('/') if current_subpath else ''
     if clean_subpath.startswith('/'):
         clean_subpath = clean_subpath[1:]
@@ -64,17 +170,24 @@ def get_directory_data(base_root_path, current_subpath, show_dotfiles=False, sor
         pane_data['error'] = f"Invalid path: {current_ui_path}"
         return pane_data
 
-    if not os.path.exists(abs_path):
+    try:
+        path_stat = os.stat(abs_path)
+    except OSError:
         pane_data['error'] = f"Path not found: {current_ui_path}"
         return pane_data
 
-    if not os.path.isdir(abs_path):
+    if not stat_module.S_ISDIR(path_stat.st_mode):
         pane_data['is_file'] = True
         pane_data['name'] = os.path.basename(current_ui_path)
         return pane_data
 
+    # Sorting
+    valid_sort_keys = {'name', 'file_extension', 'size', 'last_modified', 'created'}
+    sort_key = sort_by if sort_by in valid_sort_keys else 'name'
+    reverse = order == 'desc'
+
     try:
-        entries = os.listdir(abs_path)
+        snapshot_id, entries = _get_sorted_listing(abs_path, clean_subpath, show_dotfiles, sort_key, reverse)
     except PermissionError:
         pane_data['error'] = f"Permission denied to access: {current_ui_path}"
         return pane_data
@@ -82,13 +195,12 @@ def get_directory_data(base_root_path, current_subpath, show_dotfiles=False, sor
         pane_data['error'] = f"Error listing directory: {e}"
         return pane_data
 
-    dirs, files = [], []
-
+    items = []
     if abs_path != abs_root:
         parent_path = os.path.dirname(abs_path)
         rel_parent = os.path.relpath(parent_path, base_root_path).replace('\\', '/')
         parent_ui_path = '/' if rel_parent in ('.', '') else '/' + rel_parent
-        pane_data['items'].append({
+        items.append({
             'name': '..',
             'is_directory': True,
             'size': None,
@@ -98,58 +210,20 @@ def get_directory_data(base_root_path, current_subpath, show_dotfiles=False, sor
             'subpath': parent_ui_path
         })
 
-    for name in entries:
-        if name in ('.', '..'):
-            continue
-        if not show_dotfiles and name.startswith('.'):
-            continue
-
-        full_path = os.path.join(abs_path, name)
-        rel_path = os.path.join(clean_subpath, name).replace('\\', '/')
-        ui_path = '/' + rel_path
+    total = len(items) + len(entries)
+    offset = max(0, offset)
+    end = total if limit is None else min(total, offset + max(0, limit))
 
-        try:
-            stat = os.stat(full_path)
-            is_dir = os.path.isdir(full_path)
-            size = stat.st_size
-            last_modified = stat.st_mtime
-            created = stat.st_ctime
-            ext = None
-            if not is_dir:
-                _, ext = os.path.splitext(name)
-                ext = ext.lstrip('.').lower()
-
-            info = {
-                'name': name,
-                'is_directory': is_dir,
-                'size': size,
-                'last_modified': last_modified,
-                'created': created,
-                'file_extension': ext,
-                'subpath': ui_path,
-                'formatted_size': format_size(size),
-                'formatted_modified': format_datetime(last_modified),
-                'formatted_created': format_datetime(created),
-            }
-
-            (dirs if is_dir else files).append(info)
-        except Exception:
-            continue
+    # The '..' row counts as index 0 of the window when present.
+    if offset < len(items):
+        window = items[offset:end] + entries[:max(0, end - len(items))]
+    else:
+        window = entries[offset - len(items):end - len(items)]
 
-    # Sorting
-    valid_sort_keys = {'name', 'file_extension', 'size', 'last_modified', 'created'}
-    sort_key = sort_by if sort_by in valid_sort_keys else 'name'
-    reverse = order == 'desc'
-
-    def sort_value(item):
-        val = item.get(sort_key)
-        return val.lower() if isinstance(val, str) else (val if val is not None else -1)
-
-    dirs.sort(key=sort_value, reverse=reverse)
-    files.sort(key=sort_value, reverse=reverse)
-
-    pane_data['items'].extend(dirs)
-    pane_data['items'].extend(files)
+    pane_data['items'] = _apply_indexed_sizes(abs_path, [_format_item(item) for item in window])
+    pane_data['total'] = total
+    pane_data['offset'] = offset
+    pane_data['snapshot'] = str(snapshot_id)
     return pane_data
 
 
@@ -162,5 +236,70 @@ def list_items_api(subpath=''):
     if order not in ('asc', 'desc'):
         order = 'asc'
 
-    data = get_directory_data(GUI_ROOT, subpath, show_dotfiles, sort_by, order)
+    # Optional window: ?offset=0&limit=500. Without a limit the whole directory is returned.
+    offset = request.args.get('offset', 0, type=int)
+    limit = request.args.get('limit', type=int)
+
+    data = get_directory_data(GUI_ROOT, subpath, show_dotfiles, sort_by, order, offset, limit)
     return jsonify(data)
+
+
+@api_bp.route('/search')
+def search_api():
+    """
+    Finds files and directories anywhere under GUI_ROOT by name, from the search index.
+    ?q=<terms>&path=<ui path to search below>&offset=0&limit=100&show_dotfiles=false&type=file|dir
+    The response has the shape of a /list page, so a pane can show it: each item's
+    subpath is its full UI path and `location` is the directory it is in.
+    """
+    query = request.args.get('q', '').strip()
+    show_dotfiles = request.args.get('show_dotfiles', 'false').lower() == 'true'
+    offset = max(0, request.args.get('offset', 0, type=int))
+    limit = min(max(0, request.args.get('limit', 100, type=int)), 1000)
+    kind = request.args.get('type')
+
+    abs_root = os.path.abspath(GUI_ROOT)
+    scope_ui_path = '/' + request.args.get('path', '').strip('/')
+    scope = os.path.abspath(os.path.join(abs_root, scope_ui_path.lstrip('/')))
+    if scope != abs_root and not scope.startswith(abs_root + os.sep):
+        return jsonify({'error': f"Invalid path: {scope_ui_path}"}), 400
+
+    found = search_index.search(query, scope, offset, limit, show_dotfiles, kind)
+
+    items = []
+    for abs_path, is_dir in found['results']:
+        ui_path = '/' + os.path.relpath(abs_path, abs_root).replace('\\', '/')
+        try:
+            stat = os.stat(abs_path)
+        except OSError:
+            # Gone since it was indexed: have its directory re-read
+            search_index.mark_dirty(os.path.dirname(abs_path))
+            continue
+        item = _build_item(os.path.basename(abs_path), ui_path, stat_module.S_ISDIR(stat.st_mode), stat)
+        item['location'] = os.path.dirname(ui_path)
+        items.append(_format_item(item))
+
+    index = search_index.status()
+    return jsonify({
+        'current_path': '?' + query,
+        'query': query,
+        'items': items,
+        'is_file': False,
+        'error': None,
+        'name': None,
+        'total': found['total'],
+        'offset': offset,
+        # Changes whenever the index does, so a pane reloads instead of mixing pages
+        'snapshot': found['snapshot'],
+        'index': index,
+    })
+
+
+@api_bp.route('/search/stats')
+def search_stats_api():
+    return jsonify(search_index.stats())
+
+
+@api_bp.route('/listcache/stats')
+def list_cache_stats_api():
+    return jsonify(listing_cache.stats())
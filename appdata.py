@@ -0,0 +1,20 @@
+# appdata.py
+# Where the app keeps state that should survive a container restart (indexes, caches).
+# Defaults to ./data next to the code, which lives on the /app volume in docker-compose.
+#
+# Bulky regenerable output (transcoded segments, thumbnails, rendered pages) goes to
+# CACHE_DIR instead, which defaults to /tmp so it stays off the code volume.
+
+import os
+from pathlib import Path
+
+DATA_DIR = Path(os.environ.get('FLYINGFAWK_DATA_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')))
+CACHE_DIR = Path(os.environ.get('FLYINGFAWK_CACHE_DIR', '/tmp/flyingfawk-cache'))
+
+
+def data_path(*parts):
+    """Returns DATA_DIR/<parts>, creating the parent directories."""
+    path = DATA_DIR.joinpath(*parts)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    return path
+
@@ -0,0 +1,323 @@
+# batchops.py
+# Runs an ordered list of file operations (/api/batch) in one request:
+# rename, move, delete, mkdir and newfile.
+#
+# - Operations that touch unrelated paths are independent and run in parallel:
+#   each one gets a wave, one past the last earlier operation on the same path, an
+#   ancestor or a descendant of it. Waves run one after the other; the operations of
+#   a wave run BATCH_THREADS chunks at a time on real threads (eventlet.tpool).
+#   Results come back in request order whatever ran first.
+# - Renames and moves never replace what's at the target: renameat2(RENAME_NOREPLACE)
+#   where the kernel and filesystem support it, otherwise a check right before the
+#   rename (best effort: something created in between is replaced). Same-filesystem
+#   moves are a single rename; moves to another filesystem are handed to the transfer manager as
+#   background 'move' jobs once the rest of the batch has run.
+# - Deletes move the item to the trash (trash.py), a rename as well; the entry id is
+#   in the result so the UI can restore it.
+# - `atomic` batches are all or nothing: the operations run in order and the first
+#   failure undoes everything done so far in reverse, restoring trashed items. Moves
+#   to another filesystem can't be undone cheaply and fail in this mode.
+#
+# Only blocking os calls happen in the functions run on tpool threads: no logging, no
+# green primitives.
+
+import os
+import errno
+import logging
+
+try:
+    import ctypes
+    _renameat2 = ctypes.CDLL(None, use_errno=True).renameat2
+except (OSError, AttributeError):  # not Linux / glibc < 2.28: check-then-rename only
+    _renameat2 = None
+
+import eventlet
+from eventlet import tpool
+
+from transfers import transfer_manager
+from trash import trash_item, restore_item
+
+logger = logging.getLogger(__name__)
+
+HOSTROOT = os.environ.get('GUI_ROOT', '/hostroot')
+BATCH_OPS = ('rename', 'move', 'delete', 'mkdir', 'newfile')
+BATCH_MAX_OPS = int(os.environ.get('FLYINGFAWK_BATCH_MAX_OPS', '20000'))
+# Chunks of a wave in flight at once (each on a tpool thread)
+BATCH_THREADS = int(os.environ.get('FLYINGFAWK_BATCH_THREADS', '8'))
+# Operations per tpool call; most are a single syscall, cheaper than the thread hop
+BATCH_CHUNK = 64
+
+AT_FDCWD = -100
+RENAME_NOREPLACE = 1
+# renameat2 errors meaning "no RENAME_NOREPLACE here" rather than a failed rename
+_NOREPLACE_UNSUPPORTED = {errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP}
+
+
+class BatchError(ValueError):
+    """A malformed operation; the whole batch is rejected."""
+
+
+class Operation:
+    __slots__ = ('index', 'op', 'source', 'target')
+
+    def __init__(self, index, op, source=None, target=None):
+        self.index = index
+        self.op = op
+        self.source = source    # existing path: rename/move/delete
+        self.target = target    # path created: rename/move/mkdir/newfile
+
+    @property
+    def paths(self):
+        return [path for path in (self.source, self.target) if path is not None]
+
+    def result(self, ok, error=None, **extra):
+        result = {"op": self.op, "ok": ok}
+        if self.op in ('rename', 'move'):
+            result["source"] = self.source
+            result["destination"] = self.target
+        else:
+            result["path"] = self.source or self.target
+        if error is not None:
+            result["error"] = error
+        result.update(extra)
+        return result
+
+
+def _resolve(path, index, field):
+    hostroot = os.path.abspath(HOSTROOT)
+    if not isinstance(path, str) or not path:
+        raise BatchError(f"Operation {index}: '{field}' must be a non-empty string.")
+    resolved = os.path.normpath(path)
+    if resolved != hostroot and not resolved.startswith(hostroot + os.sep):
+        raise BatchError(f"Operation {index}: invalid path: {path}")
+    return resolved
+
+
+def parse_operations(raw_operations):
+    """
+    Validates the request's operations and returns them as Operation objects.
+      { "op": "rename",  "source": "/hostroot/a", "destination": "/hostroot/b" }
+      { "op": "move",    "source": "/hostroot/a", "destination": "/hostroot/dir" }  (into dir)
+      { "op": "delete",  "path": "/hostroot/a" }
+      { "op": "mkdir",   "path": "/hostroot/new/dir" }
+      { "op": "newfile", "path": "/hostroot/new.txt" }
+    """
+    if not isinstance(raw_operations, list) or not raw_operations:
+        raise BatchError("'operations' must be a non-empty list.")
+    if len(raw_operations) > BATCH_MAX_OPS:
+        raise BatchError(f"At most {BATCH_MAX_OPS} operations per batch.")
+
+    hostroot = os.path.abspath(HOSTROOT)
+    operations = []
+    for index, raw in enumerate(raw_operations):
+        if not isinstance(raw, dict) or raw.get('op') not in BATCH_OPS:
+            raise BatchError(f"Operation {index}: 'op' must be one of {', '.join(BATCH_OPS)}.")
+        kind = raw['op']
+        if kind in ('rename', 'move'):
+            source = _resolve(raw.get('source'), index, 'source')
+            destination = _resolve(raw.get('destination'), index, 'destination')
+            if kind == 'move':
+                destination = os.path.join(destination, os.path.basename(source))
+            if (destination + os.sep).startswith(source + os.sep):
+                raise BatchError(f"Operation {index}: cannot {kind} a path into itself.")
+            operation = Operation(index, kind, source=source, target=destination)
+        elif kind == 'delete':
+            operation = Operation(index, kind, source=_resolve(raw.get('path'), index, 'path'))
+        else:
+            operation = Operation(index, kind, target=_resolve(raw.get('path'), index, 'path'))
+        if hostroot in operation.paths:
+            raise BatchError(f"Operation {index}: cannot {kind} the root directory.")
+        operations.append(operation)
+    return operations
+
+
+def _ancestors(path):
+    while True:
+        parent = os.path.dirname(path)
+        if parent == path:
+            return
+        yield parent
+        path = parent
+
+
+def schedule(operations):
+    """
+    Groups operations into waves that can each run in parallel. An operation waits for
+    every earlier one on the same path, an ancestor of it (a mkdir it moves into, a
+    delete of its directory) or a descendant of it (a rename inside a directory it
+    deletes), so running the waves in order gives the result of the listed order.
+    """
+    on_path = {}      # path -> last wave of an operation on exactly that path
+    under_path = {}   # path -> last wave of an operation somewhere below it
+    waves = []
+    for operation in operations:
+        wave = 0
+        for path in operation.paths:
+            wave = max(wave, on_path.get(path, -1) + 1, under_path.get(path, -1) + 1)
+            for parent in _ancestors(path):
+                wave = max(wave, on_path.get(parent, -1) + 1)
+        for path in operation.paths:
+            on_path[path] = wave
+            for parent in _ancestors(path):
+                under_path[parent] = max(under_path.get(parent, -1), wave)
+        if wave == len(waves):
+            waves.append([])
+        waves[wave].append(operation)
+    return waves
+
+
+def _missing_dirs(path):
+    """The directories makedirs(path) would create, deepest first."""
+    missing = []
+    while not os.path.lexists(path):
+        missing.append(path)
+        parent = os.path.dirname(path)
+        if parent == path:
+            break
+        path = parent
+    return missing
+
+
+def _remove_dirs(directories):
+    for directory in directories:
+        os.rmdir(directory)
+
+
+def _rename_new(source, target):
+    """os.rename that refuses to replace an existing target (FileExistsError)."""
+    if _renameat2 is not None:
+        if _renameat2(AT_FDCWD, os.fsencode(source), AT_FDCWD, os.fsencode(target), RENAME_NOREPLACE) == 0:
+            return
+        error = ctypes.get_errno()
+        if error not in _NOREPLACE_UNSUPPORTED:
+            raise OSError(error, os.strerror(error), source, None, target)
+    if not os.path.lexists(source):
+        raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), source)
+    if os.path.lexists(target):
+        raise FileExistsError(errno.EEXIST, os.strerror(errno.EEXIST), target)
+    os.rename(source, target)
+
+
+def apply_operation(operation):
+    """
+    Performs one operation. Returns (undo, extra): a callable that reverses it and
+    fields for its result.
+    """
+    kind = operation.op
+    if kind in ('rename', 'move'):
+        _rename_new(operation.source, operation.target)
+        return (lambda: _rename_new(operation.target, operation.source)), {}
+
+    if kind == 'delete':
+        entry = trash_item(operation.source)
+        return (lambda: restore_item(entry, rename_on_conflict=False)), {"trash": entry['id']}
+
+    if kind == 'mkdir':
+        created = _missing_dirs(operation.target)
+        if not created:
+            raise FileExistsError(errno.EEXIST, os.strerror(errno.EEXIST), operation.target)
+        os.makedirs(operation.target)
+        return (lambda: _remove_dirs(created)), {}
+
+    # newfile
+    parent = os.path.dirname(operation.target)
+    created = _missing_dirs(parent)
+    os.makedirs(parent, exist_ok=True)
+    fd = os.open(operation.target, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+    os.close(fd)
+
+    def undo():
+        os.remove(operation.target)
+        _remove_dirs(created)
+    return undo, {}
+
+
+def _run_chunk(chunk):
+    """Runs independent operations; returns (operation, error, extra, cross_device) per operation."""
+    outcomes = []
+    for operation in chunk:
+        try:
+            _, extra = apply_operation(operation)
+            outcomes.append((operation, None, extra, False))
+        except OSError as e:
+            cross_device = operation.op == 'move' and e.errno == errno.EXDEV
+            outcomes.append((operation, str(e), {}, cross_device))
+    return outcomes
+
+
+def _run_atomic(operations):
+    """
+    Runs operations in order, undoing all of them on the first failure.
+    Returns (extra result fields per operation, failed operation or None, its error,
+    rollback errors).
+    """
+    done = []
+    for operation in operations:
+        try:
+            done.append(apply_operation(operation))
+        except OSError as e:
+            rollback_errors = []
+            for undo, _ in reversed(done):
+                try:
+                    undo()
+                except OSError as undo_error:
+                    rollback_errors.append(str(undo_error))
+            return [], operation, str(e), rollback_errors
+    return [extra for _, extra in done], None, None, []
+
+
+def run_batch(operations, atomic=False):
+    """Runs parsed operations; returns the /api/batch response body."""
+    results = [None] * len(operations)
+
+    if atomic:
+        extras, failed, error, rollback_errors = tpool.execute(_run_atomic, operations)
+        if failed is None:
+            results = [operation.result(True, **extra) for operation, extra in zip(operations, extras)]
+            status = 'done'
+        else:
+            for operation in operations:
+                if operation is failed:
+                    results[operation.index] = operation.result(False, error)
+                else:
+                    results[operation.index] = operation.result(False, 'rolled back')
+            status = 'rolled_back'
+            logger.warning(f"batch: operation {failed.index} ({failed.op}) failed: {error}; rolled back")
+            for rollback_error in rollback_errors:
+                logger.error(f"batch: rollback error: {rollback_error}")
+        response = {"status": status, "atomic": True, "results": results, "transfers": []}
+        if rollback_errors:
+            response["rollback_errors"] = rollback_errors
+        return response
+
+    cross_device = []
+    pool = eventlet.GreenPool(BATCH_THREADS)
+    for wave in schedule(operations):
+        chunks = [wave[i:i + BATCH_CHUNK] for i in range(0, len(wave), BATCH_CHUNK)]
+        for outcomes in pool.imap(lambda chunk: tpool.execute(_run_chunk, chunk), chunks):
+            for operation, error, extra, is_cross_device in outcomes:
+                if is_cross_device:
+                    cross_device.append(operation)
+                else:
+                    results[operation.index] = operation.result(error is None, error, **extra)
+
+    # Moves to another filesystem copy in the background, one job per destination
+    transfers = []
+    by_destination = {}
+    for operation in cross_device:
+        by_destination.setdefault(os.path.dirname(operation.target), []).append(operation)
+    for destination, moves in by_destination.items():
+        job = transfer_manager.submit('move', [operation.source for operation in moves], destination)
+        transfers.append(job.describe())
+        for operation in moves:
+            results[operation.index] = operation.result(True, transfer=job.id)
+
+    failed = sum(1 for result in results if not result["ok"])
+    if failed == 0:
+        status = 'done'
+    elif failed == len(results):
+        status = 'failed'
+    else:
+        status = 'partial'
+    logger.info(f"batch: {len(results)} operations, {failed} failed, {len(transfers)} transfers started")
+    return {"status": status, "atomic": False, "results": results, "transfers": transfers}
@@ -0,0 +1,69 @@
+# benchmarks/bench_listing.py
+# Times /api/list against synthetic directories of 1k, 10k and 100k entries.
+#
+# Usage (from the repo root):
+#   python benchmarks/bench_listing.py [--sizes 1000 10000 100000] [--repeat 5]
+#
+# The directories are created under a temporary GUI_ROOT and removed afterwards.
+# Only the api blueprint is mounted, so no login/SocketIO/docker setup is needed.
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+
+def populate(directory, count):
+    os.makedirs(directory, exist_ok=True)
+    # Roughly 1 in 20 entries is a directory, the rest are small files with mixed extensions.
+    extensions = ('txt', 'jpg', 'mp4', 'pdf', 'py')
+    for i in range(count):
+        if i % 20 == 0:
+            os.mkdir(os.path.join(directory, f"dir_{i:06d}"))
+        else:
+            with open(os.path.join(directory, f"file_{i:06d}.{extensions[i % len(extensions)]}"), 'wb') as f:
+                f.write(b'x' * (i % 512))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--sort-by', default='name')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='flyingfawk_bench_') as root:
+        os.environ['GUI_ROOT'] = root
+
+        from flask import Flask
+        import api
+
+        api.GUI_ROOT = root
+        app = Flask(__name__)
+        app.register_blueprint(api.api_bp)
+        client = app.test_client()
+
+        print(f"{'entries':>8} {'min ms':>10} {'median ms':>10} {'max ms':>10} {'json KB':>10}")
+        for size in args.sizes:
+            name = f"bench_{size}"
+            populate(os.path.join(root, name), size)
+
+            timings = []
+            body_size = 0
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                response = client.get(f"/api/list/{name}?sort_by={args.sort_by}")
+                timings.append((time.perf_counter() - start) * 1000)
+                body_size = len(response.data)
+                assert response.status_code == 200, response.status_code
+
+            print(f"{size:>8} {min(timings):>10.1f} {statistics.median(timings):>10.1f} "
+                  f"{max(timings):>10.1f} {body_size / 1024:>10.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+# benchmarks/bench_search.py
+# Times finding files by name: walking the tree (what `find -iname` does) against the
+# search index behind /api/search, plus how long the index takes to build.
+#
+# Usage (from the repo root):
+#   python benchmarks/bench_search.py [--files 200000] [--per-dir 200] [--dir /path/to/test/on]
+#
+# A tree of generated names is crawled into a fresh index, then each query is run both
+# ways. Pass --dir to test on the filesystem you care about; the default is the system
+# temp directory. The page cache is warm for the walks, so on real volumes the walk
+# numbers are a best case. The index matches terms under three characters as name
+# prefixes, the walk as substrings, so their hit counts differ for 'ph'.
+
+import eventlet
+eventlet.monkey_patch()
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+WORDS = ['report', 'invoice', 'holiday', 'backup', 'draft', 'final', 'photo', 'scan', 'notes', 'budget']
+EXTENSIONS = ['.pdf', '.jpg', '.txt', '.mkv', '.docx']
+QUERIES = ['invoice', 'holiday 2019', 'notes_budget', '001234', 'qzx', 'ph']
+
+
+def populate(root, count, per_dir):
+    for i in range(count):
+        directory = os.path.join(root, f"area_{i // (per_dir * 50):03d}", f"dir_{i // per_dir:05d}")
+        if i % per_dir == 0:
+            os.makedirs(directory)
+        name = f"{WORDS[i % len(WORDS)]}_{WORDS[(i // 7) % len(WORDS)]}_{2010 + i % 15}_{i:06d}{EXTENSIONS[i % len(EXTENSIONS)]}"
+        open(os.path.join(directory, name), 'w').close()
+
+
+def walk_search(root, query):
+    terms = query.lower().split()
+    found = 0
+    for _, dirs, files in os.walk(root):
+        for name in dirs + files:
+            lowered = name.lower()
+            if all(term in lowered for term in terms):
+                found += 1
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--files', type=int, default=200000)
+    parser.add_argument('--per-dir', type=int, default=200)
+    parser.add_argument('--dir', default=None)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='flyingfawk_bench_', dir=args.dir) as root:
+        tree = os.path.join(root, 'tree')
+        os.environ['FLYINGFAWK_DATA_DIR'] = os.path.join(root, 'data')
+        os.environ['FLYINGFAWK_SEARCH_CRAWL_RATE'] = '1000000'
+        from searchindex import SearchIndex
+
+        populate(tree, args.files, args.per_dir)
+        index = SearchIndex(root=tree, db_path=os.path.join(root, 'search.sqlite3'))
+
+        start = time.perf_counter()
+        index.rebuild()
+        stats = index.stats()
+        print(f"index build: {time.perf_counter() - start:.2f}s for {stats['entries']} entries "
+              f"in {stats['directories']} directories (trigram: {stats['trigram']})")
+
+        print(f"{'query':<16} {'walk s':>8} {'walk hits':>10} {'index ms':>9} {'index hits':>11}")
+        for query in QUERIES:
+            start = time.perf_counter()
+            walk_hits = walk_search(tree, query)
+            walk_seconds = time.perf_counter() - start
+
+            start = time.perf_counter()
+            found = index.search(query, limit=100)
+            index_ms = (time.perf_counter() - start) * 1000
+            print(f"{query:<16} {walk_seconds:>8.2f} {walk_hits:>10} {index_ms:>9.1f} {found['total']:>11}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+# benchmarks/bench_video_paths.py
+# Compares the three streaming paths picked by videoprobe (copy / audio / full).
+#
+# Usage (from the repo root, needs ffmpeg and ffprobe in PATH):
+#   python benchmarks/bench_video_paths.py [--duration 30] [--size 1280x720] [--repeat 3]
+#
+# Sample clips are generated with ffmpeg's lavfi sources (testsrc2 + sine) so each path
+# is exercised by a matching source:
+#   h264_aac.mp4   -> copy   (H.264 + AAC, remux only)
+#   h264_flac.mkv  -> audio  (H.264 video copied, FLAC re-encoded to AAC)
+#   mpeg4_mp2.avi  -> full   (MPEG-4 part 2 video, everything re-encoded)
+# For every clip the streaming command is run to completion and we report the time to
+# first byte on stdout, the wall time and the CPU time ffmpeg used (user + sys).
+
+import argparse
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import videoprobe  # noqa: E402
+
+SAMPLES = [
+    # name, expected mode, encoder arguments
+    ('h264_aac.mp4', videoprobe.MODE_COPY, ['-c:v', 'libx264', '-pix_fmt', 'yuv420p', '-c:a', 'aac']),
+    ('h264_flac.mkv', videoprobe.MODE_AUDIO, ['-c:v', 'libx264', '-pix_fmt', 'yuv420p', '-c:a', 'flac']),
+    ('mpeg4_mp2.avi', videoprobe.MODE_FULL, ['-c:v', 'mpeg4', '-q:v', '5', '-c:a', 'mp2']),
+]
+
+
+def make_sample(path, duration, size, encoder_args):
+    command = [
+        'ffmpeg', '-v', 'error', '-y',
+        '-f', 'lavfi', '-i', f"testsrc2=size={size}:rate=30:duration={duration}",
+        '-f', 'lavfi', '-i', f"sine=frequency=440:sample_rate=48000:duration={duration}",
+        '-shortest', *encoder_args, path
+    ]
+    subprocess.run(command, check=True)
+
+
+def children_cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def run_stream(command):
+    """Runs one streaming command to the end; returns (ttfb s, wall s, cpu s, bytes)."""
+    cpu_before = children_cpu_seconds()
+    start = time.perf_counter()
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+
+    first = process.stdout.read(4096)
+    ttfb = time.perf_counter() - start
+    total = len(first)
+    while True:
+        chunk = process.stdout.read(65536)
+        if not chunk:
+            break
+        total += len(chunk)
+    process.wait()
+
+    wall = time.perf_counter() - start
+    return ttfb, wall, children_cpu_seconds() - cpu_before, total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--duration', type=int, default=30)
+    parser.add_argument('--size', default='1280x720')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='flyingfawk_bench_video_') as root:
+        print(f"{'clip':<16} {'mode':<6} {'ttfb ms':>9} {'wall s':>8} {'cpu s':>8} {'cpu/wall':>9} {'MB':>7}")
+        for name, expected_mode, encoder_args in SAMPLES:
+            path = os.path.join(root, name)
+            make_sample(path, args.duration, args.size, encoder_args)
+
+            mode, command = videoprobe.plan_stream(path)
+            if mode != expected_mode:
+                print(f"warning: {name} probed as {mode}, expected {expected_mode}")
+
+            runs = [run_stream(command) for _ in range(args.repeat)]
+            ttfb = statistics.median(r[0] for r in runs) * 1000
+            wall = statistics.median(r[1] for r in runs)
+            cpu = statistics.median(r[2] for r in runs)
+            size_mb = runs[-1][3] / (1024 * 1024)
+            print(f"{name:<16} {mode:<6} {ttfb:>9.1f} {wall:>8.2f} {cpu:>8.2f} {cpu / wall:>9.2f} {size_mb:>7.1f}")
+
+
+if __name__ == '__main__':
+    main()
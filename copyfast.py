@@ -0,0 +1,164 @@
+# copyfast.py
+# Copies one file as cheaply as the filesystem allows:
+#
+# 1. FICLONE reflink: on btrfs/XFS/bcachefs/overlay-on-those the copy shares extents
+#    with the source and costs the same whatever the size.
+# 2. os.copy_file_range: the kernel copies (or offloads to the server for NFS/SMB)
+#    without the data visiting userspace.
+# 3. os.sendfile between the two files, for kernels/filesystems without the above.
+# 4. A plain read/write loop with a large buffer.
+#
+# Each step falls through to the next when the kernel says it doesn't apply. Only
+# blocking os calls happen here: callers run it on real threads (eventlet.tpool), so
+# nothing in this module may log or touch green primitives.
+
+import os
+import errno
+import shutil
+
+try:
+    import fcntl
+except ImportError:  # not on Linux; the reflink step is skipped
+    fcntl = None
+
+FICLONE = 0x40049409
+COPY_BUFFER = int(os.environ.get('FLYINGFAWK_COPY_BUFFER_MB', '8')) * 1024 * 1024
+# Bytes per copy_file_range/sendfile call, so progress and cancellation stay responsive
+KERNEL_CHUNK = 64 * 1024 * 1024
+SMALL_READ = 64 * 1024
+
+# "This fast path doesn't work here", as opposed to a real I/O error
+_UNSUPPORTED = {errno.EXDEV, errno.EOPNOTSUPP, errno.ENOTTY, errno.EINVAL, errno.ENOSYS,
+                errno.EBADF, errno.ETXTBSY, errno.EPERM}
+
+
+class CopyCancelled(Exception):
+    pass
+
+
+def _check(cancelled):
+    if cancelled is not None and cancelled():
+        raise CopyCancelled()
+
+
+def reflink(src_fd, dst_fd):
+    """Clones the whole file; raises OSError when the filesystem can't."""
+    if fcntl is None:
+        raise OSError(errno.EOPNOTSUPP, 'reflink not supported on this platform')
+    fcntl.ioctl(dst_fd, FICLONE, src_fd)
+
+
+def _copy_kernel(copy_call, src_fd, dst_fd, remaining, progress, cancelled):
+    """
+    Runs copy_file_range/sendfile until `remaining` is copied. Returns what's left:
+    `remaining` untouched if the call isn't supported, a partial rest if it stopped early.
+    """
+    first = True
+    while remaining > 0:
+        _check(cancelled)
+        try:
+            copied = copy_call(src_fd, dst_fd, min(remaining, KERNEL_CHUNK))
+        except OSError as e:
+            if first and e.errno in _UNSUPPORTED:
+                return remaining
+            raise
+        if copied == 0:
+            break  # e.g. pseudo files reporting a size they don't have; finish buffered
+        first = False
+        remaining -= copied
+        if progress is not None:
+            progress(copied)
+    return remaining
+
+
+def _write_all(dst_fd, data):
+    view = memoryview(data)
+    while view:
+        view = view[os.write(dst_fd, view):]
+
+
+def _copy_buffered(src_fd, dst_fd, progress, cancelled):
+    # The large buffer is only allocated once a file turns out to need it: most calls
+    # find nothing left after the kernel paths, or copy a small file in one read
+    buffer = None
+    while True:
+        _check(cancelled)
+        if buffer is None:
+            data = os.read(src_fd, SMALL_READ)
+            count = len(data)
+            if count == SMALL_READ:
+                buffer = bytearray(COPY_BUFFER)
+        else:
+            count = os.readv(src_fd, [buffer])
+            data = memoryview(buffer)[:count]
+        if count == 0:
+            return
+        _write_all(dst_fd, data)
+        if progress is not None:
+            progress(count)
+
+
+def copy_data(src_fd, dst_fd, size, progress=None, cancelled=None):
+    """Copies src_fd to dst_fd (both at offset 0); returns the method that did the work."""
+    if size > 0:
+        try:
+            reflink(src_fd, dst_fd)
+            if progress is not None:
+                progress(size)
+            return 'reflink'
+        except OSError as e:
+            if e.errno not in _UNSUPPORTED:
+                raise
+
+    method = 'buffered'
+    remaining = size
+    if hasattr(os, 'copy_file_range') and remaining > 0:
+        left = _copy_kernel(lambda s, d, n: os.copy_file_range(s, d, n), src_fd, dst_fd, remaining, progress, cancelled)
+        if left < remaining:
+            method = 'copy_file_range'
+        remaining = left
+    if hasattr(os, 'sendfile') and remaining > 0 and method == 'buffered':
+        left = _copy_kernel(lambda s, d, n: os.sendfile(d, s, None, n), src_fd, dst_fd, remaining, progress, cancelled)
+        if left < remaining:
+            method = 'sendfile'
+        remaining = left
+    # Whatever the kernel paths didn't cover, including files that grew since the stat
+    _copy_buffered(src_fd, dst_fd, progress, cancelled)
+    return method
+
+
+def copy_file(src, dst, progress=None, cancelled=None, overwrite=False):
+    """
+    Copies file `src` to `dst` with its permission bits and timestamps, like `cp -p`.
+    Symlinks are recreated rather than followed. Without `overwrite` an existing `dst`
+    raises FileExistsError; with it, a `dst` that is `src` itself raises SameFileError. A partial `dst` is removed on failure or cancellation.
+    Returns the copy method used ('reflink', 'copy_file_range', 'sendfile', 'buffered', 'symlink').
+    """
+    if os.path.islink(src):
+        if overwrite and os.path.lexists(dst):
+            os.remove(dst)
+        os.symlink(os.readlink(src), dst)
+        return 'symlink'
+
+    flags = os.O_WRONLY | os.O_CREAT | (os.O_TRUNC if overwrite else os.O_EXCL)
+    with open(src, 'rb') as source:
+        source_stat = os.fstat(source.fileno())
+        size = source_stat.st_size
+        if overwrite:
+            try:
+                same = os.path.samestat(source_stat, os.stat(dst))
+            except FileNotFoundError:
+                same = False
+            if same:
+                # O_TRUNC would empty the source before a byte is copied
+                raise shutil.SameFileError(f"{src} and {dst} are the same file")
+        dst_fd = os.open(dst, flags, 0o600)
+        try:
+            method = copy_data(source.fileno(), dst_fd, size, progress, cancelled)
+        except BaseException:
+            os.close(dst_fd)
+            os.remove(dst)
+            raise
+        os.close(dst_fd)
+    shutil.copystat(src, dst)
+    return method
@@ -0,0 +1,164 @@
+# diskcache.py
+# Size-bounded LRU cache of generated files (video segments, thumbnails, rendered pages).
+#
+# Each cache is a directory under CACHE_DIR. Entries are files named by a hash of their
+# key; the file's mtime doubles as its last-use time, so the LRU order survives a
+# restart (the directory is scanned once on first use). Producers write to a temp file
+# in the same directory which is renamed into place, so readers never see partial
+# output. Concurrent requests for a missing entry share a single producer run.
+
+import os
+import shutil
+import hashlib
+import logging
+from collections import OrderedDict
+
+import eventlet.event
+
+from appdata import CACHE_DIR
+
+logger = logging.getLogger(__name__)
+
+
+class DiskCache:
+    def __init__(self, name, max_bytes, suffix=''):
+        self.name = name
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self.root = CACHE_DIR / name
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+        self._entries = None  # filename -> size, least recently used first
+        self._bytes = 0
+        self._inflight = {}   # filename -> eventlet Event
+
+    def _filename(self, key):
+        return hashlib.sha1(repr(key).encode('utf-8', 'surrogateescape')).hexdigest() + self.suffix
+
+    def _load(self):
+        if self._entries is not None:
+            return
+        found = []
+        for entry in os.scandir(self.root):
+            if entry.name.endswith('.tmp'):
+                # Leftover from an interrupted producer
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    pass
+                continue
+            if not entry.is_file():
+                continue
+            st = entry.stat()
+            found.append((st.st_mtime, entry.name, st.st_size))
+        found.sort()
+        self._entries = OrderedDict((name, size) for _, name, size in found)
+        self._bytes = sum(self._entries.values())
+
+    def get(self, key):
+        """Returns the cached file's path, or None."""
+        self._load()
+        filename = self._filename(key)
+        if filename not in self._entries:
+            return None
+        path = self.root / filename
+        try:
+            os.utime(path)
+        except OSError:
+            # Removed behind our back
+            self._bytes -= self._entries.pop(filename)
+            return None
+        self._entries.move_to_end(filename)
+        return path
+
+    def get_or_create(self, key, produce):
+        """
+        Returns the path of the cached file for `key`, calling produce(tmp_path) to create it
+        on a miss. produce() must write the file or raise; callers waiting on the same key
+        get the same result (None if it failed).
+        """
+        path = self.get(key)
+        if path is not None:
+            self.hits += 1
+            return path
+
+        filename = self._filename(key)
+        waiting = self._inflight.get(filename)
+        if waiting is not None:
+            return waiting.wait()
+
+        self.misses += 1
+        event = eventlet.event.Event()
+        self._inflight[filename] = event
+        path = None
+        tmp = self.root / f"{filename}.{os.getpid()}.{id(event)}.tmp"
+        try:
+            produce(tmp)
+            path = self._commit(filename, tmp)
+            return path
+        except Exception as e:
+            logger.warning(f"diskcache[{self.name}]: producing {key!r} failed: {e}")
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            return None
+        finally:
+            del self._inflight[filename]
+            event.send(path)
+
+    def is_pending(self, key):
+        return self._filename(key) in self._inflight
+
+    def put(self, key, source):
+        """Moves the file `source` into the cache as `key` (same filesystem: a rename)."""
+        filename = self._filename(key)
+        tmp = self.root / f"{filename}.{os.getpid()}.{id(source)}.tmp"
+        # Copy across filesystems first, so the final step is always an atomic rename
+        shutil.move(str(source), tmp)
+        return self._commit(filename, tmp)
+
+    def discard(self, key):
+        """Drops `key` from the cache, if present."""
+        self._load()
+        filename = self._filename(key)
+        if filename in self._entries:
+            self._bytes -= self._entries.pop(filename)
+            try:
+                os.remove(self.root / filename)
+            except OSError:
+                pass
+
+    def _commit(self, filename, tmp):
+        size = os.path.getsize(tmp)
+        path = self.root / filename
+        os.replace(tmp, path)
+
+        self._load()
+        if filename in self._entries:
+            self._bytes -= self._entries.pop(filename)
+        self._entries[filename] = size
+        self._bytes += size
+
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            oldest, oldest_size = self._entries.popitem(last=False)
+            self._bytes -= oldest_size
+            try:
+                os.remove(self.root / oldest)
+            except OSError:
+                pass
+        return path
+
+    def stats(self):
+        self._load()
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / lookups, 3) if lookups else None,
+            'entries': len(self._entries),
+            'bytes': self._bytes,
+            'max_bytes': self.max_bytes,
+            'pending': len(self._inflight),
+        }
@@ -0,0 +1,195 @@
+# docpool.py
+# Pool of long-lived LibreOffice workers for document previews.
+#
+# Each of DOC_WORKERS slots runs docworker.py under a UNO-capable Python; the worker keeps
+# a headless soffice listener (with its own user profile) alive across conversions, so a
+# preview costs a document load instead of a LibreOffice cold start. Conversions wait
+# for a free slot; at most DOC_QUEUE_MAX may wait, further requests are turned away with
+# DocumentPoolBusy rather than piling up. A worker that dies or hangs past DOC_TIMEOUT
+# is killed (with its soffice) and restarted on the next job.
+#
+# Without the UNO bindings the slots fall back to a one-off `libreoffice --convert-to`
+# per conversion, still bounded by the pool and each with the slot's own profile so
+# concurrent conversions don't fight over one.
+
+import os
+import json
+import shutil
+import signal
+import logging
+import subprocess
+from pathlib import Path
+
+import eventlet
+import eventlet.queue
+
+from appdata import CACHE_DIR
+
+logger = logging.getLogger(__name__)
+
+DOC_WORKERS = int(os.environ.get('FLYINGFAWK_DOC_WORKERS', '2'))
+DOC_QUEUE_MAX = int(os.environ.get('FLYINGFAWK_DOC_QUEUE_MAX', '8'))
+DOC_TIMEOUT = int(os.environ.get('FLYINGFAWK_DOC_TIMEOUT', '120'))
+# Python with the uno module (Debian's python3-uno is built for the system python3)
+UNO_PYTHON = os.environ.get('FLYINGFAWK_UNO_PYTHON', '/usr/bin/python3')
+UNO_BASE_PORT = int(os.environ.get('FLYINGFAWK_UNO_BASE_PORT', '2102'))
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'docworker.py')
+PROFILE_ROOT = CACHE_DIR / 'libreoffice-profiles'
+
+
+class DocumentPoolBusy(Exception):
+    pass
+
+
+def _parse_reply(line):
+    """A worker's JSON reply line as a dict; None for anything else (soffice noise on stdout)."""
+    try:
+        reply = json.loads(line)
+    except ValueError:
+        return None
+    return reply if isinstance(reply, dict) else None
+
+
+class DocumentSlot:
+    def __init__(self, index):
+        self.index = index
+        self.port = UNO_BASE_PORT + index
+        self.profile_dir = PROFILE_ROOT / f"worker-{index}"
+        self.process = None
+        self.conversions = 0
+
+    def start(self):
+        self.profile_dir.mkdir(parents=True, exist_ok=True)
+        self.process = subprocess.Popen(
+            [UNO_PYTHON, WORKER_SCRIPT, str(self.port), str(self.profile_dir)],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            # Own process group, so killing the worker takes its soffice along
+            start_new_session=True,
+        )
+        with eventlet.Timeout(DOC_TIMEOUT, False):
+            line = self.process.stdout.readline()
+        if line and (_parse_reply(line) or {}).get('ready'):
+            logger.info(f"docpool: worker {self.index} ready (pid {self.process.pid}, port {self.port})")
+            return True
+        error = b''
+        if self.process.poll() is not None:
+            error = self.process.stderr.read() or b''
+        logger.warning(f"docpool: worker {self.index} failed to start: {error.decode('utf8', 'replace')[-300:].strip()}")
+        self.stop()
+        return False
+
+    def stop(self):
+        if self.process is None:
+            return
+        try:
+            os.killpg(self.process.pid, signal.SIGKILL)
+        except OSError:
+            pass
+        self.process.wait()
+        self.process = None
+
+    def convert_with_worker(self, path, output):
+        request = json.dumps({'path': str(path), 'output': str(output)}) + '\n'
+        line = None
+        try:
+            self.process.stdin.write(request.encode())
+            self.process.stdin.flush()
+            with eventlet.Timeout(DOC_TIMEOUT, False):
+                line = self.process.stdout.readline()
+        except (OSError, ValueError) as e:
+            logger.warning(f"docpool: worker {self.index} pipe failed: {e}")
+
+        if not line:
+            self.stop()
+            raise RuntimeError(f"LibreOffice worker died or timed out converting {path}")
+        reply = _parse_reply(line)
+        if reply is None:
+            self.stop()
+            raise RuntimeError(f"LibreOffice worker sent an unreadable reply converting {path}: {line[:200]!r}")
+        if not reply.get('ok'):
+            raise RuntimeError(f"LibreOffice conversion failed: {reply.get('error')}")
+
+    def convert_with_cli(self, path, output):
+        self.profile_dir.mkdir(parents=True, exist_ok=True)
+        result = subprocess.run([
+            "libreoffice",
+            "--headless",
+            f"-env:UserInstallation={self.profile_dir.resolve().as_uri()}",
+            "--convert-to", "html",
+            "--outdir", str(output.parent),
+            str(path)
+        ], capture_output=True, timeout=DOC_TIMEOUT)
+        if result.returncode != 0:
+            raise RuntimeError(f"LibreOffice conversion failed:\n{result.stderr.decode(errors='ignore')}")
+        produced = output.parent / (Path(path).stem + '.html')
+        if not produced.exists():
+            raise FileNotFoundError("No HTML file generated during preview.")
+        produced.replace(output)
+
+
+class DocumentPool:
+    def __init__(self, size=DOC_WORKERS, queue_max=DOC_QUEUE_MAX):
+        self.size = size
+        self.queue_max = queue_max
+        # LIFO: reuse the warmest worker, others only start under concurrent load
+        self._free = eventlet.queue.LifoQueue()
+        for index in range(size):
+            self._free.put(DocumentSlot(index))
+        self._waiting = 0
+        self._use_workers = shutil.which(UNO_PYTHON) is not None and os.path.exists(WORKER_SCRIPT)
+        self.conversions = 0
+        self.failures = 0
+        self.rejected = 0
+
+    def convert(self, path, output: Path):
+        """
+        Converts `path` to HTML at `output`; images the export produces are written next to it.
+        Raises DocumentPoolBusy when too many conversions are queued already.
+        """
+        if self.is_full():
+            self.rejected += 1
+            raise DocumentPoolBusy(f"{self._waiting} document conversions already waiting")
+
+        self._waiting += 1
+        try:
+            slot = self._free.get()
+        finally:
+            self._waiting -= 1
+
+        try:
+            if self._use_workers and slot.process is None and not slot.start():
+                # No usable UNO python: one-off conversions from here on
+                logger.warning("docpool: falling back to one-off libreoffice conversions")
+                self._use_workers = False
+
+            if self._use_workers:
+                slot.convert_with_worker(path, output)
+            else:
+                slot.convert_with_cli(path, output)
+            slot.conversions += 1
+            self.conversions += 1
+        except Exception:
+            self.failures += 1
+            raise
+        finally:
+            self._free.put(slot)
+
+    def is_full(self):
+        """True when a new conversion would be turned away."""
+        return self._free.empty() and self._waiting >= self.queue_max
+
+    def stats(self):
+        return {
+            'workers': self.size,
+            'mode': 'uno' if self._use_workers else 'cli',
+            'free': self._free.qsize(),
+            'waiting': self._waiting,
+            'queue_max': self.queue_max,
+            'conversions': self.conversions,
+            'failures': self.failures,
+            'rejected': self.rejected,
+        }
+
+
+doc_pool = DocumentPool()
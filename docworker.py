@@ -0,0 +1,108 @@
+# docworker.py
+# One document conversion worker, started by docpool.py.
+#
+# Runs under a Python that has the LibreOffice UNO bindings (python3-uno, i.e. the
+# system python3 rather than the app's), so it only imports the standard library and
+# uno. It starts its own headless soffice listener with a private user profile, then
+# converts documents to HTML over UNO for as long as it lives: one JSON line in
+# ({path, output}), one JSON line back ({ok, error}). The soffice start-up cost is
+# paid once per worker instead of once per preview.
+#
+# usage: python3 docworker.py <uno port> <profile dir>
+
+import os
+import sys
+import json
+import time
+import subprocess
+
+import uno
+from com.sun.star.beans import PropertyValue
+from com.sun.star.connection import NoConnectException
+
+CONNECT_TIMEOUT_SECONDS = 60
+
+# HTML export filter per document type
+EXPORT_FILTERS = [
+    ('com.sun.star.text.WebDocument', 'HTML'),
+    ('com.sun.star.text.TextDocument', 'HTML (StarWriter)'),
+    ('com.sun.star.sheet.SpreadsheetDocument', 'HTML (StarCalc)'),
+    ('com.sun.star.presentation.PresentationDocument', 'impress_html_Export'),
+    ('com.sun.star.drawing.DrawingDocument', 'draw_html_Export'),
+]
+
+
+def _prop(name, value):
+    prop = PropertyValue()
+    prop.Name = name
+    prop.Value = value
+    return prop
+
+
+def start_office(port, profile_dir):
+    return subprocess.Popen([
+        'soffice', '--headless', '--invisible', '--nologo', '--norestore', '--nodefault',
+        '--nolockcheck',
+        f"-env:UserInstallation={uno.systemPathToFileUrl(os.path.abspath(profile_dir))}",
+        f"--accept=socket,host=127.0.0.1,port={port};urp;StarOffice.ComponentContext",
+    ], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def connect(port, office):
+    local = uno.getComponentContext()
+    resolver = local.ServiceManager.createInstanceWithContext('com.sun.star.bridge.UnoUrlResolver', local)
+    deadline = time.monotonic() + CONNECT_TIMEOUT_SECONDS
+    while True:
+        try:
+            ctx = resolver.resolve(f"uno:socket,host=127.0.0.1,port={port};urp;StarOffice.ComponentContext")
+            return ctx.ServiceManager.createInstanceWithContext('com.sun.star.frame.Desktop', ctx)
+        except NoConnectException:
+            if office.poll() is not None or time.monotonic() > deadline:
+                raise RuntimeError(f"soffice did not start listening on port {port}")
+            time.sleep(0.25)
+
+
+def convert(desktop, path, output):
+    document = desktop.loadComponentFromURL(
+        uno.systemPathToFileUrl(os.path.abspath(path)), '_blank', 0,
+        (_prop('Hidden', True), _prop('ReadOnly', True), _prop('UpdateDocMode', 0)),
+    )
+    if document is None:
+        raise RuntimeError(f"LibreOffice could not open {path}")
+    try:
+        filter_name = next((name for service, name in EXPORT_FILTERS if document.supportsService(service)), None)
+        if filter_name is None:
+            raise RuntimeError(f"No HTML export for {path}")
+        # Images are written next to `output`
+        document.storeToURL(uno.systemPathToFileUrl(os.path.abspath(output)), (_prop('FilterName', filter_name),))
+    finally:
+        document.close(True)
+
+
+def main():
+    port, profile_dir = int(sys.argv[1]), sys.argv[2]
+    office = start_office(port, profile_dir)
+    try:
+        desktop = connect(port, office)
+        sys.stdout.write(json.dumps({'ready': True}) + '\n')
+        sys.stdout.flush()
+
+        for line in sys.stdin:
+            job = json.loads(line)
+            try:
+                convert(desktop, job['path'], job['output'])
+                reply = {'ok': True}
+            except Exception as e:
+                reply = {'ok': False, 'error': f"{type(e).__name__}: {e}"}
+            sys.stdout.write(json.dumps(reply) + '\n')
+            sys.stdout.flush()
+    finally:
+        office.terminate()
+        try:
+            office.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            office.kill()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,16 @@
 # fileoperations.py
 # This file defines a Flask Blueprint for handling file rename operations.
+# /api/delete moves to the trash (trash.py); /api/batch runs many operations in one
+# request (batchops.py).
 
 import os
 from flask import Blueprint, request, jsonify
 import logging
 
+from transfers import transfer_manager
+from batchops import parse_operations, run_batch, BatchError
+from trash import trash_item
+
 logger = logging.getLogger(__name__)
 
 fileoperations_bp = Blueprint('fileoperations_bp', __name__, url_prefix='/api')
@@ -39,6 +45,40 @@ def rename_file():
         return jsonify({"error": str(e)}), 500
 
 
+@fileoperations_bp.route('/delete', methods=['POST'])
+def delete_file():
+    """
+    Delete a file or directory: it is moved to the trash at once and unlinked in the
+    background later (trash.py), so this returns immediately whatever its size.
+    Expected JSON: { "path": "/hostroot/path/to/item" }
+    """
+    data = request.get_json()
+    if not data or 'path' not in data:
+        logger.warning("Delete request: Missing 'path' field.")
+        return jsonify({"error": "Missing 'path' in request."}), 400
+
+    path = data['path']
+
+    if not isinstance(path, str) or not path.strip():
+        return jsonify({"error": "'path' must be a non-empty string."}), 400
+
+    hostroot = os.path.abspath(os.environ.get('GUI_ROOT', '/hostroot'))
+    path = os.path.normpath(path)
+    if not path.startswith(hostroot + os.sep):
+        return jsonify({"error": f"Invalid path: {path}"}), 403
+
+    if not os.path.lexists(path):
+        return jsonify({"error": f"Path does not exist: {path}"}), 404
+
+    try:
+        entry = trash_item(path)
+        logger.info(f"Moved {path} to the trash as {entry['id']}")
+        return jsonify({"status": "success", "path": path, "trash": entry['id']}), 200
+    except Exception as e:
+        logger.error(f"Delete failed for {path}: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
 @fileoperations_bp.route('/newdir', methods=['POST'])
 def create_new_directory():
     """
@@ -124,17 +164,41 @@ def duplicate_file():
     if not os.path.exists(source_path):
         return jsonify({"error": f"Source path does not exist: {source_path}"}), 404
 
+    if os.path.lexists(destination_path):
+        return jsonify({"error": f"Destination already exists: {destination_path}"}), 409
+
+    if not os.path.isdir(os.path.dirname(os.path.abspath(destination_path))):
+        return jsonify({"error": f"Destination directory does not exist: {destination_path}"}), 400
+
+    real_source = os.path.realpath(source_path)
+    if os.path.isdir(source_path) and os.path.realpath(destination_path).startswith(real_source + os.sep):
+        return jsonify({"error": "Cannot duplicate a directory into itself."}), 400
+
+    # Copied in the background (parallel, reflink where possible); progress over the
+    # transfer events, status at /api/transfers/<id>
+    job = transfer_manager.submit('duplicate', [os.path.abspath(source_path)], os.path.abspath(destination_path))
+    logger.info(f"Duplicating {source_path} to {destination_path} as transfer {job.id}")
+    return jsonify({"status": "started", "source": source_path, "destination": destination_path,
+                    "job": job.describe()}), 202
+
+
+@fileoperations_bp.route('/batch', methods=['POST'])
+def batch_operations():
+    """
+    Run several operations in one request.
+    Expected JSON: { "operations": [ { "op": "rename" | "move" | "delete" | "mkdir" | "newfile", ... } ],
+                     "atomic": false }
+    See batchops.parse_operations for the fields of each op. Results are per operation,
+    in request order; with "atomic" any failure undoes the whole batch.
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "Expected a JSON object."}), 400
+
     try:
-        if os.path.isdir(source_path):
-            import shutil
-            shutil.copytree(source_path, destination_path)
-        else:
-            import shutil
-            shutil.copy2(source_path, destination_path)
-
-        logger.info(f"Duplicated {source_path} to {destination_path}")
-        return jsonify({"status": "success", "source": source_path, "destination": destination_path}), 200
+        operations = parse_operations(data.get('operations'))
+    except BatchError as e:
+        logger.warning(f"Batch request rejected: {e}")
+        return jsonify({"error": str(e)}), 400
 
-    except Exception as e:
-        logger.error(f"Duplicate failed from {source_path} to {destination_path}: {e}")
-        return jsonify({"error": str(e)}), 500
+    return jsonify(run_batch(operations, atomic=bool(data.get('atomic')))), 200
@@ -0,0 +1,169 @@
+# fileserve.py
+# Serves files from disk for downloads (/down) and direct playback/viewing (/raw).
+#
+# - Full conditional and partial GET: ETag / Last-Modified, If-None-Match,
+#   If-Modified-Since, Range (single range) and If-Range. Media elements can seek
+#   straight into the file without ffmpeg.
+# - Under eventlet's WSGI server the body is written with os.sendfile on the client
+#   socket, so multi-GB downloads don't pass through Python at all. Elsewhere it falls
+#   back to reading FILE_CHUNK blocks.
+# - With FLYINGFAWK_ACCEL_REDIRECT_PREFIX set, only the headers are produced and nginx
+#   is told to send the file itself via X-Accel-Redirect: <prefix><absolute path>.
+#   The prefix must be an `internal` location aliased to the filesystem root, e.g.
+#   `location /_files/ { internal; alias /; }` with the prefix '/_files'.
+
+import os
+import errno
+import logging
+import mimetypes
+from urllib.parse import quote
+
+from flask import Response, request
+from werkzeug.http import http_date, quote_etag
+
+from eventlet.hubs import trampoline
+
+logger = logging.getLogger(__name__)
+
+ACCEL_REDIRECT_PREFIX = os.environ.get('FLYINGFAWK_ACCEL_REDIRECT_PREFIX', '').rstrip('/')
+SENDFILE_ENABLED = hasattr(os, 'sendfile') and os.environ.get('FLYINGFAWK_SENDFILE', '1') == '1'
+FILE_CHUNK = 256 * 1024
+# Read through Python for the first block so the WSGI server has sent the headers
+# before the socket is written to directly
+HEAD_CHUNK = 16 * 1024
+
+
+class FileBody:
+    """WSGI body for bytes [start, start + length) of a file."""
+
+    def __init__(self, path, start, length, environ):
+        self.path = path
+        self.start = start
+        self.length = length
+        self.sock = None
+        if SENDFILE_ENABLED:
+            # eventlet.wsgi keeps the client socket on its input wrapper
+            self.sock = getattr(environ.get('eventlet.input'), '_sock', None)
+        self.sent_with_sendfile = 0
+
+    def __iter__(self):
+        with open(self.path, 'rb') as f:
+            f.seek(self.start)
+            remaining = self.length
+
+            first = f.read(min(HEAD_CHUNK, remaining))
+            if not first:
+                return
+            remaining -= len(first)
+            yield first
+
+            if self.sock is not None and remaining > 0:
+                remaining = self._sendfile(f.fileno(), self.start + len(first), remaining)
+
+            while remaining > 0:
+                chunk = f.read(min(FILE_CHUNK, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
+    def _sendfile(self, fd, offset, remaining):
+        """Sends from `fd` straight to the client socket; returns what's left for the fallback."""
+        sock_fd = self.sock.fileno()
+        while remaining > 0:
+            try:
+                sent = os.sendfile(sock_fd, fd, offset, min(remaining, 64 * 1024 * 1024))
+            except BlockingIOError:
+                # Client socket is full: park this green thread until it drains
+                trampoline(sock_fd, write=True)
+                continue
+            except OSError as e:
+                if e.errno in (errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP) and self.sent_with_sendfile == 0:
+                    # Not supported for this file/socket pair: fall back to reading
+                    logger.debug(f"fileserve: sendfile unavailable for {self.path}: {e}")
+                    os.lseek(fd, offset, os.SEEK_SET)
+                    return remaining
+                raise
+            if sent == 0:
+                break  # file shrank under us
+            offset += sent
+            remaining -= sent
+            self.sent_with_sendfile += sent
+        return remaining
+
+
+def file_etag(stat):
+    return f"{stat.st_size:x}-{stat.st_mtime_ns:x}"
+
+
+def _not_modified(stat, etag):
+    if request.if_none_match:
+        return etag in request.if_none_match
+    since = request.if_modified_since
+    return since is not None and int(stat.st_mtime) <= since.timestamp()
+
+
+def _range_applies(stat, etag):
+    """If-Range: the Range only counts while the client's copy is still current."""
+    if_range = request.if_range
+    if not if_range or (if_range.etag is None and if_range.date is None):
+        return True
+    if if_range.etag is not None:
+        return if_range.etag == etag
+    return int(stat.st_mtime) <= if_range.date.timestamp()
+
+
+def content_disposition(filename, as_attachment):
+    kind = 'attachment' if as_attachment else 'inline'
+    try:
+        filename.encode('ascii')
+        return f'{kind}; filename="{filename}"'
+    except UnicodeEncodeError:
+        return f"{kind}; filename*=UTF-8''{quote(filename)}"
+
+
+def serve_file(path, as_attachment=False, mimetype=None, download_name=None, max_age=0):
+    """Returns a Response serving `path` with Range/conditional support."""
+    stat = os.stat(path)
+    etag = file_etag(stat)
+    mimetype = mimetype or mimetypes.guess_type(path)[0] or 'application/octet-stream'
+
+    headers = {
+        'ETag': quote_etag(etag),
+        'Last-Modified': http_date(stat.st_mtime),
+        'Accept-Ranges': 'bytes',
+        'Cache-Control': f'private, max-age={max_age}' if max_age else 'no-cache',
+        'Content-Disposition': content_disposition(download_name or os.path.basename(path), as_attachment),
+    }
+
+    if _not_modified(stat, etag):
+        return Response(status=304, headers=headers)
+
+    size = stat.st_size
+    start, length, status = 0, size, 200
+    byte_range = request.range
+    # Multipart ranges aren't served; a full response is a valid answer to those
+    if byte_range is not None and len(byte_range.ranges) == 1 and _range_applies(stat, etag):
+        bounds = byte_range.range_for_length(size)
+        if bounds is None:
+            headers['Content-Range'] = f"bytes */{size}"
+            return Response(status=416, headers=headers)
+        start, stop = bounds
+        length = stop - start
+        status = 206
+        headers['Content-Range'] = f"bytes {start}-{stop - 1}/{size}"
+
+    headers['Content-Length'] = str(length)
+
+    if ACCEL_REDIRECT_PREFIX:
+        # nginx re-applies Range itself against the original request headers
+        headers.pop('Content-Length')
+        headers.pop('Content-Range', None)
+        headers['X-Accel-Redirect'] = ACCEL_REDIRECT_PREFIX + quote(os.path.abspath(path))
+        return Response(status=200, headers=headers, mimetype=mimetype)
+
+    if request.method == 'HEAD':
+        return Response(status=status, headers=headers, mimetype=mimetype)
+
+    body = FileBody(path, start, length, request.environ)
+    return Response(body, status=status, headers=headers, mimetype=mimetype, direct_passthrough=True)
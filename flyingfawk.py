@@ -12,6 +12,9 @@ from flask_socketio import SocketIO
 from api import api_bp
 #from werkzeug._reloader import run_with_reloader
 import terminalapi
+import fsevents
+from sizeindex import size_index
+from searchindex import search_index
 from userscripts import userscripts_bp
 from videoapi import video_bp
 from preview_docs import preview_docs_bp
@@ -21,6 +24,10 @@ from preview_img import preview_img_bp
 from preview_video import video_preview
 from fileoperations import fileoperations_bp
 from updownapi import updown_bp
+from tusupload import tus_bp
+from transcode import transcode_bp
+from transfers import transfers_bp, init_transfers
+from trash import trash_bp, trash_reaper
 from werkzeug.middleware.proxy_fix import ProxyFix
 from flask import g
 
@@ -97,6 +104,11 @@ logging.debug("SocketIO initialized with reduced logging.")
 # logging.debug("Terminal API Handlers explicitly registered.")
 
 terminalapi.init_terminal_handlers(socketio)
+fsevents.init_fsevents_handlers(socketio)
+init_transfers(socketio)
+size_index.start_reconciler()
+search_index.start_indexer()
+trash_reaper.start()
 
 # --- Flask Route (Serves the Static HTML Structure) ---
 # This route remains in the main app.
@@ -129,6 +141,10 @@ app.register_blueprint(preview_img_bp)
 app.register_blueprint(video_preview)
 app.register_blueprint(fileoperations_bp)
 app.register_blueprint(updown_bp)
+app.register_blueprint(tus_bp)
+app.register_blueprint(transcode_bp)
+app.register_blueprint(transfers_bp)
+app.register_blueprint(trash_bp)
 
 # Add after_request handler to log session state
 @app.after_request
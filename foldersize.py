@@ -0,0 +1,185 @@
+# foldersize.py
+# Recursive folder sizes for /api/preview/foldersize.
+#
+# Every directory is read with a single os.scandir pass (one lstat per entry) and its
+# subdirectories are fanned out over a GreenPool whose members run the blocking disk
+# work in eventlet's native thread pool (tpool), a batch of directories per hop, so
+# several subtrees are read in parallel without stalling the hub. Per-directory subtotals are cached by
+# (st_dev, st_ino) and reused while the directory's mtime is unchanged, so selecting
+# the same tree again costs one stat per directory instead of a full walk.
+#
+# Note: growing a file in place does not touch its directory's mtime, so cached
+# subtotals are also expired after FOLDERSIZE_CACHE_TTL seconds.
+
+import os
+import time
+import logging
+import stat as stat_module
+from collections import OrderedDict
+
+import eventlet
+from eventlet import tpool
+from eventlet.queue import LightQueue
+
+logger = logging.getLogger(__name__)
+
+FOLDERSIZE_WORKERS = int(os.environ.get('FLYINGFAWK_FOLDERSIZE_WORKERS', '16'))
+FOLDERSIZE_CACHE_ENTRIES = int(os.environ.get('FLYINGFAWK_FOLDERSIZE_CACHE_ENTRIES', '200000'))
+FOLDERSIZE_CACHE_TTL = float(os.environ.get('FLYINGFAWK_FOLDERSIZE_CACHE_TTL', '300'))
+# Minimum time between two partial results in a stream
+PROGRESS_INTERVAL = 0.2
+# Directories read per hop to the thread pool before the rest is handed back for fan-out
+BATCH_DIRECTORIES = 64
+
+
+def _read_directory(path, cache):
+    """
+    Returns (key, entry, from_cache) where entry is
+    (mtime_ns, scanned_at, own_bytes, own_files, subdir_names).
+    """
+    st = os.stat(path)
+    key = (st.st_dev, st.st_ino)
+    cached = cache.get(key)
+    if cached is not None and cached[0] == st.st_mtime_ns \
+            and time.monotonic() - cached[1] < FOLDERSIZE_CACHE_TTL:
+        return key, cached, True
+
+    own_bytes = 0
+    own_files = 0
+    subdirs = []
+    with os.scandir(path) as it:
+        for entry in it:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.name)
+                    continue
+                entry_stat = entry.stat(follow_symlinks=False)
+            except OSError:
+                continue
+            if stat_module.S_ISREG(entry_stat.st_mode):
+                own_bytes += entry_stat.st_size
+                own_files += 1
+
+    return key, (st.st_mtime_ns, time.monotonic(), own_bytes, own_files, subdirs), False
+
+
+def _read_batch(root, cache, budget=BATCH_DIRECTORIES):
+    """
+    Runs in a tpool thread: reads `root` and then keeps going depth-first until `budget`
+    directories are read, so one hop to the thread pool covers a whole run of small
+    directories. Returns (results, unvisited) where results are (path, result, error)
+    and unvisited are the subdirectories left for other workers.
+    `cache` is only read here (a plain dict lookup); it's updated on the hub.
+    """
+    results = []
+    stack = [root]
+    while stack and len(results) < budget:
+        path = stack.pop()
+        try:
+            result = _read_directory(path, cache)
+        except OSError as e:
+            results.append((path, None, e))
+            continue
+        results.append((path, result, None))
+        stack.extend(os.path.join(path, name) for name in result[1][4])
+    return results, stack
+
+
+class FolderSizeEngine:
+    """
+    Walks directory trees in parallel and caches per-directory subtotals.
+    The cache is only modified from greenthreads on the hub, so it needs no lock.
+    """
+
+    def __init__(self, workers=FOLDERSIZE_WORKERS, max_entries=FOLDERSIZE_CACHE_ENTRIES):
+        self.workers = workers
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()  # (st_dev, st_ino) -> (mtime_ns, scanned_at, own_bytes, own_files, subdirs)
+
+    def iter_sizes(self, root, collect=None):
+        """
+        Yields running totals {'total_size_bytes', 'files', 'dirs', 'errors', 'done'} for the tree
+        at `root`; the last one has done=True. Closing the generator cancels the walk.
+        If `collect` is a dict, every directory read is added to it as
+        path -> (mtime_ns, own_bytes, own_files, subdir_names).
+        """
+        pool = eventlet.GreenPool(self.workers)
+        results = LightQueue()
+        state = {'cancelled': False}
+
+        def worker(path):
+            if state['cancelled']:
+                results.put(([], []))
+                return
+            results.put(tpool.execute(_read_batch, path, self._cache))
+
+        totals = {'total_size_bytes': 0, 'files': 0, 'dirs': 0, 'errors': 0, 'done': False}
+        pending = 1
+        last_progress = time.monotonic()
+        pool.spawn_n(worker, root)
+
+        try:
+            while pending:
+                batch, unvisited = results.get()
+                pending -= 1
+
+                for path, result, error in batch:
+                    if result is None:
+                        totals['errors'] += 1
+                        logger.debug(f"foldersize: skipped {path}: {error}")
+                        continue
+                    key, entry, from_cache = result
+                    self._remember(key, entry, from_cache)
+                    if collect is not None:
+                        collect[path] = (entry[0], entry[2], entry[3], entry[4])
+                    totals['total_size_bytes'] += entry[2]
+                    totals['files'] += entry[3]
+                    totals['dirs'] += 1
+
+                for path in unvisited:
+                    pending += 1
+                    pool.spawn_n(worker, path)
+
+                now = time.monotonic()
+                if pending and now - last_progress >= PROGRESS_INTERVAL:
+                    last_progress = now
+                    yield dict(totals)
+        finally:
+            # Reached on completion and on GeneratorExit (client went away / selection moved):
+            # queued workers return without touching the disk and the pool drains by itself.
+            state['cancelled'] = True
+
+        totals['done'] = True
+        yield totals
+
+    def total_size(self, root):
+        for totals in self.iter_sizes(root):
+            pass
+        return totals
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / lookups, 3) if lookups else None,
+            'entries': len(self._cache),
+            'max_entries': self.max_entries,
+        }
+
+    def _remember(self, key, entry, from_cache):
+        if from_cache:
+            self.hits += 1
+            if key in self._cache:
+                self._cache.move_to_end(key)
+            return
+        self.misses += 1
+        self._cache[key] = entry
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+
+
+folder_sizes = FolderSizeEngine()
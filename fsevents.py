@@ -0,0 +1,213 @@
+# fsevents.py
+# Pushes directory change events to the browser over Socket.IO.
+#
+# Clients connect to the '/fs' namespace (kept apart from the terminal's default
+# namespace, whose connect handler spawns a tmux exec) and 'subscribe' to the UI
+# paths their panes show. Each subscribed directory is watched through fswatch;
+# events are coalesced for a short moment, only the touched names are re-stat'ed,
+# and an incremental 'dir_changed' {path, added, removed, modified} is emitted to
+# everyone subscribed to that path.
+
+import os
+import stat as stat_module
+import logging
+import threading
+
+from fswatch import watcher
+import api
+
+logger = logging.getLogger(__name__)
+
+FS_NAMESPACE = '/fs'
+DEBOUNCE_SECONDS = 0.25
+# More touched names than this in one batch and the directory is simply re-scanned.
+FULL_RESCAN_THRESHOLD = 1000
+
+
+def _resolve_ui_path(ui_path):
+    """Maps a pane path ('/home/user') to (normalized ui path, absolute path) or None if outside GUI_ROOT."""
+    clean_subpath = (ui_path or '').strip('/')
+    abs_root = os.path.abspath(api.GUI_ROOT)
+    abs_path = os.path.abspath(os.path.join(abs_root, clean_subpath))
+    if abs_path != abs_root and not abs_path.startswith(abs_root + os.sep):
+        return None
+    rel = os.path.relpath(abs_path, abs_root).replace('\\', '/')
+    return ('/' if rel == '.' else '/' + rel), abs_path
+
+
+class DirectorySubscriptions:
+    def __init__(self, socketio):
+        self.socketio = socketio
+        self._lock = threading.Lock()
+        self._subscribers = {}   # abs_path -> set of sids
+        self._ui_paths = {}      # abs_path -> ui path (room name)
+        self._states = {}        # abs_path -> {name: item}
+        self._pending = {}       # abs_path -> set of touched names, or None for a full rescan
+        self._by_sid = {}        # sid -> set of abs paths
+
+    def subscribe(self, sid, ui_path):
+        resolved = _resolve_ui_path(ui_path)
+        if resolved is None:
+            return None
+        ui_path, abs_path = resolved
+        if not os.path.isdir(abs_path):
+            return None
+
+        with self._lock:
+            self._by_sid.setdefault(sid, set()).add(abs_path)
+            subscribers = self._subscribers.setdefault(abs_path, set())
+            first = not subscribers
+            subscribers.add(sid)
+            self._ui_paths[abs_path] = ui_path
+
+        if first:
+            if not watcher.watch(abs_path, self._on_event):
+                self._release(sid, abs_path)
+                return None
+            state = self._scan_state(ui_path, abs_path)
+            with self._lock:
+                if abs_path in self._subscribers:
+                    self._states[abs_path] = state
+        return ui_path
+
+    def unsubscribe(self, sid, ui_path):
+        resolved = _resolve_ui_path(ui_path)
+        if resolved is None:
+            return
+        self._release(sid, resolved[1])
+
+    def disconnect(self, sid):
+        with self._lock:
+            paths = self._by_sid.pop(sid, set())
+        for abs_path in paths:
+            self._release(sid, abs_path)
+
+    def _release(self, sid, abs_path):
+        with self._lock:
+            self._by_sid.get(sid, set()).discard(abs_path)
+            subscribers = self._subscribers.get(abs_path)
+            if subscribers is None:
+                return
+            subscribers.discard(sid)
+            if subscribers:
+                return
+            del self._subscribers[abs_path]
+            self._ui_paths.pop(abs_path, None)
+            self._states.pop(abs_path, None)
+            self._pending.pop(abs_path, None)
+        watcher.unwatch(abs_path, self._on_event)
+
+    def _scan_state(self, ui_path, abs_path):
+        clean_subpath = ui_path.strip('/')
+        try:
+            items = api._scan_directory(abs_path, clean_subpath, True, 'name', False)
+        except OSError as e:
+            logger.warning(f"fsevents: could not scan {abs_path}: {e}")
+            return {}
+        return {item['name']: item for item in items}
+
+    def _on_event(self, directory, event):
+        with self._lock:
+            if directory not in self._subscribers:
+                return
+            first = directory not in self._pending
+            names = self._pending.get(directory, set())
+
+            if names is not None:
+                for path in (event.src_path, getattr(event, 'dest_path', None)):
+                    if not path:
+                        continue
+                    path = os.fsdecode(path)
+                    if os.path.dirname(path) == directory:
+                        names.add(os.path.basename(path))
+                if len(names) > FULL_RESCAN_THRESHOLD:
+                    names = None
+            self._pending[directory] = names
+
+        if first:
+            self.socketio.start_background_task(self._flush_later, directory)
+
+    def _flush_later(self, abs_path):
+        self.socketio.sleep(DEBOUNCE_SECONDS)
+
+        with self._lock:
+            if abs_path not in self._pending:
+                return
+            names = self._pending.pop(abs_path)
+            ui_path = self._ui_paths.get(abs_path)
+            old_state = self._states.get(abs_path, {})
+
+        if ui_path is None:
+            return
+
+        if not os.path.isdir(abs_path):
+            self.socketio.emit('dir_removed', {'path': ui_path}, to=ui_path, namespace=FS_NAMESPACE)
+            return
+
+        if names is None:
+            new_state = self._scan_state(ui_path, abs_path)
+            names = set(old_state) | set(new_state)
+        else:
+            new_state = dict(old_state)
+            clean_subpath = ui_path.strip('/')
+            for name in names:
+                try:
+                    entry_path = os.path.join(abs_path, name)
+                    stat = os.stat(entry_path)
+                    rel_path = os.path.join(clean_subpath, name).replace('\\', '/')
+                    new_state[name] = api._build_item(name, '/' + rel_path, stat_module.S_ISDIR(stat.st_mode), stat)
+                except OSError:
+                    new_state.pop(name, None)
+
+        added, removed, modified = [], [], []
+        for name in names:
+            old, new = old_state.get(name), new_state.get(name)
+            if old is None and new is not None:
+                added.append(api._format_item(new))
+            elif old is not None and new is None:
+                removed.append(old['subpath'])
+            elif old is not None and (old['is_directory'], old['size'], old['last_modified']) != \
+                    (new['is_directory'], new['size'], new['last_modified']):
+                modified.append(api._format_item(new))
+
+        with self._lock:
+            if abs_path in self._states:
+                self._states[abs_path] = new_state
+
+        if added or removed or modified:
+            self.socketio.emit('dir_changed', {
+                'path': ui_path,
+                'added': api._apply_indexed_sizes(abs_path, added),
+                'removed': removed,
+                'modified': api._apply_indexed_sizes(abs_path, modified),
+            }, to=ui_path, namespace=FS_NAMESPACE)
+
+
+def init_fsevents_handlers(socketio):
+    from flask import request
+    from flask_socketio import join_room, leave_room
+
+    subscriptions = DirectorySubscriptions(socketio)
+
+    @socketio.on('subscribe', namespace=FS_NAMESPACE)
+    def handle_subscribe(data):
+        ui_path = subscriptions.subscribe(request.sid, (data or {}).get('path'))
+        if ui_path is None:
+            return {'ok': False}
+        join_room(ui_path)
+        return {'ok': True, 'path': ui_path}
+
+    @socketio.on('unsubscribe', namespace=FS_NAMESPACE)
+    def handle_unsubscribe(data):
+        resolved = _resolve_ui_path((data or {}).get('path'))
+        if resolved is None:
+            return
+        leave_room(resolved[0])
+        subscriptions.unsubscribe(request.sid, resolved[0])
+
+    @socketio.on('disconnect', namespace=FS_NAMESPACE)
+    def handle_disconnect(*args):
+        subscriptions.disconnect(request.sid)
+
+    logger.info("fsevents: handlers registered.")
+    return subscriptions
@@ -0,0 +1,120 @@
+# fswatch.py
+# Shared watchdog observer for the app.
+# Modules register callbacks for individual directories (non-recursive inotify watches);
+# every filesystem event is dispatched to the callbacks of the directories it touches,
+# and to listeners that want all of them (the search index).
+#
+# watchdog waits on select() before reading the inotify fd, so under eventlet's
+# monkey patching the observer threads cooperate with the hub instead of blocking it.
+
+import os
+import logging
+import threading
+
+from watchdog.observers import Observer
+from watchdog.events import FileSystemEventHandler
+
+logger = logging.getLogger(__name__)
+
+# Events that don't change what a listing looks like (reads of files in the directory).
+IGNORED_EVENT_TYPES = {'opened', 'closed_no_write'}
+
+
+class DirectoryWatcher(FileSystemEventHandler):
+    """
+    Reference-counted, non-recursive directory watches on one shared Observer.
+    Callbacks are called as callback(directory, event) from the observer thread.
+    """
+
+    def __init__(self):
+        self._observer = None
+        self._lock = threading.Lock()
+        self._watches = {}    # abs dir -> ObservedWatch
+        self._callbacks = {}  # abs dir -> list of callbacks
+        self._listeners = []  # called for every event, whichever directory it touches
+
+    def _ensure_started(self):
+        if self._observer is None:
+            self._observer = Observer()
+            self._observer.daemon = True
+            self._observer.start()
+            logger.debug("fswatch: observer started.")
+
+    def watch(self, path, callback):
+        """
+        Starts delivering events for `path` to `callback`.
+        Returns False if the watch could not be added (e.g. inotify watch limit reached).
+        """
+        path = os.path.abspath(path)
+        with self._lock:
+            callbacks = self._callbacks.get(path)
+            if callbacks is not None:
+                if callback not in callbacks:
+                    callbacks.append(callback)
+                return True
+
+            try:
+                self._ensure_started()
+                self._watches[path] = self._observer.schedule(self, path, recursive=False)
+            except Exception as e:
+                logger.warning(f"fswatch: could not watch {path}: {e}")
+                return False
+
+            self._callbacks[path] = [callback]
+            return True
+
+    def unwatch(self, path, callback):
+        path = os.path.abspath(path)
+        with self._lock:
+            callbacks = self._callbacks.get(path)
+            if not callbacks or callback not in callbacks:
+                return
+            callbacks.remove(callback)
+            if callbacks:
+                return
+
+            del self._callbacks[path]
+            watch = self._watches.pop(path, None)
+            if watch is not None:
+                try:
+                    self._observer.unschedule(watch)
+                except Exception as e:
+                    # The directory may already be gone, which drops the inotify watch by itself
+                    logger.debug(f"fswatch: unschedule failed for {path}: {e}")
+
+    def is_watched(self, path):
+        return os.path.abspath(path) in self._callbacks
+
+    def add_listener(self, callback):
+        """Calls callback(directories, event) for every event on any watched directory."""
+        with self._lock:
+            if callback not in self._listeners:
+                self._listeners.append(callback)
+
+    def on_any_event(self, event):
+        if event.event_type in IGNORED_EVENT_TYPES:
+            return
+
+        src_path = os.fsdecode(event.src_path)
+        affected = {os.path.dirname(src_path)}
+        if event.is_directory:
+            affected.add(src_path)
+        dest_path = getattr(event, 'dest_path', None)
+        if dest_path:
+            affected.add(os.path.dirname(os.fsdecode(dest_path)))
+
+        for directory in affected:
+            for callback in list(self._callbacks.get(directory, ())):
+                try:
+                    callback(directory, event)
+                except Exception as e:
+                    logger.error(f"fswatch: callback for {directory} failed: {e}")
+
+        for listener in list(self._listeners):
+            try:
+                listener(affected, event)
+            except Exception as e:
+                logger.error(f"fswatch: listener failed: {e}")
+
+
+watcher = DirectoryWatcher()
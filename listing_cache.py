@@ -0,0 +1,150 @@
+# listing_cache.py
+# In-process LRU cache of sorted directory listings, invalidated by inotify (fswatch).
+#
+# Keys are (abs_path, sort_key, reverse, show_dotfiles). Every cached directory holds a
+# watch; any event in it drops all of its cached variants. If a watch can't be added
+# (e.g. the inotify limit is reached) entries for that directory fall back to being
+# validated against the directory mtime on each hit.
+#
+# Every scan that gets cached is given a new snapshot id, which clients page against:
+# the mtime alone misses files edited in place, which re-sort size/date listings.
+# Listings served uncached (too big) are identified by the directory's invalidation
+# count and mtime instead, so paging through them doesn't reload on every page.
+
+import os
+import sys
+import logging
+import time
+import threading
+import itertools
+from collections import OrderedDict
+
+from fswatch import watcher
+
+logger = logging.getLogger(__name__)
+
+LIST_CACHE_MAX_BYTES = int(os.environ.get('FLYINGFAWK_LIST_CACHE_MB', '64')) * 1024 * 1024
+
+# Rough per-row cost of an item dict with its keys and small values, on top of the strings.
+_ITEM_OVERHEAD_BYTES = 700
+
+
+def _estimate_size(items):
+    return sum(_ITEM_OVERHEAD_BYTES + sys.getsizeof(item['name']) + sys.getsizeof(item['subpath'])
+               for item in items)
+
+
+class ListingCache:
+    def __init__(self, max_bytes=LIST_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()  # key -> (snapshot_id, mtime_ns, items, size, watched)
+        self._keys_by_path = {}        # abs_path -> set of keys
+        self._generation = {}          # abs_path -> invalidation counter
+        self._bytes = 0
+        self._lock = threading.Lock()
+        # Snapshot ids from an earlier run of the app never match this one's
+        self._boot = f"{time.time_ns():x}"
+        self._scans = itertools.count(1)
+
+    def get(self, abs_path, sort_key, reverse, show_dotfiles, scan):
+        """
+        Returns (snapshot_id, items) for the listing, calling scan() -> (mtime_ns, items) on a miss.
+        """
+        key = (abs_path, sort_key, reverse, show_dotfiles)
+        released = []
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                snapshot_id, mtime_ns, items, _, watched = entry
+                if watched or mtime_ns == os.stat(abs_path).st_mtime_ns:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return snapshot_id, items
+                self._drop(key, released)
+            self.misses += 1
+            generation = self._generation.get(abs_path, 0)
+        self._unwatch(released)
+
+        # Watch before scanning so a change during the scan isn't missed
+        watched = watcher.watch(abs_path, self._on_event)
+        mtime_ns, items = scan()
+        size = _estimate_size(items)
+
+        released = []
+        with self._lock:
+            if self._generation.get(abs_path, 0) != generation or size > self.max_bytes:
+                # Changed while we were scanning, or too big to cache: serve it uncached
+                snapshot_id = f"{self._boot}.{generation}.{mtime_ns}"
+                if abs_path not in self._keys_by_path:
+                    released.append(abs_path)
+            else:
+                if key in self._entries:
+                    self._drop(key, released)
+                snapshot_id = f"{self._boot}.{next(self._scans)}"
+                self._entries[key] = (snapshot_id, mtime_ns, items, size, watched)
+                self._keys_by_path.setdefault(abs_path, set()).add(key)
+                self._bytes += size
+                if abs_path in released:
+                    released.remove(abs_path)
+
+                while self._bytes > self.max_bytes and self._entries:
+                    self._drop(next(iter(self._entries)), released)
+        self._unwatch(released)
+
+        return snapshot_id, items
+
+    def invalidate(self, abs_path):
+        released = []
+        with self._lock:
+            self._generation[abs_path] = self._generation.get(abs_path, 0) + 1
+            keys = self._keys_by_path.get(abs_path)
+            if keys:
+                self.invalidations += 1
+                for key in list(keys):
+                    self._drop(key, released)
+        self._unwatch(released)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 3) if lookups else None,
+                'invalidations': self.invalidations,
+                'entries': len(self._entries),
+                'directories': len(self._keys_by_path),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+            }
+
+    def _on_event(self, directory, event):
+        self.invalidate(directory)
+
+    def _drop(self, key, released):
+        # Caller holds the lock. Directories with no cached variant left are appended to
+        # `released`; their watches are removed by _unwatch() once the lock is let go,
+        # since the observer holds its own lock while it calls _on_event().
+        _, _, _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+        abs_path = key[0]
+        keys = self._keys_by_path.get(abs_path)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_path[abs_path]
+                released.append(abs_path)
+
+    def _unwatch(self, paths):
+        for abs_path in paths:
+            with self._lock:
+                if abs_path in self._keys_by_path:
+                    continue
+            watcher.unwatch(abs_path, self._on_event)
+
+
+listing_cache = ListingCache()
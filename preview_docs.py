@@ -1,13 +1,32 @@
 import os
-import subprocess
+import re
+import html
 import tempfile
+import mimetypes
 from pathlib import Path
-from flask import Blueprint, request, jsonify
+from urllib.parse import quote
+from flask import Blueprint, request, jsonify, send_file, abort
+
+from diskcache import DiskCache
+from docpool import doc_pool, DocumentPoolBusy
 
 preview_docs_bp = Blueprint('preview_docs', __name__, url_prefix='/api/preview')
 
+DOC_CACHE_MAX_BYTES = int(os.environ.get('FLYINGFAWK_DOC_CACHE_MB', '256')) * 1024 * 1024
+# Bumped whenever the conversion output changes, so stale previews aren't reused
+DOC_PROFILE = 'html-v2'
+
+# Converted previews by (path, size, mtime): repeat views skip LibreOffice entirely.
+# Images the export produced are cached separately under (document key, image name)
+# and referenced from the HTML by URL, so the HTML stays small and each image is
+# fetched (and browser-cached) on its own.
+doc_cache = DiskCache('docs', DOC_CACHE_MAX_BYTES, suffix='.html')
+doc_image_cache = DiskCache('docimages', DOC_CACHE_MAX_BYTES)
+
+IMG_SRC_RE = re.compile(r'<img src="([^"]+)"', re.IGNORECASE)
 
-def convert_to_html_preview(file_path: str) -> tuple[str, Path, callable]:
+
+def convert_to_html_preview(file_path: str) -> tuple[Path, Path, callable]:
     file_path = Path(file_path)
     if not file_path.exists():
         raise FileNotFoundError(f"File not found: {file_path}")
@@ -15,46 +34,70 @@ def convert_to_html_preview(file_path: str) -> tuple[str, Path, callable]:
     tmpdir = tempfile.TemporaryDirectory()
     output_dir = Path(tmpdir.name)
 
-    result = subprocess.run([
-        "libreoffice",
-        "--headless",
-        "--convert-to", "html",
-        "--outdir", str(output_dir),
-        str(file_path)
-    ], capture_output=True)
-
-    if result.returncode != 0:
+    try:
+        doc_pool.convert(file_path, output_dir / "preview.html")
+    except Exception:
         tmpdir.cleanup()
-        raise RuntimeError(f"LibreOffice conversion failed:\n{result.stderr.decode(errors='ignore')}")
+        raise
 
-    html_files = list(output_dir.glob("*.html"))
-    if not html_files:
-        tmpdir.cleanup()
-        raise FileNotFoundError("No HTML file generated during preview.")
+    return output_dir / "preview.html", output_dir, tmpdir.cleanup
+
+
+def _document_key(file_path: str):
+    stat = os.stat(file_path)
+    return (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns, DOC_PROFILE)
+
+
+def document_version(file_path: str):
+    """Short version tag of the document for image URLs (changes with the file)."""
+    _, size, mtime_ns, _ = _document_key(file_path)
+    return f"{size:x}-{mtime_ns:x}"
 
-    with open(html_files[0], "r", encoding="utf-8", errors="ignore") as f:
-        html = f.read()
 
-    return html, output_dir, tmpdir.cleanup
+def image_url(file_path: str, name: str):
+    return (f"{preview_docs_bp.url_prefix}/doc/image?path={quote(os.path.abspath(file_path))}"
+            f"&v={document_version(file_path)}&name={quote(name)}")
 
 
-def inline_images_in_html(html: str, image_dir: Path) -> str:
-    import re
-    import base64
+def render_html_preview(file_path: str, key, output: Path):
+    """
+    Converts `file_path` and writes the preview HTML to `output`, line by line, with every
+    <img src> the export produced moved into doc_image_cache and pointed at its URL.
+    """
+    _, output_dir, cleanup_fn = convert_to_html_preview(file_path)
+    images = {}  # src -> url, or None if the file isn't there
 
     def replace_img_src(match):
         src = match.group(1)
-        img_path = image_dir / src
-        if not img_path.exists():
+        if src not in images:
+            img_path = (output_dir / src).resolve()
+            if output_dir.resolve() not in img_path.parents or not img_path.is_file():
+                images[src] = None
+            else:
+                doc_image_cache.put(key + (src,), img_path)
+                images[src] = image_url(file_path, src)
+        if images[src] is None:
             return match.group(0)  # Leave original if file missing
+        return f'<img src="{html.escape(images[src])}"'
+
+    try:
+        with open(output_dir / "preview.html", "r", encoding="utf-8", errors="ignore") as source, \
+                open(output, "w", encoding="utf-8") as target:
+            for line in source:
+                target.write(IMG_SRC_RE.sub(replace_img_src, line))
+    finally:
+        cleanup_fn()
 
-        with open(img_path, "rb") as img_file:
-            encoded = base64.b64encode(img_file.read()).decode()
-            mime_type = "image/png"  # LibreOffice always uses PNG
-            return f'<img src="data:{mime_type};base64,{encoded}"'
 
-    # Match <img src="..."> and replace src
-    return re.sub(r'<img src="([^"]+)"', replace_img_src, html)
+def get_html_preview(file_path: str):
+    """
+    Returns the cache path of the preview HTML, converting on a miss (None on failure).
+    Raises DocumentPoolBusy on a miss while the conversion queue is full.
+    """
+    key = _document_key(file_path)
+    if doc_cache.get(key) is None and not doc_cache.is_pending(key) and doc_pool.is_full():
+        raise DocumentPoolBusy("Too many document previews in progress, try again shortly")
+    return doc_cache.get_or_create(key, lambda output: render_html_preview(file_path, key, output))
 
 
 @preview_docs_bp.route('/doc')
@@ -63,17 +106,50 @@ def preview_document():
     if not path:
         return jsonify({'error': 'Missing "path" parameter'}), 400
 
-    cleanup_fn = lambda: None  # no-op fallback
+    if not os.path.isfile(path):
+        return jsonify({'error': f'File not found: {path}'}), 404
+
     try:
-        html, output_dir, cleanup_fn = convert_to_html_preview(path)
-        html = inline_images_in_html(html, output_dir)
-        return html
+        preview = get_html_preview(path)
+        if preview is None:
+            return jsonify({'error': 'Document conversion failed'}), 500
+        # Sent from disk in chunks, not read into memory
+        return send_file(preview, mimetype='text/html')
+    except DocumentPoolBusy as e:
+        return jsonify({'error': str(e)}), 503
     except Exception as e:
         import traceback
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
-    finally:
+
+
+@preview_docs_bp.route('/doc/image')
+def preview_document_image():
+    path = request.args.get('path')
+    name = request.args.get('name')
+    if not path or not name:
+        return jsonify({'error': 'Missing "path" or "name" parameter'}), 400
+    if not os.path.isfile(path):
+        abort(404)
+
+    key = _document_key(path)
+    image = doc_image_cache.get(key + (name,))
+    if image is None and request.args.get('v') == document_version(path):
+        # Evicted while its HTML was still cached: convert again to bring it back
+        doc_cache.discard(key)
         try:
-            cleanup_fn()
-        except Exception:
-            pass  # Ignore cleanup errors
+            get_html_preview(path)
+        except DocumentPoolBusy:
+            abort(503)
+        image = doc_image_cache.get(key + (name,))
+    if image is None:
+        abort(404)
+
+    mimetype = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+    # The URL carries the document version, so the image never changes under it
+    return send_file(image, mimetype=mimetype, max_age=86400)
+
+
+@preview_docs_bp.route('/doc/stats')
+def preview_document_stats():
+    return jsonify({'cache': doc_cache.stats(), 'images': doc_image_cache.stats(), 'pool': doc_pool.stats()})
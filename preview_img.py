@@ -1,32 +1,162 @@
 import os
+import json
 import subprocess
-import tempfile
 from pathlib import Path
-from flask import Blueprint, request, jsonify, Response
-from PIL import Image
+from urllib.parse import quote
+from flask import Blueprint, request, jsonify, send_file, Response, stream_with_context
+from PIL import Image, ImageOps
+import eventlet
+import eventlet.queue
+from eventlet import tpool
+
+from diskcache import DiskCache
+from thumbpool import thumb_pool
 
 preview_img_bp = Blueprint('preview_img', __name__, url_prefix='/api/preview/image')
 
 MAX_IMAGE_SIZE_MB = 1
-COMPRESSION_THRESHOLD_MB = 2
 
+# Longest edge of each rendition, picked with ?size=
+IMAGE_SIZES = {
+    'thumb': 256,
+    'preview': 2048,
+}
+DEFAULT_SIZE = 'preview'
 
-def compress_image(input_path: Path, output_path: Path):
-    """Compress image to be under MAX_IMAGE_SIZE_MB if needed."""
-    try:
-        with Image.open(input_path) as img:
-            img = img.convert("RGB")  # Ensure compatibility
-            quality = 85
-            img.save(output_path, format="JPEG", quality=quality, optimize=True)
+IMAGE_CACHE_MAX_BYTES = int(os.environ.get('FLYINGFAWK_IMAGE_CACHE_MB', '512')) * 1024 * 1024
+# Bumped whenever the rendering below changes, so stale renditions aren't reused
+IMAGE_PROFILE = 'jpeg-v1'
 
-            while output_path.stat().st_size > MAX_IMAGE_SIZE_MB * 1024 * 1024 and quality > 20:
-                quality -= 5
-                img.save(output_path, format="JPEG", quality=quality, optimize=True)
+HEIC_EXTENSIONS = ['.heic', '.heif']
+JPEG_EXTENSIONS = ['.jpg', '.jpeg']
+# What the directory thumbnail stream renders (a subset of what preview.js opens as images)
+THUMBNAIL_EXTENSIONS = JPEG_EXTENSIONS + HEIC_EXTENSIONS + [
+    '.png', '.gif', '.bmp', '.tiff', '.tif', '.webp', '.ico', '.pbm', '.pgm', '.ppm', '.pnm', '.psd'
+]
 
-            return True
-    except Exception as e:
-        print("Compression failed:", e)
+image_cache = DiskCache('images', IMAGE_CACHE_MAX_BYTES, suffix='.jpg')
+
+
+def pick_quality(width, height):
+    """
+    JPEG quality for a rendition of width x height, chosen up front from the bytes per
+    pixel MAX_IMAGE_SIZE_MB allows, instead of re-encoding until the file fits.
+    """
+    budget = MAX_IMAGE_SIZE_MB * 1024 * 1024 / max(1, width * height)
+    if budget >= 0.4:
+        return 85
+    if budget >= 0.25:
+        return 75
+    if budget >= 0.15:
+        return 65
+    return 50
+
+
+def render_image(path: Path, max_dim: int, output: Path):
+    """Writes a JPEG of `path` no larger than max_dim on its longest edge to `output`."""
+    if path.suffix.lower() in HEIC_EXTENSIONS:
+        # Pillow can't read HEIC here; ImageMagick scales while decoding with -thumbnail
+        cmd = ["convert", str(path), "-auto-orient", "-thumbnail", f"{max_dim}x{max_dim}>",
+               "-quality", "82", f"jpeg:{output}"]
+        subprocess.run(cmd, check=True, capture_output=True)
+        return
+
+    with Image.open(path) as img:
+        # JPEGs decode straight at 1/2, 1/4 or 1/8 scale when that's still >= max_dim
+        img.draft('RGB', (max_dim, max_dim))
+        img = ImageOps.exif_transpose(img)
+        # reduce() by whole factors first, then one resample pass for the remainder
+        img.thumbnail((max_dim, max_dim), Image.Resampling.LANCZOS, reducing_gap=2.0)
+        img = img.convert("RGB")
+        img.save(output, format="JPEG", quality=pick_quality(*img.size))
+
+
+def can_pass_through(path: Path, max_dim: int, stat):
+    """Small upright JPEGs are sent as they are."""
+    if path.suffix.lower() not in JPEG_EXTENSIONS or stat.st_size > MAX_IMAGE_SIZE_MB * 1024 * 1024:
         return False
+    try:
+        with Image.open(path) as img:
+            # Orientation 1 (or missing): no rotation needed
+            return max(img.size) <= max_dim and img.getexif().get(0x0112, 1) == 1
+    except Exception:
+        return False
+
+
+def image_etag(path: Path, size_name: str):
+    """Changes whenever the file or the rendition settings do."""
+    stat = path.stat()
+    return f"{stat.st_size:x}-{stat.st_mtime_ns:x}-{IMAGE_SIZES[size_name]}-{IMAGE_PROFILE}"
+
+
+def _render_in_thread(path, max_dim, output):
+    # Decoding runs in a real thread so other requests keep being served meanwhile
+    tpool.execute(render_image, path, max_dim, output)
+
+
+def get_image_preview(path: Path, size_name: str, render=_render_in_thread):
+    """
+    Returns the path of a JPEG rendition of `path`, rendering and caching it on a miss
+    (None if rendering failed). Small JPEGs are returned as they are.
+    render(path, max_dim, output) does the actual work; see thumbpool for the process pool.
+    """
+    max_dim = IMAGE_SIZES[size_name]
+    stat = path.stat()
+    if can_pass_through(path, max_dim, stat):
+        return path
+
+    key = (str(path), stat.st_size, stat.st_mtime_ns, max_dim, IMAGE_PROFILE)
+    return image_cache.get_or_create(key, lambda output: render(path, max_dim, output))
+
+
+def iter_directory_thumbnails(directory: Path, size_name: str):
+    """
+    Renders a thumbnail for every image in `directory` on the thumbnail process pool and
+    yields {'name', 'url'} (or {'name', 'error'}) in the order they finish; cached ones
+    come back right away. Closing the generator stops handing out new work.
+    """
+    entries = sorted(
+        (entry for entry in os.scandir(directory)
+         if entry.is_file() and os.path.splitext(entry.name)[1].lower() in THUMBNAIL_EXTENSIONS),
+        key=lambda entry: entry.name.lower()
+    )
+    results = eventlet.queue.LightQueue()
+    state = {'cancelled': False}
+
+    def work(entry):
+        if state['cancelled']:
+            return
+        path = Path(entry.path)
+        try:
+            rendition = get_image_preview(path, size_name, render=thumb_pool.render)
+        except OSError:
+            rendition = None
+        if rendition is None:
+            results.put({'name': entry.name, 'error': 'Image conversion failed'})
+        else:
+            url = f"{preview_img_bp.url_prefix}/?path={quote(str(path))}&size={size_name}"
+            results.put({'name': entry.name, 'url': url})
+
+    def feed():
+        pool = eventlet.GreenPool(thumb_pool.size)
+        for entry in entries:
+            if state['cancelled']:
+                break
+            pool.spawn_n(work, entry)
+        pool.waitall()
+        results.put(None)
+
+    eventlet.spawn_n(feed)
+    try:
+        yield {'total': len(entries)}
+        while True:
+            result = results.get()
+            if result is None:
+                return
+            yield result
+    finally:
+        # Renders already running finish into the cache; nothing new is started
+        state['cancelled'] = True
 
 
 @preview_img_bp.route('/')
@@ -35,40 +165,73 @@ def preview_image():
     if not path:
         return jsonify({'error': 'Missing "path" parameter'}), 400
 
+    size_name = request.args.get('size', DEFAULT_SIZE)
+    if size_name not in IMAGE_SIZES:
+        return jsonify({'error': f'Unknown size: {size_name}'}), 400
+
     path = Path(path)
-    if not path.exists():
+    if not path.is_file():
         return jsonify({'error': f'File not found: {path}'}), 404
 
-    ext = path.suffix.lower()
     try:
-        with tempfile.TemporaryDirectory() as tmpdir:
-            tmp_output = Path(tmpdir) / "preview.jpg"
-
-            # HEIC and non-JPEG formats conversion
-            if ext in ['.heic', '.heif']:
-                cmd = ["convert", str(path), str(tmp_output)]  # uses ImageMagick
-                subprocess.run(cmd, check=True)
-            else:
-                # If already a supported format, copy or compress
-                size_mb = path.stat().st_size / (1024 * 1024)
-                if size_mb > COMPRESSION_THRESHOLD_MB:
-                    compress_image(path, tmp_output)
-                else:
-                    with Image.open(path) as img:
-                        img.convert("RGB").save(tmp_output, format="JPEG", quality=85)
-
-            with open(tmp_output, "rb") as f:
-                data = f.read()
-
-            response = Response(data, mimetype="image/jpeg")
-            response.headers["X-Preview-Format"] = "jpeg"
-            response.headers["Access-Control-Expose-Headers"] = "X-Preview-Format"
+        # Flipping back to an image the browser already has: answer before touching the cache
+        etag = image_etag(path, size_name)
+        if etag in request.if_none_match:
+            response = Response(status=304)
+            response.set_etag(etag)
+            response.headers["Cache-Control"] = "no-cache"
             return response
 
-    except subprocess.CalledProcessError as e:
-        return jsonify({'error': 'Image conversion failed', 'details': str(e)}), 500
+        rendition = get_image_preview(path, size_name)
+        if rendition is None:
+            return jsonify({'error': 'Image conversion failed'}), 500
+
+        response = send_file(rendition, mimetype="image/jpeg", etag=etag, conditional=True, max_age=0)
+        # Revalidate every time; the answer is a 304 until the file changes
+        response.headers["Cache-Control"] = "no-cache"
+        response.headers["X-Preview-Format"] = "jpeg"
+        response.headers["Access-Control-Expose-Headers"] = "X-Preview-Format"
+        return response
+
     except Exception as e:
         import traceback
         print("UNHANDLED EXCEPTION DURING IMAGE PREVIEW:")
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
+
+
+@preview_img_bp.route('/thumbs')
+def directory_thumbnails():
+    path = request.args.get('path')
+    if not path:
+        return jsonify({'error': 'Missing "path" parameter'}), 400
+
+    size_name = request.args.get('size', 'thumb')
+    if size_name not in IMAGE_SIZES:
+        return jsonify({'error': f'Unknown size: {size_name}'}), 400
+
+    directory = Path(path)
+    if not directory.is_dir():
+        return jsonify({'error': f'Path is not a directory: {directory}'}), 400
+
+    def thumb_generator():
+        # Newline-delimited JSON: {"total"} first, then one line per image as it's ready,
+        # the last line has "done": true. A client disconnect closes the generator.
+        thumbs = iter_directory_thumbnails(directory, size_name)
+        done = failed = 0
+        try:
+            for result in thumbs:
+                if 'name' in result:
+                    done += 1
+                    failed += 'error' in result
+                yield json.dumps(result) + '\n'
+            yield json.dumps({'done': True, 'rendered': done - failed, 'failed': failed}) + '\n'
+        finally:
+            thumbs.close()
+
+    return Response(stream_with_context(thumb_generator()), mimetype='application/x-ndjson')
+
+
+@preview_img_bp.route('/stats')
+def preview_image_stats():
+    return jsonify({'cache': image_cache.stats(), 'pool': thumb_pool.stats()})
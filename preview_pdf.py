@@ -1,87 +1,133 @@
-import subprocess
-import tempfile
+# preview_pdf.py
+# Rendered pages are cached per document in a size-bounded disk cache keyed by
+# (path, size, mtime, page, dpi); each render writes its own temp file, so concurrent
+# previews don't share an output directory. Serving a page also renders its neighbours
+# in the background, so paging back and forth is a cache hit.
+
 import os
+import subprocess
+from collections import OrderedDict
 from pathlib import Path
-from flask import Blueprint, request, send_file, jsonify
-from io import BytesIO
-import time
-from glob import glob
-
+from flask import Blueprint, request, send_file, jsonify, Response
+import eventlet
 
-TEMP_PDF_PREVIEW_DIR = Path("/tmp/pdf_previews")
-TEMP_PDF_PREVIEW_DIR.mkdir(parents=True, exist_ok=True)
+from diskcache import DiskCache
 
 preview_pdf_bp = Blueprint('preview_pdf', __name__, url_prefix='/api/preview/pdf')
 
+DEFAULT_DPI = 150
+MIN_DPI = 50
+MAX_DPI = 300
+# Pages rendered ahead (and behind) of the one requested
+PDF_PREFETCH_PAGES = int(os.environ.get('FLYINGFAWK_PDF_PREFETCH_PAGES', '2'))
+PDF_CACHE_MAX_BYTES = int(os.environ.get('FLYINGFAWK_PDF_CACHE_MB', '512')) * 1024 * 1024
+PAGE_COUNT_ENTRIES = 256
+
+pdf_page_cache = DiskCache('pdfpages', PDF_CACHE_MAX_BYTES, suffix='.jpg')
+_page_counts = OrderedDict()  # (path, size, mtime_ns) -> page count
+
+
+def _source_key(path):
+    st = os.stat(path)
+    return (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+
 
 def get_pdf_page_count(path: str) -> int:
+    try:
+        key = _source_key(path)
+    except OSError:
+        return 0
+    if key in _page_counts:
+        _page_counts.move_to_end(key)
+        return _page_counts[key]
+
     try:
         result = subprocess.run(
             ["pdfinfo", path],
             capture_output=True, text=True, check=True
         )
+        count = 0
         for line in result.stdout.splitlines():
             if line.lower().startswith("pages:"):
-                return int(line.split(":")[1].strip())
-        return 0
+                count = int(line.split(":")[1].strip())
+                break
     except Exception:
         return 0
 
+    if count:
+        _page_counts[key] = count
+        while len(_page_counts) > PAGE_COUNT_ENTRIES:
+            _page_counts.popitem(last=False)
+    return count
+
+
+def render_page(path: str, page: int, dpi: int, output: Path):
+    # -singlefile writes exactly <output>.jpg, without a page-number suffix
+    result = subprocess.run([
+        "pdftoppm", "-jpeg", "-r", str(dpi), "-f", str(page), "-l", str(page), "-singlefile",
+        path, str(output)
+    ], capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"pdftoppm failed: {result.stderr.strip()}")
+    os.replace(f"{output}.jpg", output)
+
+
+def page_etag(path: str, page: int, dpi: int):
+    _, size, mtime_ns = _source_key(path)
+    return f"{size:x}-{mtime_ns:x}-{page}-{dpi}"
+
+
+def get_page(path: str, page: int, dpi: int):
+    """Returns the cache path of the rendered page, rendering it on a miss (None on failure)."""
+    key = _source_key(path) + (page, dpi)
+    return pdf_page_cache.get_or_create(key, lambda output: render_page(path, page, dpi, output))
+
+
+def prefetch_pages(path: str, page: int, dpi: int, total_pages: int):
+    """Renders the pages around `page` in the background, nearest first."""
+    for distance in range(1, PDF_PREFETCH_PAGES + 1):
+        for neighbour in (page + distance, page - distance):
+            if not 1 <= neighbour <= total_pages:
+                continue
+            key = _source_key(path) + (neighbour, dpi)
+            if pdf_page_cache.get(key) is None and not pdf_page_cache.is_pending(key):
+                eventlet.spawn_n(get_page, path, neighbour, dpi)
+
 
 @preview_pdf_bp.route('/page')
 def preview_pdf_page():
     path = request.args.get('path')
-    page = int(request.args.get('page', 1))
+    page = request.args.get('page', 1, type=int)
+    dpi = min(MAX_DPI, max(MIN_DPI, request.args.get('dpi', DEFAULT_DPI, type=int)))
 
     try:
-        print(f"Request to preview page {page} of: {path}")
-
         if not path:
-            print("Missing path")
             return jsonify({'error': 'Missing "path" parameter'}), 400
         if page < 1:
-            print("Invalid page number")
             return jsonify({'error': 'Page must be >= 1'}), 400
-
-        for f in TEMP_PDF_PREVIEW_DIR.glob("*.jpg"):
-            f.unlink(missing_ok=True)
-        print("Old JPGs cleared")
+        if not os.path.isfile(path):
+            return jsonify({'error': f'File not found: {path}'}), 404
 
         total_pages = get_pdf_page_count(path)
-        print(f"Total pages: {total_pages}")
         if total_pages == 0:
             return jsonify({'error': 'Could not determine PDF page count'}), 500
         if page > total_pages:
             return jsonify({'error': f'PDF only has {total_pages} pages'}), 416
 
-        output_base = TEMP_PDF_PREVIEW_DIR / "preview"
-        result = subprocess.run([
-            "pdftoppm", "-jpeg", "-f", str(page), "-l", str(page),
-            path, str(output_base)
-        ], capture_output=True, text=True)
-
-        print("pdftoppm returncode:", result.returncode)
-        print("stderr:", result.stderr.strip())
-        print("stdout:", result.stdout.strip())
-
-        if result.returncode != 0:
-            return jsonify({'error': 'pdftoppm failed', 'details': result.stderr.strip()}), 500
-
-        # Try to find any preview-*.jpg in the output directory
-        matches = list(TEMP_PDF_PREVIEW_DIR.glob("preview-*.jpg"))
+        etag = page_etag(path, page, dpi)
+        if etag in request.if_none_match:
+            response = Response(status=304)
+            response.set_etag(etag)
+        else:
+            rendered = get_page(path, page, dpi)
+            if rendered is None:
+                return jsonify({'error': 'pdftoppm failed'}), 500
+            response = send_file(rendered, mimetype='image/jpeg', etag=etag, conditional=True, max_age=0)
 
-        if not matches:
-            return jsonify({'error': f'Expected preview image not found in {TEMP_PDF_PREVIEW_DIR}'}), 500
+        # After the requested page, so the neighbours don't compete with it
+        prefetch_pages(path, page, dpi, total_pages)
 
-        actual_path = matches[0]
-        print(f"Found image: {actual_path}")
-        
-        with open(actual_path, 'rb') as f:
-            image_bytes = f.read()
-
-        print("Image successfully read, sending response")
-        from flask import Response
-        response = Response(image_bytes, mimetype='image/jpeg')
+        response.headers["Cache-Control"] = "no-cache"
         response.headers["X-PDF-Page-Count"] = str(total_pages)
         response.headers["Access-Control-Expose-Headers"] = "X-PDF-Page-Count"
         return response
@@ -102,17 +148,6 @@ def pdf_info():
     return jsonify({'total_pages': total_pages})
 
 
-@preview_pdf_bp.route('/debugtest')
-def debug_test():
-    test_path = Path("/tmp/pdf_previews/preview-001.jpg")
-    if not test_path.exists():
-        return jsonify({'error': 'Image not found'}), 404
-
-    with open(test_path, 'rb') as f:
-        image_bytes = f.read()
-
-    from flask import Response
-    response = Response(image_bytes, mimetype='image/jpeg')
-    response.headers["X-Debug"] = "yes"
-    response.headers["Access-Control-Expose-Headers"] = "X-Debug"
-    return response
\ No newline at end of file
+@preview_pdf_bp.route('/stats')
+def pdf_cache_stats():
+    return jsonify({'pages': pdf_page_cache.stats(), 'page_counts': len(_page_counts)})
@@ -4,10 +4,12 @@ from flask import Blueprint, request, jsonify
 import threading
 from flask import Response, stream_with_context
 import json
+from foldersize import folder_sizes
+from sizeindex import size_index
 
 # Text preview	/api/preview/text?path=/hostroot/etc/hosts
 # File metadata	/api/preview/meta?path=/hostroot/etc/hosts
-# Folder size	/api/preview/foldersize?path=/hostroot/var/log
+# Folder size	/api/preview/foldersize?path=/hostroot/var/log  (streams NDJSON running totals; &fresh=1 skips the size index)
 
 
 preview_text_meta_bp = Blueprint('preview_text_meta', __name__, url_prefix='/api/preview')
@@ -66,24 +68,38 @@ def calculate_folder_size():
     if not path.is_dir():
         return jsonify({'error': f"Path is not a directory: {path}"}), 400
 
+    root = os.path.abspath(path_str)
+    fresh = request.args.get('fresh') == '1'
+
     def size_generator():
+        # Newline-delimited JSON: running totals while walking, the last line has "done": true.
+        # If the client disconnects the generator is closed, which cancels the walk.
+        if not fresh:
+            indexed = size_index.lookup([root]).get(root)
+            if indexed is not None:
+                # Known from the persistent index: answer without a walk, re-check it soon
+                size_index.mark_stale(root)
+                yield json.dumps({'path': str(path), **indexed, 'errors': 0, 'done': True, 'indexed': True}) + '\n'
+                return
+
+        collected = {}
+        sizes = folder_sizes.iter_sizes(root, collect=collected)
         try:
-            total_bytes = 0
-            for root, dirs, files in os.walk(path, onerror=lambda e: None):
-                for f in files:
-                    try:
-                        fp = os.path.join(root, f)
-                        if os.path.isfile(fp):
-                            total_bytes += os.path.getsize(fp)
-                    except Exception:
-                        continue
-            result = {'path': str(path), 'total_size_bytes': total_bytes}
+            for totals in sizes:
+                if totals['done']:
+                    size_index.store_walk(root, collected)
+                yield json.dumps({'path': str(path), **totals}) + '\n'
         except Exception as e:
-            result = {'error': str(e)}
+            yield json.dumps({'path': str(path), 'error': str(e), 'done': True}) + '\n'
+        finally:
+            sizes.close()
+
+    return Response(stream_with_context(size_generator()), mimetype='application/x-ndjson')
 
-        yield json.dumps(result)
 
-    return Response(stream_with_context(size_generator()), mimetype='application/json')
+@preview_text_meta_bp.route('/foldersize/stats')
+def folder_size_stats():
+    return jsonify({'cache': folder_sizes.stats(), 'index': size_index.stats()})
 
 @preview_text_meta_bp.route('/folderpreview')
 def folder_preview():
@@ -1,16 +1,17 @@
 # preview_video.py
 
 import os
-import subprocess
-from flask import Blueprint, request, Response, abort
+import logging
+from flask import Blueprint, request, Response, abort, jsonify, send_file
 from urllib.parse import unquote
+from transcode import transcodes
+from videoprobe import plan_stream, TRANSCODE_MODE_HEADER
+from videosegments import get_manifest, get_segment, segment_cache
+from videothumbs import get_poster, get_sprite, sprite_layout, thumb_cache
 
-video_preview = Blueprint('video_preview', __name__)
-
-def is_audio_only(path):
-    ext = os.path.splitext(path)[1].lower()
-    return ext in ['.mp3', '.m4a', '.aac', '.flac', '.wav', '.ogg', '.oga', '.opus']
+logger = logging.getLogger(__name__)
 
+video_preview = Blueprint('video_preview', __name__)
 
 @video_preview.route('/video')
 def stream_video():
@@ -24,54 +25,117 @@ def stream_video():
     if not os.path.isfile(safe_path):
         abort(404, 'File not found')
 
-    if is_audio_only(safe_path):
-        cmd = [
-            'ffmpeg',
-            '-ss', str(seek_time),
-            '-i', safe_path,
-            '-f', 'lavfi',
-            '-t', '600',  # dummy length if duration unknown
-            '-i', 'color=size=16x16:rate=10:color=black',
-            '-shortest',
-            '-f', 'mp4',
-            '-vcodec', 'libx264',
-            '-acodec', 'aac',
-            '-preset', 'ultrafast',
-            '-tune', 'zerolatency',
-            '-movflags', 'frag_keyframe+empty_moov+default_base_moof',
-            'pipe:1'
-        ]
-    else:
-        cmd = [
-            'ffmpeg',
-            '-ss', str(seek_time),
-            '-i', safe_path,
-            '-f', 'mp4',
-            '-vcodec', 'libx264',
-            '-acodec', 'aac',
-            '-preset', 'ultrafast',
-            '-tune', 'zerolatency',
-            '-movflags', 'frag_keyframe+empty_moov+default_base_moof',
-            'pipe:1'
-        ]
-
-
-    print(f"[FFmpeg] Running: {' '.join(cmd)}")
-
-    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE)
+    # Remux when the source is browser-safe already, re-encode only what has to be
+    mode, cmd = plan_stream(safe_path, seek_time)
+
+    logger.debug(f"FFmpeg command ({mode}): {' '.join(cmd)}")
+
+    # Runs under the transcode manager: capped, shared with identical requests, and
+    # killed when the last viewer's connection closes
+    file_stat = os.stat(safe_path)
+    stream_key = ('video', safe_path, file_stat.st_size, file_stat.st_mtime_ns, round(seek_time, 3), mode)
 
     def generate():
+        # Attached only once the body is read: a response that is never iterated (HEAD,
+        # client gone first) would otherwise hold the encoder's slot for good
+        stream = transcodes.stream(stream_key, cmd)
         try:
-            while True:
-                chunk = proc.stdout.read(4096)
-                if not chunk:
-                    break
-                yield chunk
+            yield from stream
         finally:
-            proc.terminate()
-            print("[FFmpeg] Terminated process.")
+            stream.close()
+            logger.debug("FFmpeg stream closed.")
+
+    return Response(generate(), mimetype='video/mp4', headers={TRANSCODE_MODE_HEADER: mode})
+
+
+@video_preview.route('/video/segments/manifest')
+def segments_manifest():
+    raw_path = request.args.get('v')
+    if not raw_path:
+        abort(400, 'Missing video path')
+
+    safe_path = unquote(raw_path)
+    if not os.path.isfile(safe_path):
+        abort(404, 'File not found')
+
+    return jsonify(get_manifest(safe_path))
 
-    return Response(generate(), mimetype='video/mp4')
+
+@video_preview.route('/video/segments/<int:index>')
+def stream_segment(index):
+    raw_path = request.args.get('v')
+    if not raw_path:
+        abort(400, 'Missing video path')
+
+    safe_path = unquote(raw_path)
+    if not os.path.isfile(safe_path):
+        abort(404, 'File not found')
+
+    segment = get_segment(safe_path, index)
+    if segment is None:
+        abort(404, 'Segment not available')
+
+    # Segment URLs include the index only; the cache key covers size/mtime, so keep
+    # browser caching short in case the file is replaced.
+    return send_file(segment, mimetype='video/mp4', conditional=True, max_age=60)
+
+
+@video_preview.route('/video/segments/stats')
+def segments_stats():
+    return jsonify(segment_cache.stats())
+
+
+@video_preview.route('/video/poster')
+def video_poster():
+    raw_path = request.args.get('v')
+    if not raw_path:
+        abort(400, 'Missing video path')
+
+    safe_path = unquote(raw_path)
+    if not os.path.isfile(safe_path):
+        abort(404, 'File not found')
+
+    poster = get_poster(safe_path)
+    if poster is None:
+        abort(404, 'No poster available')
+    return send_file(poster, mimetype='image/jpeg', conditional=True, max_age=60)
+
+
+@video_preview.route('/video/sprite/layout')
+def video_sprite_layout():
+    raw_path = request.args.get('v')
+    if not raw_path:
+        abort(400, 'Missing video path')
+
+    safe_path = unquote(raw_path)
+    if not os.path.isfile(safe_path):
+        abort(404, 'File not found')
+
+    layout = sprite_layout(safe_path)
+    if layout is None:
+        abort(404, 'No video stream')
+    return jsonify(layout)
+
+
+@video_preview.route('/video/sprite')
+def video_sprite():
+    raw_path = request.args.get('v')
+    if not raw_path:
+        abort(400, 'Missing video path')
+
+    safe_path = unquote(raw_path)
+    if not os.path.isfile(safe_path):
+        abort(404, 'File not found')
+
+    sheet, _ = get_sprite(safe_path)
+    if sheet is None:
+        abort(404, 'No sprite sheet available')
+    return send_file(sheet, mimetype='image/jpeg', conditional=True, max_age=60)
+
+
+@video_preview.route('/video/thumbs/stats')
+def video_thumbs_stats():
+    return jsonify(thumb_cache.stats())
 
 
 @video_preview.route('/gstream')
@@ -99,23 +163,16 @@ def stream_video_gstreamer():
         'fdsink fd=1'
     ]
 
-    print(f"[GStreamer] Running: {' '.join(cmd)}")
-
-    try:
-        proc = subprocess.Popen(' '.join(cmd), stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, shell=True)
-
-        def generate():
-            try:
-                while True:
-                    chunk = proc.stdout.read(4096)
-                    if not chunk:
-                        break
-                    yield chunk
-            finally:
-                proc.terminate()
-                print("[GStreamer] Terminated process.")
-
-        return Response(generate(), mimetype='video/mp4')
-    except Exception as e:
-        print(f"[GStreamer] Failed to start pipeline: {e}")
-        abort(500, 'GStreamer pipeline failed')
+    logger.debug(f"GStreamer command: {' '.join(cmd)}")
+
+    def generate():
+        stream = transcodes.stream(('gstream', safe_path, seek_ns), ' '.join(cmd), shell=True)
+        try:
+            yield from stream
+        except Exception as e:
+            logger.error(f"GStreamer pipeline failed: {e}")
+        finally:
+            stream.close()
+            logger.debug("GStreamer stream closed.")
+
+    return Response(generate(), mimetype='video/mp4')
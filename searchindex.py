@@ -0,0 +1,444 @@
+# searchindex.py
+# Persistent filename index of everything under GUI_ROOT (SQLite under DATA_DIR), for
+# /api/search: like locate, but kept current while the app runs.
+#
+# - One row per file or directory: its parent directory and its name. Names are
+#   matched through an FTS5 trigram table, so any substring of three characters or more
+#   is an index lookup; shorter queries use the lower(name) index as a prefix lookup.
+#   Without FTS5 trigram support (SQLite < 3.34) every query scans the names.
+# - Built in the background by a breadth-first crawl at no more than CRAWL_RATE
+#   directories a second. Only readdir is needed: no per-file stat. Names in
+#   PRUNE_NAMES (and the trash directories) are left out.
+# - Kept current incrementally: a directory whose contents may have changed is re-read
+#   and diffed against its rows, new subdirectories are crawled and removed ones dropped
+#   with their subtree. Changes are noticed from
+#     * every fswatch event, i.e. changes in the directories the panes show (the index
+#       adds no watches of its own: watchdog spends an inotify instance, of 128 per
+#       user by default, on every watched directory),
+#     * directory listings that had to re-scan (api.py),
+#     * a reconciler re-checking the mtime of the least recently checked directories at
+#       no more than RECONCILE_RATE a second.
+#
+# All SQLite work runs in eventlet's tpool on one connection, behind a native lock.
+
+import os
+import time
+import sqlite3
+import logging
+from collections import deque
+
+import eventlet
+from eventlet import tpool, patcher
+
+from appdata import data_path
+from fswatch import watcher
+from trash import TRASH_DIR_NAME
+
+logger = logging.getLogger(__name__)
+
+GUI_ROOT = os.environ.get('GUI_ROOT', '/hostroot')
+SEARCH_INDEX_ENABLED = os.environ.get('FLYINGFAWK_SEARCH_INDEX', '1') == '1'
+SEARCH_INDEX_PATH = os.environ.get('FLYINGFAWK_SEARCH_INDEX_PATH') or str(data_path('searchindex.sqlite3'))
+# Upper bound on directories read per second while crawling
+CRAWL_RATE = float(os.environ.get('FLYINGFAWK_SEARCH_CRAWL_RATE', '1000'))
+# A directory's mtime is re-checked this many seconds after it was last checked
+RECHECK_SECONDS = float(os.environ.get('FLYINGFAWK_SEARCH_RECHECK_SECONDS', '3600'))
+RECONCILE_RATE = float(os.environ.get('FLYINGFAWK_SEARCH_RECONCILE_RATE', '50'))
+PRUNE_NAMES = {name for name in os.environ.get('FLYINGFAWK_SEARCH_PRUNE_NAMES', '').split(',') if name} | {TRASH_DIR_NAME}
+READ_BATCH = 50
+RECONCILE_BATCH = 50
+IDLE_SLEEP_SECONDS = 5
+
+_native_threading = patcher.original('threading')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY,
+    parent TEXT NOT NULL,
+    name TEXT NOT NULL,
+    is_dir INTEGER NOT NULL,
+    UNIQUE (parent, name)
+);
+CREATE INDEX IF NOT EXISTS entries_lower_name ON entries (lower(name));
+CREATE TABLE IF NOT EXISTS dirs (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    checked_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS dirs_checked_at ON dirs (checked_at);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS names USING fts5(
+    name, content='entries', content_rowid='id', tokenize='trigram');
+CREATE TRIGGER IF NOT EXISTS entries_ai AFTER INSERT ON entries BEGIN
+    INSERT INTO names (rowid, name) VALUES (new.id, new.name);
+END;
+CREATE TRIGGER IF NOT EXISTS entries_ad AFTER DELETE ON entries BEGIN
+    INSERT INTO names (names, rowid, name) VALUES ('delete', old.id, old.name);
+END;
+"""
+
+
+def _subtree_bounds(path):
+    """Range of keys strictly below `path`: '<path>/' <= key < '<path>0' ('0' sorts right after '/')."""
+    base = path.rstrip('/')
+    return base + '/', base + '0'
+
+
+def _fold(text):
+    """Lowercases ASCII only, like SQLite's lower()."""
+    if text.isascii():
+        return text.lower()
+    return ''.join(c.lower() if c.isascii() else c for c in text)
+
+
+def _read_directories(paths):
+    """
+    Reads directories (on a tpool thread). Returns (path, mtime_ns, [(name, is_dir)])
+    per path; mtime_ns is None for a directory that is gone.
+    """
+    results = []
+    for path in paths:
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except OSError:
+            results.append((path, None, []))
+            continue
+        names = []
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    if entry.name in PRUNE_NAMES:
+                        continue
+                    try:
+                        # d_type from readdir: no stat per entry; symlinks count as files
+                        is_dir = entry.is_dir(follow_symlinks=False)
+                    except OSError:
+                        is_dir = False
+                    names.append((entry.name, is_dir))
+        except OSError:
+            pass  # unreadable: indexed as empty
+        results.append((path, mtime_ns, names))
+    return results
+
+
+def _changed_directories(rows):
+    """Of (path, mtime_ns) rows, the paths whose mtime differs or that are gone (tpool)."""
+    changed = []
+    for path, mtime_ns in rows:
+        try:
+            if os.stat(path).st_mtime_ns != mtime_ns:
+                changed.append(path)
+        except OSError:
+            changed.append(path)
+    return changed
+
+
+class SearchIndex:
+    def __init__(self, root=GUI_ROOT, db_path=SEARCH_INDEX_PATH):
+        self.root = os.path.abspath(root)
+        self.db_path = db_path
+        self._conn = None
+        self._db_lock = _native_threading.Lock()
+        self._fts = False
+        self._dirty = set()      # abs dirs to re-read before anything else
+        self._new_dirs = deque() # abs dirs not indexed yet, crawled with their subtree
+        self._disabled = not SEARCH_INDEX_ENABLED
+        self._indexer = None
+        self.state = 'idle'      # idle -> crawling -> ready
+        self.built_at = None
+        self.crawled = 0
+        self.reconciled = 0
+        # Bumped by every write that changes rows; with the start time it identifies
+        # the state search pages were taken from
+        self.generation = 0
+        self._boot = f"{time.time_ns():x}"
+
+    # --- database plumbing -------------------------------------------------
+
+    def _connect(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn.executescript(SCHEMA)
+            try:
+                self._conn.executescript(FTS_SCHEMA)
+                self._fts = True
+            except sqlite3.OperationalError:
+                # No trigram tokenizer: substring queries scan the names instead
+                self._fts = False
+        return self._conn
+
+    def _locked(self, fn, *args):
+        with self._db_lock:
+            conn = self._connect()
+            conn.execute('BEGIN')
+            try:
+                result = fn(conn, *args)
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            conn.execute('COMMIT')
+            return result
+
+    def _run(self, fn, *args, default=None):
+        """Runs fn(conn, *args) in one transaction on a tpool thread."""
+        if self._disabled:
+            return default
+        try:
+            return tpool.execute(self._locked, fn, *args)
+        except sqlite3.Error as e:
+            if isinstance(e, sqlite3.OperationalError) and 'unable to open' in str(e):
+                logger.warning(f"searchindex: disabled, cannot open {self.db_path}: {e}")
+                self._disabled = True
+            else:
+                logger.error(f"searchindex: {e}")
+            return default
+
+    @staticmethod
+    def _delete_subtree(conn, path):
+        """Drops everything below directory `path` (not its own row); returns the entries dropped."""
+        low, high = _subtree_bounds(path)
+        dropped = conn.execute('DELETE FROM entries WHERE parent = ? OR (parent >= ? AND parent < ?)',
+                               (path, low, high)).rowcount
+        conn.execute('DELETE FROM dirs WHERE path = ? OR (path >= ? AND path < ?)', (path, low, high))
+        return dropped
+
+    def _store_directories(self, conn, results):
+        """
+        Brings the rows of each read directory in line with what was read.
+        Returns the subdirectories that weren't indexed before.
+        """
+        now = time.time()
+        added_dirs = []
+        changed = 0
+        for path, mtime_ns, names in results:
+            if mtime_ns is None:
+                changed += self._delete_subtree(conn, path)
+                changed += conn.execute('DELETE FROM entries WHERE parent = ? AND name = ?',
+                                        (os.path.dirname(path), os.path.basename(path))).rowcount
+                continue
+
+            existing = {name: (row_id, is_dir) for row_id, name, is_dir in
+                        conn.execute('SELECT id, name, is_dir FROM entries WHERE parent = ?', (path,))}
+            current = dict(names)
+            for name, (row_id, was_dir) in existing.items():
+                if current.get(name) != bool(was_dir):
+                    changed += conn.execute('DELETE FROM entries WHERE id = ?', (row_id,)).rowcount
+                    if was_dir:
+                        changed += self._delete_subtree(conn, os.path.join(path, name))
+            new_rows = [(path, name, int(is_dir)) for name, is_dir in names
+                        if name not in existing or bool(existing[name][1]) != is_dir]
+            conn.executemany('INSERT INTO entries (parent, name, is_dir) VALUES (?, ?, ?)', new_rows)
+            changed += len(new_rows)
+            added_dirs.extend(os.path.join(path, name) for _, name, is_dir in new_rows if is_dir)
+            conn.execute('INSERT OR REPLACE INTO dirs (path, mtime_ns, checked_at) VALUES (?, ?, ?)',
+                         (path, mtime_ns, now))
+        if changed:
+            self.generation += 1
+        return added_dirs
+
+    # --- public API --------------------------------------------------------
+
+    def mark_dirty(self, abs_path):
+        """Asks for a directory to be re-read soon. Cheap, no I/O; any thread."""
+        if abs_path != self.root and not abs_path.startswith(self.root + os.sep):
+            return
+        if PRUNE_NAMES.isdisjoint(abs_path[len(self.root):].split(os.sep)):
+            self._dirty.add(abs_path)
+
+    def search(self, query, scope=None, offset=0, limit=100, show_dotfiles=False, kind=None):
+        """
+        Names matching every whitespace separated term of `query` (case-insensitive
+        substrings), below `scope` if given. Returns {'results': [(abs path, is_dir)],
+        'total', 'snapshot'}, best matches first: exact names, then names
+        starting with the first term, then shorter names. Ranking and paging happen in
+        SQL over every match, so any page of the ranking can be fetched and the total is
+        exact.
+        """
+        terms = [_fold(term) for term in query.split()]
+        if not terms or self._disabled:
+            return {'results': [], 'total': 0, 'snapshot': self.snapshot()}
+
+        def run(conn):
+            long_terms = [term for term in terms if len(term) >= 3]
+            where, params = [], []
+            if self._fts and long_terms:
+                source = 'names JOIN entries e ON e.id = names.rowid'
+                where.append('names MATCH ?')
+                params.append(' AND '.join('"' + term.replace('"', '""') + '"' for term in long_terms))
+                filter_terms = [term for term in terms if len(term) < 3]
+            elif self._fts:
+                # Only short terms: prefix lookup on the first, on the lower(name) index
+                source = 'entries e'
+                first = terms[0]
+                where.append('lower(e.name) >= ? AND lower(e.name) < ?')
+                params.extend([first, first[:-1] + chr(ord(first[-1]) + 1)])
+                filter_terms = terms[1:]
+            else:
+                source = 'entries e'
+                filter_terms = terms
+            for term in filter_terms:
+                where.append('instr(lower(e.name), ?) > 0')
+                params.append(term)
+            if scope and scope != self.root:
+                low, high = _subtree_bounds(scope)
+                where.append('(e.parent = ? OR (e.parent >= ? AND e.parent < ?))')
+                params.extend([scope, low, high])
+            if not show_dotfiles:
+                where.append("e.name NOT LIKE '.%' AND instr(substr(e.parent, ?), '/.') = 0")
+                params.append(len(self.root) + 1)
+            if kind in ('file', 'dir'):
+                where.append('e.is_dir = ?')
+                params.append(int(kind == 'dir'))
+            matches = f'FROM {source} WHERE {" AND ".join(where)}'
+
+            first = terms[0]
+            # One pass over the matches ranks them and counts them (window count); ties
+            # are broken down to the full path, so pages of one ranking line up
+            rows = conn.execute(
+                f'SELECT e.parent, e.name, e.is_dir, COUNT(*) OVER () {matches} '
+                'ORDER BY lower(e.name) <> ?, substr(lower(e.name), 1, ?) <> ?, length(e.name), '
+                'lower(e.name), e.parent, e.name LIMIT ? OFFSET ?',
+                params + [first, len(first), first, max(0, limit), max(0, offset)]).fetchall()
+            if rows:
+                total = rows[0][3]
+            else:
+                # Past the last page (or no matches): count on its own
+                total = conn.execute(f'SELECT COUNT(*) {matches}', params).fetchone()[0]
+            return [row[:3] for row in rows], total, self.snapshot()
+
+        rows, total, snapshot = self._run(run, default=None) or ([], 0, self.snapshot())
+        return {
+            'results': [(os.path.join(parent, name), bool(is_dir)) for parent, name, is_dir in rows],
+            'total': total,
+            'snapshot': snapshot,
+        }
+
+    def snapshot(self):
+        """Identifies the index's current contents: changes with every write that changes rows."""
+        return f"{self._boot}.{self.generation}"
+
+    def status(self):
+        """State of the index without touching the database, for every search response."""
+        return {'state': self.state, 'built_at': self.built_at, 'enabled': not self._disabled}
+
+    def stats(self):
+        def query(conn):
+            entries = conn.execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+            directories = conn.execute('SELECT COUNT(*) FROM dirs').fetchone()[0]
+            return {'entries': entries, 'directories': directories}
+
+        stats = self._run(query, default={}) or {}
+        stats.update({
+            'path': self.db_path,
+            'enabled': not self._disabled,
+            'state': self.state,
+            'built_at': self.built_at,
+            'trigram': self._fts,
+            'pending_dirty': len(self._dirty),
+            'crawled': self.crawled,
+            'reconciled': self.reconciled,
+        })
+        return stats
+
+    def start_indexer(self):
+        if self._indexer is None and not self._disabled:
+            self._indexer = eventlet.spawn(self._index_forever)
+        return self._indexer
+
+    # --- crawling and reconciling ------------------------------------------
+
+    def _on_fs_event(self, directories, event):
+        for directory in directories:
+            self.mark_dirty(directory)
+
+    def _crawl(self, roots):
+        """Reads `roots` and everything below them, breadth first, within CRAWL_RATE."""
+        queue = deque(roots)
+        while queue and not self._disabled:
+            batch = [queue.popleft() for _ in range(min(READ_BATCH, len(queue)))]
+            started = time.time()
+            results = tpool.execute(_read_directories, batch)
+            self._run(self._store_directories, results)
+            for path, mtime_ns, names in results:
+                queue.extend(os.path.join(path, name) for name, is_dir in names if is_dir)
+            self.crawled += len(batch)
+            eventlet.sleep(max(0.0, len(batch) / CRAWL_RATE - (time.time() - started)))
+
+    def rebuild(self):
+        """Crawls the whole root, bringing every row up to date."""
+        self.state = 'crawling'
+        started = time.time()
+        logger.info(f"searchindex: crawling {self.root} ({self.db_path}).")
+        self._crawl([self.root])
+        self.built_at = time.time()
+        self._run(lambda conn: conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('built_at', ?)",
+                                            (str(self.built_at),)))
+        self.state = 'ready'
+        logger.info(f"searchindex: crawled {self.crawled} directories in {time.time() - started:.1f}s.")
+
+    def reconcile_once(self, limit=RECONCILE_BATCH):
+        """Re-reads changed directories; returns how many were looked at."""
+        if self._new_dirs:
+            new_dirs = [self._new_dirs.popleft() for _ in range(len(self._new_dirs))]
+            self._crawl(new_dirs)
+            return len(new_dirs)
+
+        dirty = [self._dirty.pop() for _ in range(min(limit, len(self._dirty)))]
+        if not dirty:
+            def due(conn):
+                cutoff = time.time() - RECHECK_SECONDS
+                rows = conn.execute('SELECT path, mtime_ns FROM dirs WHERE checked_at < ? '
+                                    'ORDER BY checked_at LIMIT ?', (cutoff, limit)).fetchall()
+                conn.executemany('UPDATE dirs SET checked_at = ? WHERE path = ?',
+                                 ((time.time(), path) for path, _ in rows))
+                return rows
+
+            rows = self._run(due, default=[]) or []
+            if not rows:
+                return 0
+            dirty = tpool.execute(_changed_directories, rows)
+            self.reconciled += len(rows)
+            if not dirty:
+                eventlet.sleep(len(rows) / RECONCILE_RATE)
+                return len(rows)
+
+        results = tpool.execute(_read_directories, dirty)
+        self._new_dirs.extend(self._run(self._store_directories, results, default=[]) or [])
+        self.reconciled += len(dirty)
+        # Stay in the background: at most RECONCILE_RATE directories per second
+        eventlet.sleep(len(dirty) / RECONCILE_RATE)
+        return len(dirty)
+
+    def _index_forever(self):
+        watcher.add_listener(self._on_fs_event)
+        built_at = self._run(lambda conn: conn.execute("SELECT value FROM meta WHERE key = 'built_at'").fetchone())
+        try:
+            if built_at is None:
+                self.rebuild()
+            else:
+                self.built_at = float(built_at[0])
+                self.state = 'ready'
+                logger.info(f"searchindex: using index built at {time.ctime(self.built_at)} ({self.db_path}).")
+        except Exception as e:
+            logger.error(f"searchindex: crawl failed: {e}")
+            self.state = 'idle'
+
+        while not self._disabled:
+            try:
+                checked = self.reconcile_once()
+            except Exception as e:
+                logger.error(f"searchindex: reconcile failed: {e}")
+                checked = 0
+            if not checked:
+                eventlet.sleep(IDLE_SLEEP_SECONDS)
+
+
+search_index = SearchIndex()
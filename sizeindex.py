@@ -0,0 +1,309 @@
+# sizeindex.py
+# Persistent index of recursive directory sizes (SQLite under DATA_DIR).
+#
+# Each row holds one directory: its own bytes/files (regular files directly inside it)
+# and the aggregate totals of its whole subtree. Rows are written when a folder-size
+# walk completes and kept current incrementally: a change in one directory updates its
+# row and adds the difference to every indexed ancestor, so no parent is re-walked.
+#
+# A low-priority reconciler greenthread re-reads the least recently checked rows at a
+# limited rate (plus any directory marked stale, first), picking up added, removed and
+# resized entries. Invariant: if a directory is indexed, its whole subtree is indexed.
+#
+# All SQLite work runs in eventlet's tpool on one connection, behind a native lock.
+
+import os
+import time
+import sqlite3
+import logging
+
+import eventlet
+from eventlet import tpool, patcher
+
+from appdata import data_path
+from foldersize import folder_sizes, _read_directory
+
+logger = logging.getLogger(__name__)
+
+SIZE_INDEX_PATH = os.environ.get('FLYINGFAWK_SIZE_INDEX_PATH') or str(data_path('sizeindex.sqlite3'))
+# A row is due for a re-check this many seconds after it was last checked
+RECHECK_SECONDS = float(os.environ.get('FLYINGFAWK_SIZE_INDEX_RECHECK_SECONDS', '600'))
+# Upper bound on directories re-read per second by the reconciler
+RECONCILE_RATE = float(os.environ.get('FLYINGFAWK_SIZE_INDEX_RATE', '100'))
+RECONCILE_BATCH = 50
+IDLE_SLEEP_SECONDS = 5
+# SQLite's default limit on host parameters is 999
+LOOKUP_CHUNK = 500
+
+_native_threading = patcher.original('threading')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS dirs (
+    path TEXT PRIMARY KEY,
+    parent TEXT,
+    mtime_ns INTEGER NOT NULL,
+    own_bytes INTEGER NOT NULL,
+    own_files INTEGER NOT NULL,
+    total_bytes INTEGER NOT NULL,
+    total_files INTEGER NOT NULL,
+    total_dirs INTEGER NOT NULL,
+    checked_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS dirs_parent ON dirs (parent);
+CREATE INDEX IF NOT EXISTS dirs_checked_at ON dirs (checked_at);
+"""
+
+
+def _parent_of(path):
+    parent = os.path.dirname(path)
+    return parent if parent != path else None
+
+
+def _subtree_bounds(path):
+    """Range of keys strictly below `path`: '<path>/' <= key < '<path>0' ('0' sorts right after '/')."""
+    base = path.rstrip('/')
+    return base + '/', base + '0'
+
+
+class SizeIndex:
+    def __init__(self, db_path=SIZE_INDEX_PATH):
+        self.db_path = db_path
+        self._conn = None
+        self._db_lock = _native_threading.Lock()
+        self._stale = set()   # abs paths to re-check before anything else
+        self._disabled = False
+        self._reconciler = None
+        self.reconciled = 0
+
+    # --- database plumbing -------------------------------------------------
+
+    def _connect(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn.executescript(SCHEMA)
+        return self._conn
+
+    def _locked(self, fn, *args):
+        with self._db_lock:
+            conn = self._connect()
+            conn.execute('BEGIN')
+            try:
+                result = fn(conn, *args)
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            conn.execute('COMMIT')
+            return result
+
+    def _run(self, fn, *args, default=None):
+        """Runs fn(conn, *args) in one transaction on a tpool thread."""
+        if self._disabled:
+            return default
+        try:
+            return tpool.execute(self._locked, fn, *args)
+        except sqlite3.Error as e:
+            if isinstance(e, sqlite3.OperationalError) and 'unable to open' in str(e):
+                logger.warning(f"sizeindex: disabled, cannot open {self.db_path}: {e}")
+                self._disabled = True
+            else:
+                logger.error(f"sizeindex: {e}")
+            return default
+
+    @staticmethod
+    def _propagate(conn, path, d_bytes, d_files, d_dirs):
+        """Adds a difference to the totals of `path` and every indexed ancestor."""
+        if not (d_bytes or d_files or d_dirs):
+            return
+        while path:
+            updated = conn.execute(
+                'UPDATE dirs SET total_bytes = total_bytes + ?, total_files = total_files + ?, '
+                'total_dirs = total_dirs + ? WHERE path = ?',
+                (d_bytes, d_files, d_dirs, path)).rowcount
+            if not updated:
+                break
+            path = _parent_of(path)
+
+    @staticmethod
+    def _delete_subtree(conn, path):
+        """Deletes `path` and everything below it; returns its old totals or None."""
+        row = conn.execute('SELECT total_bytes, total_files, total_dirs FROM dirs WHERE path = ?',
+                           (path,)).fetchone()
+        low, high = _subtree_bounds(path)
+        conn.execute('DELETE FROM dirs WHERE path = ? OR (path >= ? AND path < ?)', (path, low, high))
+        return row
+
+    # --- public API --------------------------------------------------------
+
+    def lookup(self, paths):
+        """Returns {abs_path: {'total_size_bytes', 'files', 'dirs', 'checked_at'}} for the indexed paths."""
+        paths = list(paths)
+        if not paths:
+            return {}
+
+        def query(conn):
+            found = {}
+            for i in range(0, len(paths), LOOKUP_CHUNK):
+                chunk = paths[i:i + LOOKUP_CHUNK]
+                rows = conn.execute(
+                    'SELECT path, total_bytes, total_files, total_dirs, checked_at FROM dirs '
+                    f'WHERE path IN ({",".join("?" * len(chunk))})', chunk)
+                for path, total_bytes, total_files, total_dirs, checked_at in rows:
+                    found[path] = {
+                        'total_size_bytes': total_bytes,
+                        'files': total_files,
+                        'dirs': total_dirs,
+                        'checked_at': checked_at,
+                    }
+            return found
+
+        return self._run(query, default={})
+
+    def store_walk(self, root, entries):
+        """
+        Stores a completed walk of `root`. `entries` maps every directory read to
+        (mtime_ns, own_bytes, own_files, subdir_names), as collected by FolderSizeEngine.iter_sizes().
+        """
+        if root not in entries:
+            return
+        self._run(self._store_walk, root, entries)
+
+    def mark_stale(self, abs_path):
+        """Asks the reconciler to re-check an indexed directory soon. Cheap, no I/O."""
+        self._stale.add(abs_path)
+
+    def stats(self):
+        def query(conn):
+            count, oldest = conn.execute('SELECT COUNT(*), MIN(checked_at) FROM dirs').fetchone()
+            return {
+                'directories': count,
+                'oldest_check_age': round(time.time() - oldest, 1) if oldest else None,
+            }
+
+        stats = self._run(query, default={}) or {}
+        stats.update({
+            'path': self.db_path,
+            'enabled': not self._disabled,
+            'pending_stale': len(self._stale),
+            'reconciled': self.reconciled,
+        })
+        return stats
+
+    def start_reconciler(self):
+        if self._reconciler is None:
+            self._reconciler = eventlet.spawn(self._reconcile_forever)
+        return self._reconciler
+
+    # --- writing -----------------------------------------------------------
+
+    def _store_walk(self, conn, root, entries):
+        # Aggregate bottom-up: deepest directories first
+        totals = {}
+        for path in sorted(entries, key=lambda p: p.count('/'), reverse=True):
+            _, own_bytes, own_files, subdirs = entries[path]
+            t_bytes, t_files, t_dirs = own_bytes, own_files, 1
+            for name in subdirs:
+                child = totals.get(os.path.join(path, name))
+                if child is not None:
+                    t_bytes += child[0]
+                    t_files += child[1]
+                    t_dirs += child[2]
+            totals[path] = (t_bytes, t_files, t_dirs)
+
+        old = self._delete_subtree(conn, root) or (0, 0, 0)
+        now = time.time()
+        conn.executemany(
+            'INSERT INTO dirs (path, parent, mtime_ns, own_bytes, own_files, '
+            'total_bytes, total_files, total_dirs, checked_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            ((path, _parent_of(path), entries[path][0], entries[path][1], entries[path][2],
+              t_bytes, t_files, t_dirs, now)
+             for path, (t_bytes, t_files, t_dirs) in totals.items()))
+
+        new = totals[root]
+        self._propagate(conn, _parent_of(root), new[0] - old[0], new[1] - old[1], new[2] - old[2])
+
+    def _apply_rescan(self, conn, path, entry):
+        """
+        Brings one directory's row up to date with a fresh read of it.
+        Returns the paths of new subdirectories, which still need a walk.
+        """
+        row = conn.execute('SELECT own_bytes, own_files FROM dirs WHERE path = ?', (path,)).fetchone()
+        if row is None:
+            return []
+
+        if entry is None:
+            # Directory is gone
+            old = self._delete_subtree(conn, path)
+            if old:
+                self._propagate(conn, _parent_of(path), -old[0], -old[1], -old[2])
+            return []
+
+        mtime_ns, _, own_bytes, own_files, subdirs = entry
+        conn.execute('UPDATE dirs SET mtime_ns = ?, own_bytes = ?, own_files = ?, checked_at = ? WHERE path = ?',
+                     (mtime_ns, own_bytes, own_files, time.time(), path))
+        self._propagate(conn, path, own_bytes - row[0], own_files - row[1], 0)
+
+        present = set(subdirs)
+        indexed = set()
+        for (child,) in conn.execute('SELECT path FROM dirs WHERE parent = ?', (path,)).fetchall():
+            name = os.path.basename(child)
+            if name in present:
+                indexed.add(name)
+                continue
+            old = self._delete_subtree(conn, child)
+            if old:
+                self._propagate(conn, path, -old[0], -old[1], -old[2])
+
+        return [os.path.join(path, name) for name in subdirs if name not in indexed]
+
+    # --- reconciler --------------------------------------------------------
+
+    def _due_paths(self, conn, stale, limit):
+        due = [path for path in stale
+               if conn.execute('SELECT 1 FROM dirs WHERE path = ?', (path,)).fetchone()]
+        if len(due) < limit:
+            due += [path for (path,) in conn.execute(
+                'SELECT path FROM dirs WHERE checked_at < ? ORDER BY checked_at LIMIT ?',
+                (time.time() - RECHECK_SECONDS, limit - len(due)))]
+        return due
+
+    def reconcile_once(self, limit=RECONCILE_BATCH):
+        """Re-checks up to `limit` directories; returns how many were checked."""
+        stale = [self._stale.pop() for _ in range(min(limit, len(self._stale)))]
+        paths = self._run(self._due_paths, stale, limit, default=[])
+
+        for path in paths:
+            try:
+                _, entry, _ = tpool.execute(_read_directory, path, {})
+            except FileNotFoundError:
+                entry = None
+            except OSError as e:
+                logger.debug(f"sizeindex: could not re-read {path}: {e}")
+                continue
+
+            for new_dir in self._run(self._apply_rescan, path, entry, default=[]):
+                collected = {}
+                for _ in folder_sizes.iter_sizes(new_dir, collect=collected):
+                    eventlet.sleep(0)
+                self.store_walk(new_dir, collected)
+
+            self.reconciled += 1
+            # Stay in the background: at most RECONCILE_RATE directories per second
+            eventlet.sleep(1.0 / RECONCILE_RATE)
+
+        return len(paths)
+
+    def _reconcile_forever(self):
+        logger.info(f"sizeindex: reconciler started ({self.db_path}).")
+        while not self._disabled:
+            try:
+                checked = self.reconcile_once()
+            except Exception as e:
+                logger.error(f"sizeindex: reconcile failed: {e}")
+                checked = 0
+            if not checked:
+                eventlet.sleep(IDLE_SLEEP_SECONDS)
+
+
+size_index = SizeIndex()
@@ -0,0 +1,118 @@
+// static/batchupload.js
+
+// Drops of many small files skip Uppy (one tus upload, i.e. two requests, per file) and
+// go to /up/batch in a few large multipart requests instead. The server writes each
+// request's files concurrently and reports every finished file as an 'upload_progress'
+// event on the '/fs' socket, which drives the progress line in the message box.
+
+window.batchUpload = (function () {
+    // Drops with at least this many files, none larger than MAX_FILE_BYTES, are batched
+    const MIN_FILES = 20;
+    const MAX_FILE_BYTES = 16 * 1024 * 1024;
+    // Limits per request
+    const BATCH_FILES = 200;
+    const BATCH_BYTES = 64 * 1024 * 1024;
+    const PARALLEL_REQUESTS = 2;
+
+    function shouldBatch(files) {
+        return files.length >= MIN_FILES && files.every(file => file.size <= MAX_FILE_BYTES);
+    }
+
+    function splitIntoBatches(files) {
+        const batches = [];
+        let current = [];
+        let bytes = 0;
+        for (const file of files) {
+            if (current.length && (current.length >= BATCH_FILES || bytes + file.size > BATCH_BYTES)) {
+                batches.push(current);
+                current = [];
+                bytes = 0;
+            }
+            current.push(file);
+            bytes += file.size;
+        }
+        if (current.length) batches.push(current);
+        return batches;
+    }
+
+    function showProgress(done, total, failed) {
+        const html = `<div class="message-content-text">Uploading ${done} / ${total} files` +
+            (failed ? `, ${failed} failed` : '') + '</div>';
+        const content = document.getElementById('message-content');
+        if (content && document.getElementById('message-box')?.classList.contains('visible')) {
+            content.innerHTML = html;
+        } else if (typeof openMessageBox === 'function') {
+            openMessageBox(html);
+        }
+    }
+
+    /**
+     * Uploads `files` into the server directory `targetPath`; resolves with { saved, failed }.
+     */
+    async function upload(files, targetPath) {
+        const socket = window.fsEvents?.socket();
+        const uploadId = Math.random().toString(36).slice(2);
+        const total = files.length;
+        let done = 0;
+        let failedCount = 0;
+
+        const onProgress = (event) => {
+            if (!event.batch?.startsWith(uploadId)) return;
+            done += 1;
+            if (event.error) failedCount += 1;
+            showProgress(done, total, failedCount);
+        };
+        socket?.on('upload_progress', onProgress);
+        showProgress(0, total, 0);
+
+        const saved = [];
+        const failed = [];
+        const queue = splitIntoBatches(files).map((batch, index) => [batch, `${uploadId}-${index}`]);
+
+        async function sendNext() {
+            while (queue.length) {
+                const [batch, batchId] = queue.shift();
+                const form = new FormData();
+                form.append('targetPath', targetPath);
+                form.append('batchId', batchId);
+                if (socket?.connected) form.append('socketId', socket.id);
+                for (const file of batch) {
+                    form.append('relativePath', file.webkitRelativePath || file.name);
+                    form.append('file', file, file.name);
+                }
+                try {
+                    const res = await fetch('/up/batch', { method: 'POST', body: form });
+                    const body = await res.json();
+                    if (!res.ok) throw new Error(body.error || res.statusText);
+                    saved.push(...body.saved);
+                    failed.push(...body.failed);
+                } catch (err) {
+                    console.warn('[batchupload] Batch failed:', err);
+                    failed.push(...batch.map(file => ({ name: file.name, error: err.message })));
+                }
+                if (!socket?.connected) {
+                    // No progress events: count the batch once it's answered
+                    done += batch.length;
+                    showProgress(done, total, failed.length);
+                }
+            }
+        }
+
+        try {
+            await Promise.all(Array.from({ length: PARALLEL_REQUESTS }, sendNext));
+        } finally {
+            socket?.off('upload_progress', onProgress);
+        }
+
+        if (failed.length) {
+            document.getElementById('message-content').innerHTML =
+                `<div class="message-content-text error-message">${failed.length} of ${total} files failed to upload:<br>` +
+                failed.slice(0, 20).map(item => escapeHtml(`${item.name}: ${item.error}`)).join('<br>') + '</div>';
+        } else if (typeof overlayclose === 'function') {
+            overlayclose();
+        }
+        return { saved, failed };
+    }
+
+    return { shouldBatch, upload };
+})();
@@ -66,30 +66,15 @@ function handleRunInTermClick(event) {
     }
 }
 
+// Copy and move run as background jobs on the server; progress shows in the transfer panel
 function copy(items, destinationDir) {
     if (!items || !destinationDir) return;
-
-    const sources = items.map(item => `/hostroot${item.dataset.path}`);
-    const destPath = `/hostroot${destinationDir}`;
-    const cmd = `cp -aiv ${sources.map(p => `"${p}"`).join(' ')} "${destPath}"`;
-
-    console.log("Copy command:", cmd);
-
-    window._onTerminalExit = () => refreshPanes(null, true);
-    openTerminalOverlay(cmd, true);
+    transfers.submit('copy', items, destinationDir);
 }
 
 function move(items, destinationDir) {
     if (!items || !destinationDir) return;
-
-    const sources = items.map(item => `/hostroot${item.dataset.path}`);
-    const destPath = `/hostroot${destinationDir}`;
-    const cmd = `mv -iv ${sources.map(p => `"${p}"`).join(' ')} "${destPath}"`;
-
-    console.log("Move command:", cmd);
-
-    window._onTerminalExit = () => refreshPanes(null, true);
-    openTerminalOverlay(cmd, true);
+    transfers.submit('move', items, destinationDir);
 }
 
 function handleCopy(event) {
@@ -514,17 +499,31 @@ function handleDelete() {
     }
 
     if (paths.length > 0) {
-        const commandString = `rm -Rv ${paths.map(p => `"${p}"`).join(' ')}`;
-        console.log("Delete command:", commandString);
-    
         const focusedPane = document.querySelector('.pane-container.panefocus');
         const focusedPaneId = focusedPane?.id || null;
 
-        window._onTerminalExit = () => {
-            refreshPanes(focusedPaneId, true); // Refresh only that pane, with retained state
-        };
-    
-        openTerminalOverlay(commandString, true); // true = exit terminal when done
+        // Moved to the trash in one request; the disk work happens in the background
+        fetch('/api/batch', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ operations: paths.map(path => ({ op: 'delete', path })) })
+        })
+            .then(response => response.json().then(result => ({ ok: response.ok, result })))
+            .then(({ ok, result }) => {
+                refreshPanes(focusedPaneId, true);
+                if (!ok) {
+                    throw new Error(result.error || 'Delete failed');
+                }
+                const failed = result.results.filter(r => !r.ok);
+                if (failed.length > 0) {
+                    const lines = failed.map(r => `${escapeHtml(r.path)}: ${escapeHtml(r.error)}`).join('<br>');
+                    openMessageBox(`<div class="message-content-text error-message">Could not delete ${failed.length} item(s):<br>${lines}</div>`);
+                }
+            })
+            .catch(err => {
+                console.error("Delete failed:", err);
+                openMessageBox(`<div class="message-content-text error-message">Delete failed: ${escapeHtml(err.message)}</div>`);
+            });
     }
 }
 
@@ -585,14 +584,26 @@ function handleUpload() {
 
 function handleDownload() {
     const focusedPane = document.querySelector('.pane-container.panefocus');
-    const focusedFile = focusedPane?.querySelector('.file-row.focus[data-item-type="file"]');
+    const focusedItem = focusedPane?.querySelector('.file-row.focus');
 
-    if (!focusedFile) {
+    let selectedItems = getSelectedItemsInFocusedPane();
+    if (!selectedItems || selectedItems.length === 0) {
+        selectedItems = focusedItem ? [focusedItem] : [];
+    }
+    selectedItems = selectedItems.filter(item => item.dataset.itemName !== '..');
+
+    if (selectedItems.length === 0) {
         alert("No file is focused.");
         return;
     }
 
-    const logicalPath = focusedFile.getAttribute('data-path'); // e.g. /home/user/file.txt
+    // Several items or a directory: the server streams them as one ZIP
+    if (selectedItems.length > 1 || selectedItems[0].dataset.itemType !== 'file') {
+        downloadAsZip(selectedItems.map(item => '/hostroot' + item.getAttribute('data-path')));
+        return;
+    }
+
+    const logicalPath = selectedItems[0].getAttribute('data-path'); // e.g. /home/user/file.txt
     const hostrootPath = '/hostroot' + logicalPath;
     const relPath = hostrootPath.replace(/^\/+/, '');
     const encodedPath = relPath.split('/').map(encodeURIComponent).join('/');
@@ -607,6 +618,38 @@ function handleDownload() {
     document.body.removeChild(a);
 }
 
+/**
+ * Downloads server paths as a ZIP streamed by /down/zip. Posted as a form so long
+ * selections fit, into a hidden iframe so an error response doesn't replace the page.
+ */
+function downloadAsZip(serverPaths, compression = 'store') {
+    let frame = document.getElementById('downloadFrame');
+    if (!frame) {
+        frame = document.createElement('iframe');
+        frame.id = 'downloadFrame';
+        frame.name = 'downloadFrame';
+        frame.style.display = 'none';
+        document.body.appendChild(frame);
+    }
+
+    const form = document.createElement('form');
+    form.method = 'POST';
+    form.action = '/down/zip';
+    form.target = 'downloadFrame';
+    form.style.display = 'none';
+    const fields = serverPaths.map(path => ['path', path]).concat([['compression', compression]]);
+    for (const [name, value] of fields) {
+        const input = document.createElement('input');
+        input.type = 'hidden';
+        input.name = name;
+        input.value = value;
+        form.appendChild(input);
+    }
+    document.body.appendChild(form);
+    form.submit();
+    document.body.removeChild(form);
+}
+
 
 
 
@@ -652,6 +695,18 @@ function handleArchive(event) {
     openTerminalOverlay(zipCommand, true);
 }
 
+// Puts '?' in the focused pane's path field: Enter then searches the whole tree
+function startIndexSearch(event) {
+    event?.preventDefault();
+    event?.stopPropagation();
+
+    const input = document.querySelector('.pane-container.panefocus .path-input');
+    if (!input) return;
+    input.value = '?';
+    input.focus();
+    input.setSelectionRange(1, 1);
+}
+
 function runInTerm(event) {
     event?.preventDefault();
     event?.stopPropagation();
@@ -32,6 +32,9 @@ function setupManualDrag(paneId) {
     if (!pane) return;
 
     pane.querySelectorAll('.file-row').forEach(row => {
+        if (row._manualDragBound) return; // rows kept across appended pages
+        row._manualDragBound = true;
+
         row.addEventListener('mousedown', e => {
             if (e.button !== 0) return; // only left click
 
@@ -255,6 +258,10 @@ document.addEventListener('DOMContentLoaded', () => {
         setupManualDrag(paneId);
       });
 
+      pane.addEventListener('paneContentAppended', () => {
+        setupManualDrag(paneId);
+      });
+
       pane.addEventListener('paneTabsUpdated', () => {
         console.log(`setupTabDropHandlers: ${paneId}`);
         setupTabDropHandlers(paneId);
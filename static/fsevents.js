@@ -0,0 +1,214 @@
+// static/fsevents.js
+
+// Live directory updates over Socket.IO ('/fs' namespace, see fsevents.py).
+// Each pane subscribes to the path it shows after every load; the server pushes
+// 'dir_changed' {path, added, removed, modified} and the rows are patched in place
+// instead of re-fetching /api/list.
+
+window.fsEvents = (function () {
+    let fsSocket = null;
+    const waiters = {}; // paneId -> [resolve, ...] waiting for the next patch
+
+    // Mirrors the server's sort key (api._sort_key): column value, then the name.
+    const VALID_SORT_KEYS = ['name', 'file_extension', 'size', 'last_modified', 'created'];
+
+    function sortValue(item, sortKey) {
+        let val = item[sortKey];
+        if (typeof val === 'string') val = val.toLowerCase();
+        else if (val === null || val === undefined) val = -1;
+        return [val, (item.name || '').toLowerCase()];
+    }
+
+    function compareItems(a, b, sortBy, sortOrder) {
+        // Directories always come before files, each group sorted on its own
+        if (a.is_directory !== b.is_directory) return a.is_directory ? -1 : 1;
+
+        const sortKey = VALID_SORT_KEYS.includes(sortBy) ? sortBy : 'name';
+        const [a1, a2] = sortValue(a, sortKey);
+        const [b1, b2] = sortValue(b, sortKey);
+        let result = 0;
+        if (a1 < b1) result = -1;
+        else if (a1 > b1) result = 1;
+        else if (a2 < b2) result = -1;
+        else if (a2 > b2) result = 1;
+        return sortOrder === 'desc' ? -result : result;
+    }
+
+    function rowItem(pane, row) {
+        return pane._itemsByPath?.get(row.dataset.path) || {
+            name: row.dataset.itemName,
+            is_directory: row.dataset.itemType === 'dir'
+        };
+    }
+
+    function createRow(pane, item) {
+        const wrapper = document.createElement('div');
+        wrapper.innerHTML = tmpl.file_row(item);
+        pane._itemsByPath?.set(item.subpath, item);
+        return wrapper.firstElementChild;
+    }
+
+    function findRow(pane, path) {
+        return pane.querySelector(`.file-row[data-path="${CSS.escape(path)}"]`);
+    }
+
+    function panesShowing(path) {
+        return Array.from(document.querySelectorAll('.pane-container'))
+            .filter(pane => pane._listing && pane._fsSubscribedListing === pane._listing && pane._fsSubscribedPath === path);
+    }
+
+    function patchPane(pane, change) {
+        const listing = pane._listing;
+        const container = pane.querySelector('.file-list-container');
+        if (!container || !listing) return;
+
+        change.removed.forEach(path => {
+            const name = path.split('/').pop();
+            if (!listing.showDotfiles && name.startsWith('.')) return;
+            listing.total -= 1;
+
+            const row = findRow(pane, path);
+            if (!row) return; // not loaded yet
+            if (row.classList.contains('focus')) {
+                const next = row.nextElementSibling || row.previousElementSibling;
+                if (next) next.classList.add('focus');
+            }
+            row.remove();
+            pane._itemsByPath?.delete(path);
+            listing.loaded -= 1;
+        });
+
+        change.modified.forEach(item => {
+            const row = findRow(pane, item.subpath);
+            if (!row) return;
+            const replacement = createRow(pane, item);
+            ['focus', 'selected'].forEach(cls => {
+                if (row.classList.contains(cls)) replacement.classList.add(cls);
+            });
+            row.replaceWith(replacement);
+        });
+
+        const rows = Array.from(container.querySelectorAll('.file-row'))
+            .filter(row => row.dataset.itemName !== '..');
+        change.added.forEach(item => {
+            if (!listing.showDotfiles && item.name.startsWith('.')) return;
+            if (findRow(pane, item.subpath)) return;
+            listing.total += 1;
+
+            const before = rows.find(row => compareItems(item, rowItem(pane, row), listing.sortBy, listing.sortOrder) < 0);
+            if (!before && listing.loaded < listing.total - 1) {
+                // Sorts after the rows loaded so far; a later page will bring it in
+                return;
+            }
+            const row = createRow(pane, item);
+            if (before) {
+                container.insertBefore(row, before);
+                rows.splice(rows.indexOf(before), 0, row);
+            } else {
+                container.appendChild(row);
+                rows.push(row);
+            }
+            listing.loaded += 1;
+        });
+
+        if (!container.querySelector('.file-row.focus')) {
+            container.querySelector('.file-row')?.classList.add('focus');
+        }
+
+        pane.dispatchEvent(new CustomEvent('paneContentAppended', { detail: { paneId: pane.id } }));
+        (waiters[pane.id] || []).splice(0).forEach(resolve => resolve(true));
+    }
+
+    function subscribePane(pane) {
+        const path = pane._listing?.path;
+        const previous = pane._fsSubscribedPath;
+        pane._fsSubscribedPath = null;
+
+        if (previous && previous !== path) {
+            const stillUsed = Array.from(document.querySelectorAll('.pane-container'))
+                .some(other => other !== pane && other._fsSubscribedPath === previous);
+            if (!stillUsed && fsSocket?.connected) fsSocket.emit('unsubscribe', { path: previous });
+        }
+        // Search results (virtual panes) have no directory to watch
+        if (!path || isSearchPath(path) || !fsSocket?.connected) return;
+
+        fsSocket.emit('subscribe', { path }, (reply) => {
+            // Ignore late replies for a path the pane has already left
+            if (reply?.ok && pane._listing?.path === path) {
+                pane._fsSubscribedPath = reply.path; // normalized by the server
+                pane._fsSubscribedListing = pane._listing;
+            }
+        });
+    }
+
+    function connect() {
+        if (typeof io !== 'function') {
+            console.warn('[fsevents] socket.io client not loaded; live updates disabled.');
+            return;
+        }
+        fsSocket = io(window.location.origin + '/fs');
+
+        fsSocket.on('connect', () => {
+            document.querySelectorAll('.pane-container').forEach(subscribePane);
+        });
+
+        fsSocket.on('disconnect', () => {
+            document.querySelectorAll('.pane-container').forEach(pane => { pane._fsSubscribedPath = null; });
+        });
+
+        fsSocket.on('dir_changed', (change) => {
+            panesShowing(change.path).forEach(pane => patchPane(pane, change));
+        });
+
+        fsSocket.on('dir_removed', ({ path }) => {
+            panesShowing(path).forEach(pane => {
+                const pathInput = pane.querySelector('.path-input');
+                const parentRow = pane.querySelector('.file-row[data-item-name=".."]');
+                if (pathInput && parentRow) {
+                    pathInput.value = parentRow.dataset.path;
+                    loadPaneContent(pane.id);
+                }
+            });
+        });
+    }
+
+    /**
+     * True if the pane's current directory is subscribed, i.e. its rows are kept up to date by the server.
+     */
+    function isLive(paneId) {
+        const pane = document.getElementById(paneId);
+        return !!(fsSocket?.connected && pane?._listing && pane._fsSubscribedListing === pane._listing);
+    }
+
+    /**
+     * Resolves after the next patch for the pane arrives, or after `timeout` ms if nothing changed.
+     */
+    function whenPatched(paneId, timeout = 1000) {
+        return new Promise(resolve => {
+            (waiters[paneId] = waiters[paneId] || []).push(resolve);
+            setTimeout(() => {
+                const list = waiters[paneId] || [];
+                const index = list.indexOf(resolve);
+                if (index !== -1) list.splice(index, 1);
+                resolve(false);
+            }, timeout);
+        });
+    }
+
+    /**
+     * The '/fs' socket (null until connected once), for other features that report over it.
+     */
+    function socket() {
+        return fsSocket;
+    }
+
+    document.addEventListener('DOMContentLoaded', () => {
+        connect();
+        ['left-pane', 'right-pane'].forEach(paneId => {
+            const pane = document.getElementById(paneId);
+            pane?.addEventListener('paneContentLoaded', () => subscribePane(pane));
+        });
+    });
+
+    return { isLive, whenPatched, socket };
+})();
@@ -8,16 +8,19 @@
 const SHOW_DOTFILES_STORAGE_KEY = 'filebrowser_show_dotfiles';
 // --- End localStorage Key ---
 
+// Rows requested per /api/list call; further pages are fetched as the pane is scrolled.
+const LIST_PAGE_SIZE = 500;
+
 // Global object to store retained selections and focuses per pane
 window._retainedSelections = {};
 
 
-async function fetchDirectoryData(path, showDotfiles = false, sortBy = 'name', order = 'asc') {
+async function fetchDirectoryData(path, showDotfiles = false, sortBy = 'name', order = 'asc', offset = 0, limit = LIST_PAGE_SIZE) {
     const apiPath = path.startsWith('/') ? path : '/' + path;
     const encodedApiPath = apiPath.split('/').map(segment => encodeURIComponent(segment)).join('/');
 
-    // Compose query string with dotfile and sorting parameters
-    const url = `${API_BASE_URL}${encodedApiPath}?show_dotfiles=${showDotfiles ? 'true' : 'false'}&sort_by=${encodeURIComponent(sortBy)}&order=${encodeURIComponent(order)}`;
+    // Compose query string with dotfile, sorting and paging parameters
+    const url = `${API_BASE_URL}${encodedApiPath}?show_dotfiles=${showDotfiles ? 'true' : 'false'}&sort_by=${encodeURIComponent(sortBy)}&order=${encodeURIComponent(order)}&offset=${offset}&limit=${limit}`;
 
     try {
         const response = await fetch(url);
@@ -42,6 +45,50 @@ async function fetchDirectoryData(path, showDotfiles = false, sortBy = 'name', o
 }
 
 
+// A pane path starting with '?' is a search over the whole tree (/api/search), shown as
+// a virtual pane: same rows and paging as a directory, each with its location.
+function isSearchPath(path) {
+    return typeof path === 'string' && path.startsWith('?');
+}
+
+async function fetchSearchData(query, showDotfiles = false, offset = 0, limit = LIST_PAGE_SIZE) {
+    const url = `/api/search?q=${encodeURIComponent(query)}&show_dotfiles=${showDotfiles ? 'true' : 'false'}&offset=${offset}&limit=${limit}`;
+
+    try {
+        const response = await fetch(url);
+        if (!response.ok) {
+            return {
+                error: `Server Error: ${response.status} ${response.statusText}`,
+                current_path: '?' + query,
+                items: [],
+                is_file: false
+            };
+        }
+        const data = await response.json();
+        if (data.items.length === 0 && offset === 0) {
+            data.error = data.index?.state === 'crawling'
+                ? `No matches for "${escapeHtml(query)}" yet, the search index is still being built.`
+                : `No matches for "${escapeHtml(query)}".`;
+        }
+        return data;
+    } catch (error) {
+        return {
+            error: `Network Error: ${error.message}`,
+            current_path: '?' + query,
+            items: [],
+            is_file: false
+        };
+    }
+}
+
+function fetchPaneData(path, showDotfiles, sortBy, order, offset = 0) {
+    if (isSearchPath(path)) {
+        // Results come ranked by relevance; the sort columns don't apply
+        return fetchSearchData(path.slice(1).trim(), showDotfiles, offset);
+    }
+    return fetchDirectoryData(path, showDotfiles, sortBy, order, offset);
+}
+
 
 function renderPaneContent(paneElement, paneData) {
     const pathInput = paneElement.querySelector('.path-input');
@@ -68,6 +115,8 @@ function renderPaneContent(paneElement, paneData) {
             fileListHtml += tmpl.file_row(item);
         });
         fileListContainer.innerHTML = fileListHtml;
+        // Row data by path, used to place rows pushed by fsevents.js in sort order
+        paneElement._itemsByPath = new Map(paneData.items.map(item => [item.subpath, item]));
 
         fileListContainer.querySelector('.file-row')?.classList.add('focus');
 
@@ -110,12 +159,22 @@ async function loadPaneContent(paneId) {
     // console.log(`Loading content for pane ${paneId} at path: ${path} (Show dotfiles: ${showDotfiles}, Sort by: ${sortBy}, Order: ${sortOrder})`);
 
     fileListContainer.innerHTML = '<p>Loading...</p>';
+    paneElement._listing = null;
     let paneData;
 
     try {
-        paneData = await fetchDirectoryData(path, showDotfiles, sortBy, sortOrder);
+        paneData = await fetchPaneData(path, showDotfiles, sortBy, sortOrder);
         renderPaneContent(paneElement, paneData);
 
+        // Remember where we are in the listing so scrolling can fetch the next page
+        paneElement._listing = {
+            path, showDotfiles, sortBy, sortOrder,
+            loaded: Array.isArray(paneData.items) ? paneData.items.length : 0,
+            total: paneData.total ?? 0,
+            snapshot: paneData.snapshot,
+            loading: false
+        };
+
         // --- Dispatch custom event (for restoring selections, etc.) ---
         const event = new CustomEvent('paneContentLoaded', { detail: { paneId } });
         paneElement.dispatchEvent(event);
@@ -139,6 +198,60 @@ async function loadPaneContent(paneId) {
 
 
 
+/**
+ * Fetches the next page of the pane's current listing and appends its rows.
+ * If the directory changed since the first page (new snapshot), the pane is reloaded instead.
+ */
+async function loadNextPanePage(paneId) {
+    const paneElement = document.getElementById(paneId);
+    const listing = paneElement?._listing;
+    if (!listing || listing.loading || listing.loaded >= listing.total) return;
+
+    const fileListContainer = paneElement.querySelector('.file-list-container');
+    listing.loading = true;
+
+    try {
+        const page = await fetchPaneData(listing.path, listing.showDotfiles, listing.sortBy, listing.sortOrder, listing.loaded);
+        if (paneElement._listing !== listing) return; // pane navigated away meanwhile
+
+        if (page.error || !Array.isArray(page.items)) {
+            console.warn(`[global_functions] Failed to load next page for ${paneId}:`, page.error);
+            return;
+        }
+
+        if (page.snapshot !== listing.snapshot) {
+            console.log(`[global_functions] Listing for ${paneId} changed while paging, reloading.`);
+            retainCurrentSelectionsAndFileFocuses();
+            refreshPanes(paneId, true);
+            return;
+        }
+
+        fileListContainer.insertAdjacentHTML('beforeend', page.items.map(item => tmpl.file_row(item)).join(''));
+        page.items.forEach(item => paneElement._itemsByPath?.set(item.subpath, item));
+        listing.loaded += page.items.length;
+        listing.total = page.total;
+
+        paneElement.dispatchEvent(new CustomEvent('paneContentAppended', { detail: { paneId } }));
+    } finally {
+        listing.loading = false;
+    }
+}
+
+/**
+ * Loads further pages when a pane's file list is scrolled close to its end.
+ */
+function initPaneScrollPaging(paneId) {
+    const fileListContainer = document.querySelector(`#${paneId} .file-list-container`);
+    if (!fileListContainer) return;
+
+    fileListContainer.addEventListener('scroll', () => {
+        const remaining = fileListContainer.scrollHeight - fileListContainer.scrollTop - fileListContainer.clientHeight;
+        if (remaining < fileListContainer.clientHeight) {
+            loadNextPanePage(paneId);
+        }
+    }, { passive: true });
+}
+
 function getSortingFromLocalStorage(paneId) {
     const sortKey = `pane_${paneId}_sort_by`;
     const orderKey = `pane_${paneId}_sort_order`;
@@ -465,6 +578,13 @@ function refreshPanes(paneid = false, retain = false) {
             }
         };
 
+        // Live panes are already patched by fsevents.js: just wait for the pending
+        // change to arrive instead of downloading the directory again
+        if (retain && window.fsEvents?.isLive(paneId)) {
+            window.fsEvents.whenPatched(paneId).then(onLoaded);
+            return;
+        }
+
         pane.addEventListener('paneContentLoaded', onLoaded);
         loadPaneContent(paneId);
     });
@@ -623,8 +743,19 @@ function addNewTabToPane(paneId) {
 }
 
 
+function formatFolderSize(sizeBytes) {
+    if (sizeBytes < 1024) return `${sizeBytes} B`;
+    if (sizeBytes < 1024 * 1024) return `${(sizeBytes / 1024).toFixed(1)} KB`;
+    if (sizeBytes < 1024 * 1024 * 1024) return `${(sizeBytes / (1024 * 1024)).toFixed(2)} MB`;
+    return `${(sizeBytes / (1024 * 1024 * 1024)).toFixed(2)} GB`;
+}
+
+
 /**
- * Queues and fetches folder size for a directory row and updates its size cell.
+ * Fetches the folder size for a directory row and updates its size cell (and the preview line).
+ * The server streams running totals as NDJSON, so the cell counts up while the tree is walked.
+ * Only one calculation runs at a time: asking for another folder aborts the previous one,
+ * which also cancels the walk on the server.
  * @param {string} logicalPath - The UI path of the directory (e.g., /home/user/folder)
  */
 window.queueFolderSizeOverlay = async function (logicalPath) {
@@ -632,62 +763,76 @@ window.queueFolderSizeOverlay = async function (logicalPath) {
 
     const fullPath = '/hostroot' + logicalPath;
 
-    if (!window._folderSizeQueue) window._folderSizeQueue = [];
-    if (!window._folderSizeBusy) window._folderSizeBusy = false;
-
-    window._folderSizeQueue.push({ fullPath, logicalPath });
-
-    if (window._folderSizeBusy) return;
-
-    window._folderSizeBusy = true;
-
-    (async function processFolderSizeQueue() {
-        while (window._folderSizeQueue.length > 0) {
-            const { fullPath, logicalPath } = window._folderSizeQueue.shift();
-
-            try {
-                const res = await fetch(`/api/preview/foldersize?path=${encodeURIComponent(fullPath)}`);
-                const data = await res.json();
+    if (window._folderSizeRequest) {
+        window._folderSizeRequest.controller.abort();
+    }
+    const request = { logicalPath, controller: new AbortController() };
+    window._folderSizeRequest = request;
 
-                const selector = `.file-row[data-path="${logicalPath}"]`;
-                const row = document.querySelector(selector);
-                const sizeCell = row?.querySelector('.file-cell.file-size');
+    const findSizeCell = () => {
+        const row = document.querySelector(`.file-row[data-path="${CSS.escape(logicalPath)}"]`);
+        return { row, sizeCell: row?.querySelector('.file-cell.file-size') };
+    };
+    const originalText = findSizeCell().sizeCell?.textContent;
 
-                if (!sizeCell) continue;
+    const showSize = (data) => {
+        const { row, sizeCell } = findSizeCell();
+        const sizeText = formatFolderSize(data.total_size_bytes) + (data.done ? '' : '…');
 
-                if (data.error) {
-                    sizeCell.textContent = 'ERR';
-                    row?.classList.add('error-highlight');
-                } else {
-                    const sizeBytes = data.total_size_bytes;
-                    let sizeText;
+        if (sizeCell) {
+            sizeCell.textContent = sizeText;
+            row.classList.remove('error-highlight');
+        }
 
-                    if (sizeBytes < 1024) {
-                        sizeText = `${sizeBytes} B`;
-                    } else if (sizeBytes < 1024 * 1024) {
-                        sizeText = `${(sizeBytes / 1024).toFixed(1)} KB`;
-                    } else {
-                        sizeText = `${(sizeBytes / (1024 * 1024)).toFixed(2)} MB`;
-                    }
+        // Additionally update preview panel, if it's for the same folder
+        const previewSizeEl = document.getElementById('folder-size-line');
+        if (previewSizeEl && previewSizeEl.dataset?.path === logicalPath) {
+            previewSizeEl.textContent = `Size: ${sizeText}`;
+        }
+    };
 
-                    sizeCell.textContent = sizeText;
-                    row?.classList.remove('error-highlight');
+    const showError = () => {
+        const { row, sizeCell } = findSizeCell();
+        if (sizeCell) sizeCell.textContent = 'ERR';
+        row?.classList.add('error-highlight');
+    };
 
-                    // ✅ Additionally update preview panel, if it's for the same folder
-                    const previewSizeEl = document.getElementById('folder-size-line');
-                    const previewPath = previewSizeEl?.dataset?.path;
-                    if (previewSizeEl && previewPath === logicalPath) {
-                        previewSizeEl.textContent = `Size: ${sizeText}`;
-                    }
-                }
+    try {
+        const res = await fetch(`/api/preview/foldersize?path=${encodeURIComponent(fullPath)}`, {
+            signal: request.controller.signal
+        });
+        if (!res.ok) {
+            showError();
+            return;
+        }
 
-            } catch (err) {
-                const row = document.querySelector(`.file-row[data-path="${logicalPath}"]`);
-                const sizeCell = row?.querySelector('.file-cell.file-size');
-                if (sizeCell) sizeCell.textContent = 'ERR';
+        const reader = res.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            const lines = buffer.split('\n');
+            buffer = lines.pop();
+            for (const line of lines) {
+                if (!line.trim()) continue;
+                const data = JSON.parse(line);
+                if (data.error) showError();
+                else showSize(data);
             }
         }
-        window._folderSizeBusy = false;
-    })();
-
+    } catch (err) {
+        if (err.name === 'AbortError') {
+            // Selection moved on before the walk finished: don't leave a partial size behind
+            const { sizeCell } = findSizeCell();
+            if (sizeCell && originalText !== undefined) sizeCell.textContent = originalText;
+        } else {
+            showError();
+        }
+    } finally {
+        if (window._folderSizeRequest === request) window._folderSizeRequest = null;
+    }
 };
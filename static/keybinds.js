@@ -29,6 +29,8 @@ const keys = [
     { key: "o",         modifiers: ["ctrl"],    handler: openFileHandler },
     { key: "n",         modifiers: ["meta"],    handler: handleNewDirFile },
     { key: "n",         modifiers: ["ctrl"],    handler: handleNewDirFile },
+    { key: "f",         modifiers: ["meta"],    handler: startIndexSearch },
+    { key: "f",         modifiers: ["ctrl"],    handler: startIndexSearch },
     //{ key: "Enter",   modifiers: [],          handler: openFileHandler }, //windows way
 
     //buttons (bottom row) attached to shift-Z->M
@@ -49,7 +51,11 @@ const keys = [
 
     //toggle hidden files
     { key: ".",         modifiers: ["meta", "shift"], handler: toggleDotfilesHandler },
-    { key: ":",         modifiers: ["ctrl", "shift"], handler: toggleDotfilesHandler }
+    { key: ":",         modifiers: ["ctrl", "shift"], handler: toggleDotfilesHandler },
+
+    //toggle list/grid (thumbnail) view
+    { key: "G",         modifiers: ["meta", "shift"], handler: toggleGridViewHandler },
+    { key: "G",         modifiers: ["ctrl", "shift"], handler: toggleGridViewHandler }
 ];
 
 function void_(){
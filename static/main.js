@@ -44,6 +44,8 @@ document.addEventListener('dblclick', function(event) {
 
 document.addEventListener('DOMContentLoaded', () => {
     ['left-pane', 'right-pane'].forEach(paneId => {
+        initPaneScrollPaging(paneId);
+
         const input = document.querySelector(`#${paneId} .path-input`);
         const savedPath = localStorage.getItem(`pane_${paneId}_last_path`) || '/';
         if (input) input.value = savedPath;
@@ -60,6 +62,9 @@ document.addEventListener('DOMContentLoaded', () => {
     });
 });
 
+// tus upload URL -> saved path, for focusing the uploaded files afterwards
+const tusSavedPaths = new Map();
+
 document.addEventListener('DOMContentLoaded', () => {
     window.uppy = new Uppy.Uppy({ autoProceed: false })  // UMD style
 
@@ -69,11 +74,17 @@ document.addEventListener('DOMContentLoaded', () => {
             showProgressDetails: true,
             proudlyDisplayPoweredByUppy: false
         })
-        .use(Uppy.XHRUpload, {
-            endpoint: '/up',
-            fieldName: 'file',
-            formData: true,
-            bundle: false
+        // Resumable: an interrupted upload continues from the last byte the server has
+        .use(Uppy.Tus, {
+            endpoint: '/up/tus',
+            chunkSize: 64 * 1024 * 1024,
+            retryDelays: [0, 1000, 3000, 5000, 10000],
+            removeFingerprintOnSuccess: true,
+            onAfterResponse(req, res) {
+                // The final PATCH reports where the file was saved (renamed on conflicts)
+                const saved = res.getHeader('X-Saved-Path');
+                if (saved) tusSavedPaths.set(req.getURL(), decodeURIComponent(saved));
+            }
         });
 
         uppy.on('file-added', (file) => {
@@ -89,11 +100,11 @@ document.addEventListener('DOMContentLoaded', () => {
         uppy.on('upload-error', (file, error, response) => {
             console.warn(`Upload error for ${file.name}:`, error);
         
-            const status = response?.status;
-            const body = response?.body;
+            const status = error?.originalResponse?.getStatus?.();
+            const body = error?.originalResponse?.getBody?.();
         
-            if (status === 409 && body?.error) {
-                alert(`Upload failed: ${body.error} (${body.filename})`);
+            if (status === 409 && body) {
+                alert(`Upload failed: ${body} (${file.name})`);
             } else {
                 alert(`Upload failed for ${file.name}: ${error}`);
             }
@@ -104,8 +115,10 @@ document.addEventListener('DOMContentLoaded', () => {
             const uploadStartedPath = getFocusedPanePath();
         
             for (const file of result.successful) {
-                if (file.response && file.response.body?.saved) {
-                    uploadedPaths.push(...file.response.body.saved);
+                const saved = tusSavedPaths.get(file.response?.uploadURL);
+                if (saved) {
+                    uploadedPaths.push(saved);
+                    tusSavedPaths.delete(file.response.uploadURL);
                 }
             }
         
@@ -191,6 +204,15 @@ document.addEventListener('DOMContentLoaded', () => {
             console.log(`Dropped ${files.length} file(s) to: ${logicalPath}`);
             files.forEach(f => console.log(`→ ${f.name}`));
             console.log(`Upload target path: ${targetPath}`);
+
+            // Lots of small files: a few batch requests instead of one tus upload per file
+            if (window.batchUpload?.shouldBatch(files)) {
+                batchUpload.upload(files, targetPath).then(() => {
+                    retainCurrentSelectionsAndFileFocuses();
+                    refreshPanes(pane.id, true);
+                });
+                return;
+            }
         
             const uppyState = uppy.getState();
             if (!uppyState.currentUploads || Object.keys(uppyState.currentUploads).length === 0) {
@@ -442,12 +442,33 @@ async function handleVideoPreview(itemPath, itemName) {
         return;
     }
 
+    // Step 1b: Browser-native files play straight from /raw and seek with Range requests;
+    // files that need a full transcode play from cached segments when the browser can
+    const directPlay = metadata.direct_play === true;
+    let segmentManifest = null;
+    if (!directPlay) {
+        try {
+            const res = await fetch(`/video/segments/manifest?v=${encodeURIComponent(metadata.validated_path)}`);
+            if (res.ok) segmentManifest = await res.json();
+        } catch (err) {
+            console.warn("[handleVideoPreview] Segment manifest unavailable, using the plain stream:", err);
+        }
+    }
+    const segmented = typeof SegmentPlayer === 'function' && SegmentPlayer.isSupported(segmentManifest);
+
     // Step 2: Build the preview HTML
+    const rawUrl = '/raw/' + metadata.validated_path.replace(/^\/+/, '').split('/').map(encodeURIComponent).join('/');
+    let videoSource = `<source src="/video?v=${encodeURIComponent(metadata.validated_path)}" type="video/mp4">`;
+    if (directPlay) videoSource = `<source src="${rawUrl}">`;
+    else if (segmented) videoSource = '';
+    // Poster frame is a cached keyframe grab, shown while the stream starts
+    const posterUrl = `/video/poster?v=${encodeURIComponent(metadata.validated_path)}`;
     const videoHtml = `
         <div class="video-wrapper">
-        <video id="videoPlayer" autoplay>
-            <source src="/video?v=${encodeURIComponent(metadata.validated_path)}" type="video/mp4">
+        <video id="videoPlayer" autoplay poster="${posterUrl}">
+            ${videoSource}
         </video>
+        <div id="scrubPreview" class="scrub-preview"><span></span></div>
         <div class="video-controls">
             <button id="playPause">⏸</button>
             <span id="currentTime">0:00</span>
@@ -497,6 +518,27 @@ async function handleVideoPreview(itemPath, itemName) {
             width: 80px;
             flex-shrink: 0;
         }
+
+        .scrub-preview {
+            position: absolute;
+            bottom: 44px;
+            display: none;
+            border: 1px solid rgba(255, 255, 255, 0.8);
+            background-color: black;
+            background-repeat: no-repeat;
+            pointer-events: none;
+        }
+
+        .scrub-preview span {
+            position: absolute;
+            bottom: 2px;
+            left: 0;
+            right: 0;
+            text-align: center;
+            font: 11px sans-serif;
+            color: white;
+            text-shadow: 0 0 2px black;
+        }
     `;
     if (!document.getElementById('video-preview-style')) {
         document.querySelector('head').insertAdjacentHTML('beforeend', `<style id="video-preview-style">${minifyCSS(videostyles)}</style>`)
@@ -513,6 +555,12 @@ async function handleVideoPreview(itemPath, itemName) {
     const seekBar = document.getElementById('seekBar');
     const volumeSlider = document.getElementById('volumeSlider');
 
+    let segmentPlayer = null;
+    if (segmented) {
+        segmentPlayer = new SegmentPlayer(video, metadata.validated_path, segmentManifest);
+        segmentPlayer.start();
+    }
+
     let seeking = false;
     const storedVolume = localStorage.getItem('video_volume');
     if (storedVolume !== null) {
@@ -543,11 +591,53 @@ async function handleVideoPreview(itemPath, itemName) {
         localStorage.setItem('video_volume', vol);
     });
 
+    // Scrub thumbnails: one sprite sheet of keyframes, loaded on the first hover
+    const scrubPreview = document.getElementById('scrubPreview');
+    let spriteLayout;
+    async function loadSpriteLayout() {
+        if (spriteLayout !== undefined) return spriteLayout;
+        spriteLayout = null;
+        try {
+            const res = await fetch(`/video/sprite/layout?v=${encodeURIComponent(metadata.validated_path)}`);
+            if (res.ok) {
+                spriteLayout = await res.json();
+                scrubPreview.style.width = `${spriteLayout.tile_width}px`;
+                scrubPreview.style.height = `${spriteLayout.tile_height}px`;
+                scrubPreview.style.backgroundImage = `url("/video/sprite?v=${encodeURIComponent(metadata.validated_path)}")`;
+            }
+        } catch (err) {
+            console.warn("[handleVideoPreview] Sprite layout unavailable:", err);
+        }
+        return spriteLayout;
+    }
+
+    seekBar.addEventListener('mousemove', async (e) => {
+        const layout = await loadSpriteLayout();
+        if (!layout) return;
+        const barRect = seekBar.getBoundingClientRect();
+        const wrapperRect = scrubPreview.parentElement.getBoundingClientRect();
+        const fraction = Math.min(1, Math.max(0, (e.clientX - barRect.left) / barRect.width));
+        const tile = Math.min(layout.tiles - 1, Math.floor(fraction * layout.tiles));
+        const col = tile % layout.columns;
+        const row = Math.floor(tile / layout.columns);
+        scrubPreview.style.backgroundPosition = `-${col * layout.tile_width}px -${row * layout.tile_height}px`;
+        const left = e.clientX - wrapperRect.left - layout.tile_width / 2;
+        scrubPreview.style.left = `${Math.min(Math.max(0, left), wrapperRect.width - layout.tile_width)}px`;
+        scrubPreview.firstElementChild.textContent = formatTime(fraction * metadata.duration_seconds);
+        scrubPreview.style.display = 'block';
+    });
+    seekBar.addEventListener('mouseleave', () => scrubPreview.style.display = 'none');
+
     let currentSeekOffset = 0;
     seekBar.addEventListener('mousedown', () => seeking = true);
     seekBar.addEventListener('mouseup', () => {
         seeking = false;
         const time = parseFloat(seekBar.value);
+        if (segmentPlayer || directPlay) {
+            // The whole timeline is addressable: seek in place, segments (or byte ranges) load around the playhead
+            video.currentTime = time;
+            return;
+        }
         const wasPlaying = !video.paused;
         currentSeekOffset = time;
     
@@ -601,6 +691,10 @@ async function handleVideoPreview(itemPath, itemName) {
     window._disposeActiveVideoPlayer = function () {
         console.log("Disposing video preview...");
         document.removeEventListener('keydown', handleKeySeek);
+        if (segmentPlayer) {
+            segmentPlayer.destroy();
+            segmentPlayer = null;
+        }
         if (video) {
             try {
                 video.pause();
@@ -0,0 +1,144 @@
+// static/segmentplayer.js
+
+// Plays a video from the server's segment cache (see videosegments.py) through MediaSource.
+// Segments are standalone fMP4 files of manifest.segment_seconds each; they're fetched
+// around the playhead and appended at index * segment_seconds, so the <video> element
+// has the real timeline and seeking is just video.currentTime = t.
+
+class SegmentPlayer {
+    static BUFFER_AHEAD_SECONDS = 30;
+    static KEEP_BEHIND_SECONDS = 60;
+
+    /**
+     * @param {HTMLVideoElement} video
+     * @param {string} serverPath - Full server path of the file (/hostroot/...)
+     * @param {object} manifest - Result of /video/segments/manifest
+     */
+    constructor(video, serverPath, manifest) {
+        this.video = video;
+        this.serverPath = serverPath;
+        this.manifest = manifest;
+        this.mediaSource = null;
+        this.sourceBuffer = null;
+        this.objectUrl = null;
+        this.appended = new Set();
+        this.loadingIndex = null;
+        this.controller = null;
+        this.destroyed = false;
+        this._onProgress = () => this.pump();
+    }
+
+    static isSupported(manifest) {
+        return !!(manifest?.segmented && window.MediaSource && MediaSource.isTypeSupported(manifest.mime));
+    }
+
+    start() {
+        this.mediaSource = new MediaSource();
+        this.objectUrl = URL.createObjectURL(this.mediaSource);
+        this.mediaSource.addEventListener('sourceopen', () => {
+            if (this.destroyed) return;
+            this.mediaSource.duration = this.manifest.duration;
+            this.sourceBuffer = this.mediaSource.addSourceBuffer(this.manifest.mime);
+            this.sourceBuffer.mode = 'segments';
+            this.pump();
+        }, { once: true });
+
+        this.video.addEventListener('seeking', this._onProgress);
+        this.video.addEventListener('timeupdate', this._onProgress);
+        this.video.src = this.objectUrl;
+    }
+
+    segmentUrl(index) {
+        return `/video/segments/${index}?v=${encodeURIComponent(this.serverPath)}`;
+    }
+
+    /**
+     * The first segment from the playhead on that isn't appended yet, within the look-ahead window.
+     */
+    nextIndex() {
+        const { segment_seconds, count } = this.manifest;
+        const now = this.video.currentTime;
+        const last = Math.min(count - 1, Math.floor((now + SegmentPlayer.BUFFER_AHEAD_SECONDS) / segment_seconds));
+        for (let index = Math.floor(now / segment_seconds); index <= last; index++) {
+            if (!this.appended.has(index)) return index;
+        }
+        return null;
+    }
+
+    async pump() {
+        if (this.destroyed || !this.sourceBuffer) return;
+
+        const index = this.nextIndex();
+        if (this.loadingIndex !== null) {
+            // A seek moved the playhead away from what we're loading: drop it and load the new spot
+            if (index !== null && index !== this.loadingIndex && !this.appended.has(this.loadingIndex)
+                    && Math.abs(index - this.loadingIndex) > 1) {
+                this.controller?.abort();
+            }
+            return;
+        }
+        if (index === null) {
+            this.maybeEnd();
+            return;
+        }
+
+        this.loadingIndex = index;
+        this.controller = new AbortController();
+        try {
+            const res = await fetch(this.segmentUrl(index), { signal: this.controller.signal });
+            if (!res.ok) throw new Error(`segment ${index}: HTTP ${res.status}`);
+            const data = await res.arrayBuffer();
+            if (this.destroyed) return;
+
+            await this.waitForBuffer();
+            this.sourceBuffer.timestampOffset = index * this.manifest.segment_seconds;
+            this.sourceBuffer.appendBuffer(data);
+            await this.waitForBuffer();
+            this.appended.add(index);
+            await this.trim();
+        } catch (err) {
+            if (err.name !== 'AbortError') console.warn('[SegmentPlayer]', err);
+        } finally {
+            this.loadingIndex = null;
+            this.controller = null;
+        }
+        this.pump();
+    }
+
+    waitForBuffer() {
+        if (!this.sourceBuffer.updating) return Promise.resolve();
+        return new Promise(resolve => this.sourceBuffer.addEventListener('updateend', resolve, { once: true }));
+    }
+
+    /**
+     * Frees what's well behind the playhead so long sessions don't hit the SourceBuffer quota.
+     */
+    async trim() {
+        const { segment_seconds } = this.manifest;
+        const keepFrom = this.video.currentTime - SegmentPlayer.KEEP_BEHIND_SECONDS;
+        const stale = [...this.appended].filter(index => (index + 1) * segment_seconds < keepFrom);
+        if (!stale.length) return;
+
+        this.sourceBuffer.remove(0, Math.floor(keepFrom / segment_seconds) * segment_seconds);
+        await this.waitForBuffer();
+        stale.forEach(index => this.appended.delete(index));
+    }
+
+    maybeEnd() {
+        if (this.mediaSource.readyState !== 'open' || this.sourceBuffer.updating) return;
+        // Appending again later (after a seek back) re-opens an ended MediaSource by itself
+        if (this.appended.has(this.manifest.count - 1)) {
+            this.mediaSource.endOfStream();
+        }
+    }
+
+    destroy() {
+        this.destroyed = true;
+        this.controller?.abort();
+        this.video.removeEventListener('seeking', this._onProgress);
+        this.video.removeEventListener('timeupdate', this._onProgress);
+        if (this.objectUrl) URL.revokeObjectURL(this.objectUrl);
+    }
+}
+
+window.SegmentPlayer = SegmentPlayer;
@@ -18,7 +18,7 @@ tmpl.file_row = function(item) {
     const itemName = item.name || ''; // Ensure name is not null/undefined
 
     return `<div class="${rowClasses}" data-item-type="${item.is_directory ? 'dir' : 'file'}" data-path="${itemPath}" data-item-name="${itemName}">
-                <div class="file-cell file-name">${item.name}</div>
+                <div class="file-cell file-name">${item.name}${item.location ? `<span class="file-location">${item.location}</span>` : ''}</div>
                 <div class="file-cell file-extension">${item.file_extension}</div>
                 <div class="file-cell file-size">${item.formatted_size}</div>
                 <div class="file-cell file-modified">${item.formatted_modified}</div>
@@ -0,0 +1,132 @@
+// static/thumbgrid.js
+
+// Grid (thumbnail) view for panes. The mode is kept per pane in localStorage and toggled
+// with Cmd/Ctrl+Shift+G. In grid mode every load streams /api/preview/image/thumbs for the
+// directory: the server renders all thumbnails on its worker pool and sends one NDJSON
+// line per image as it's ready, so the tiles fill in progressively. Thumbnails that are
+// cached already arrive in the first few milliseconds.
+
+window.thumbGrid = (function () {
+    const PANE_IDS = ['left-pane', 'right-pane'];
+
+    function viewModeKey(paneId) {
+        return `pane_${paneId}_view_mode`;
+    }
+
+    function isGrid(paneId) {
+        return localStorage.getItem(viewModeKey(paneId)) === 'grid';
+    }
+
+    function serverPath(uiPath) {
+        return uiPath === '/' ? '/hostroot/' : '/hostroot' + uiPath;
+    }
+
+    function setThumb(row, url) {
+        let img = row.querySelector('.file-thumb');
+        if (!img) {
+            img = document.createElement('img');
+            img.className = 'file-thumb';
+            img.loading = 'lazy';
+            img.alt = '';
+            row.insertBefore(img, row.firstChild);
+        }
+        if (img.getAttribute('src') !== url) img.src = url;
+    }
+
+    /**
+     * Puts the thumbnails received so far on rows that don't show one yet (e.g. a page loaded later).
+     */
+    function applyThumbs(pane) {
+        const thumbs = pane._thumbs;
+        if (!thumbs) return;
+        pane.querySelectorAll('.file-list-container .file-row').forEach(row => {
+            const url = thumbs.get(row.dataset.itemName);
+            if (url) setThumb(row, url);
+        });
+    }
+
+    function stop(pane) {
+        pane._thumbController?.abort();
+        pane._thumbController = null;
+    }
+
+    async function start(pane) {
+        stop(pane);
+        const listing = pane._listing;
+        if (!listing) return;
+
+        const controller = new AbortController();
+        pane._thumbController = controller;
+        pane._thumbs = new Map();
+
+        try {
+            const res = await fetch(`/api/preview/image/thumbs?path=${encodeURIComponent(serverPath(listing.path))}&size=thumb`,
+                                    { signal: controller.signal });
+            if (!res.ok || !res.body) return;
+
+            const reader = res.body.getReader();
+            const decoder = new TextDecoder();
+            let buffered = '';
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                buffered += decoder.decode(value, { stream: true });
+                const lines = buffered.split('\n');
+                buffered = lines.pop();
+
+                for (const line of lines) {
+                    if (!line.trim()) continue;
+                    const result = JSON.parse(line);
+                    if (!result.url) continue;
+                    pane._thumbs.set(result.name, result.url);
+                    const row = pane.querySelector(`.file-list-container .file-row[data-item-name="${CSS.escape(result.name)}"]`);
+                    if (row) setThumb(row, result.url);
+                }
+            }
+        } catch (err) {
+            if (err.name !== 'AbortError') console.warn('[thumbgrid] Thumbnail stream failed:', err);
+        } finally {
+            if (pane._thumbController === controller) pane._thumbController = null;
+        }
+    }
+
+    function apply(pane) {
+        const container = pane.querySelector('.file-list-container');
+        const grid = isGrid(pane.id);
+        container?.classList.toggle('grid-view', grid);
+        if (grid) {
+            start(pane);
+        } else {
+            stop(pane);
+            pane._thumbs = null;
+            pane.querySelectorAll('.file-thumb').forEach(img => img.remove());
+        }
+    }
+
+    /**
+     * Toggles list/grid view for the focused pane. Called by the Cmd/Ctrl+Shift+G keybinding.
+     */
+    function toggleGridViewHandler(event) {
+        if (typeof isoverlayvisible === 'function' && isoverlayvisible()) return;
+        const pane = document.querySelector('.pane-container.panefocus');
+        if (!pane) return;
+        try {
+            localStorage.setItem(viewModeKey(pane.id), isGrid(pane.id) ? 'list' : 'grid');
+        } catch (e) {
+            console.error(`Failed to save view mode for ${pane.id}:`, e);
+        }
+        apply(pane);
+    }
+
+    document.addEventListener('DOMContentLoaded', () => {
+        PANE_IDS.forEach(paneId => {
+            const pane = document.getElementById(paneId);
+            if (!pane) return;
+            pane.addEventListener('paneContentLoaded', () => apply(pane));
+            pane.addEventListener('paneContentAppended', () => applyThumbs(pane));
+        });
+    });
+
+    window.toggleGridViewHandler = toggleGridViewHandler;
+    return { isGrid, toggleGridViewHandler };
+})();
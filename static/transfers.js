@@ -0,0 +1,110 @@
+// static/transfers.js
+
+// Copy and move run as server-side transfer jobs (transfers.py). Progress arrives as
+// 'transfer_progress' events on the '/fs' socket and is shown in a small panel in the
+// bottom right corner, one line per job with a cancel button. Finished jobs stay listed
+// for a few seconds (longer when something went wrong).
+
+window.transfers = (function () {
+    const DONE_LINGER_MS = 4000;
+    const ERROR_LINGER_MS = 15000;
+    const jobs = new Map(); // job id -> last progress event
+    let listening = false;
+
+    function panel() {
+        let el = document.getElementById('transfer-panel');
+        if (!el) {
+            el = document.createElement('div');
+            el.id = 'transfer-panel';
+            document.body.appendChild(el);
+        }
+        return el;
+    }
+
+    function describe(job) {
+        const verb = { move: 'Moving', duplicate: 'Duplicating' }[job.kind] || 'Copying';
+        const name = job.sources.length === 1 ? job.sources[0].split('/').pop() : `${job.sources.length} items`;
+        const bytes = `${formatFolderSize(job.done_bytes)} / ${formatFolderSize(job.total_bytes)}`;
+        const rate = job.state === 'running' && job.bytes_per_second ? `, ${formatFolderSize(job.bytes_per_second)}/s` : '';
+        let status = `${job.done_files} / ${job.total_files} files, ${bytes}${rate}`;
+        if (job.state === 'queued') status = 'Queued';
+        if (job.state === 'done') status = `Done: ${job.done_files} files, ${formatFolderSize(job.done_bytes)}`;
+        if (job.state === 'cancelled') status = 'Cancelled';
+        if (job.state === 'failed') status = `Failed: ${job.error}`;
+        if (job.skipped) status += `, ${job.skipped} skipped (already there)`;
+        if (job.error_count) status += `, ${job.error_count} errors`;
+        return { title: `${verb} ${name}`, status };
+    }
+
+    function render() {
+        const el = panel();
+        el.innerHTML = '';
+        for (const job of jobs.values()) {
+            const { title, status } = describe(job);
+            const percent = job.total_bytes ? Math.min(100, 100 * job.done_bytes / job.total_bytes)
+                : (job.total_files ? 100 * job.done_files / job.total_files : 0);
+            const row = document.createElement('div');
+            row.className = `transfer-job transfer-${job.state}`;
+            row.innerHTML = `
+                <div class="transfer-title"></div>
+                <div class="transfer-bar"><div style="width: ${percent.toFixed(1)}%"></div></div>
+                <div class="transfer-status"></div>`;
+            row.querySelector('.transfer-title').textContent = title;
+            row.querySelector('.transfer-status').textContent = status;
+            if (job.errors?.length) row.title = job.errors.map(e => `${e.path}: ${e.error}`).join('\n');
+            if (job.state === 'queued' || job.state === 'running') {
+                const cancel = document.createElement('button');
+                cancel.textContent = '✕';
+                cancel.title = 'Cancel';
+                cancel.addEventListener('click', () => fetch(`/api/transfers/${job.id}/cancel`, { method: 'POST' }));
+                row.appendChild(cancel);
+            }
+            el.appendChild(row);
+        }
+        el.style.display = jobs.size ? 'block' : 'none';
+    }
+
+    function onProgress(job) {
+        const previous = jobs.get(job.id);
+        jobs.set(job.id, job);
+        const finished = ['done', 'failed', 'cancelled'].includes(job.state);
+        if (finished && previous?.state !== job.state) {
+            refreshPanes(null, true);
+            const linger = job.state === 'failed' || job.error_count ? ERROR_LINGER_MS : DONE_LINGER_MS;
+            setTimeout(() => { jobs.delete(job.id); render(); }, linger);
+        }
+        render();
+    }
+
+    function listen() {
+        const socket = window.fsEvents?.socket();
+        if (listening || !socket) return;
+        socket.on('transfer_progress', onProgress);
+        listening = true;
+    }
+
+    /**
+     * Starts a copy or move of file rows into the UI directory `destinationDir`.
+     */
+    async function submit(kind, items, destinationDir, conflict = 'skip') {
+        listen();
+        const sources = items.map(item => `/hostroot${item.dataset.path}`);
+        const destination = destinationDir === '/' ? '/hostroot' : `/hostroot${destinationDir}`;
+        try {
+            const res = await fetch('/api/transfers', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ kind, sources, destination, conflict })
+            });
+            const job = await res.json();
+            if (!res.ok) throw new Error(job.error || res.statusText);
+            if (!jobs.has(job.id)) onProgress(job);
+        } catch (err) {
+            openMessageBox(`<div class="message-content-text error-message">${kind === 'move' ? 'Move' : 'Copy'} failed: ${escapeHtml(err.message)}</div>`);
+        }
+    }
+
+    document.addEventListener('DOMContentLoaded', listen);
+
+    return { submit };
+})();
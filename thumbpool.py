@@ -0,0 +1,127 @@
+# thumbpool.py
+# Pool of worker processes that render image thumbnails.
+#
+# Pillow decoding is CPU-bound and holds the interpreter for long stretches, so a grid
+# of a few thousand photos would stall every other request under eventlet. The work is
+# handed to THUMB_WORKERS long-lived `python thumbpool.py` processes instead: one JSON
+# line in ({path, max_dim, output}), one JSON line back ({ok, error}). The pipes are
+# green, so waiting on a worker only parks the calling green thread. A worker that dies,
+# hangs past THUMB_TIMEOUT or answers with something other than a reply is killed and
+# replaced, so it can't hand a later job an earlier job's answer.
+
+import os
+import sys
+import json
+import logging
+import subprocess
+
+import eventlet
+import eventlet.queue
+
+logger = logging.getLogger(__name__)
+
+THUMB_WORKERS = int(os.environ.get('FLYINGFAWK_THUMB_WORKERS', str(max(1, min(4, (os.cpu_count() or 2) - 1)))))
+# Seconds a render may take before its worker is taken for hung and replaced
+THUMB_TIMEOUT = int(os.environ.get('FLYINGFAWK_THUMB_TIMEOUT', '60'))
+
+WORKER_SCRIPT = os.path.abspath(__file__)
+
+
+def _parse_reply(line):
+    """A worker's JSON reply line as a dict; None for anything else."""
+    try:
+        reply = json.loads(line)
+    except ValueError:
+        return None
+    return reply if isinstance(reply, dict) else None
+
+
+class ThumbnailPool:
+    def __init__(self, size=THUMB_WORKERS):
+        self.size = size
+        self._idle = eventlet.queue.LightQueue()
+        self._started = 0
+        self.rendered = 0
+        self.failed = 0
+        self.restarts = 0
+
+    def _spawn(self):
+        return subprocess.Popen(
+            [sys.executable, WORKER_SCRIPT],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            cwd=os.path.dirname(WORKER_SCRIPT),
+        )
+
+    def _checkout(self):
+        if self._idle.empty() and self._started < self.size:
+            self._started += 1
+            return self._spawn()
+        return self._idle.get()
+
+    def render(self, path, max_dim, output):
+        """Renders `path` into the JPEG `output` in a worker process; raises RuntimeError on failure."""
+        worker = self._checkout()
+        try:
+            request = json.dumps({'path': str(path), 'max_dim': max_dim, 'output': str(output)})
+            worker.stdin.write(request.encode('utf-8', 'surrogateescape') + b'\n')
+            worker.stdin.flush()
+            line = b''
+            with eventlet.Timeout(THUMB_TIMEOUT, False):
+                line = worker.stdout.readline()
+        except (OSError, ValueError) as e:
+            line = b''
+            logger.warning(f"thumbpool: worker {worker.pid} pipe failed: {e}")
+
+        reply = _parse_reply(line) if line else None
+        if reply is None:
+            # Worker died (e.g. a decoder crashed on a broken file), hung, or wrote
+            # something that isn't its reply: its pipe can't be trusted, replace it
+            if line:
+                logger.warning(f"thumbpool: worker {worker.pid} sent an unreadable reply: {line[:200]!r}")
+            self.restarts += 1
+            worker.kill()
+            worker.wait()
+            self._idle.put(self._spawn())
+            self.failed += 1
+            raise RuntimeError(f"thumbnail worker died or timed out while rendering {path}")
+
+        self._idle.put(worker)
+        if not reply.get('ok'):
+            self.failed += 1
+            raise RuntimeError(reply.get('error') or 'thumbnail rendering failed')
+        self.rendered += 1
+
+    def stats(self):
+        return {
+            'workers': self.size,
+            'started': self._started,
+            'idle': self._idle.qsize(),
+            'rendered': self.rendered,
+            'failed': self.failed,
+            'restarts': self.restarts,
+        }
+
+
+thumb_pool = ThumbnailPool()
+
+
+def _worker_main():
+    from pathlib import Path
+    from preview_img import render_image
+
+    # Replies go to the real stdout; anything a library prints lands on stderr instead
+    replies = sys.stdout
+    sys.stdout = sys.stderr
+    for line in sys.stdin.buffer:
+        job = json.loads(line)
+        try:
+            render_image(Path(job['path']), job['max_dim'], Path(job['output']))
+            reply = {'ok': True}
+        except Exception as e:
+            reply = {'ok': False, 'error': f"{type(e).__name__}: {e}"}
+        replies.write(json.dumps(reply) + '\n')
+        replies.flush()
+
+
+if __name__ == '__main__':
+    _worker_main()
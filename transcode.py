@@ -0,0 +1,400 @@
+# transcode.py
+# Central manager for every encoder process (ffmpeg / gst-launch) the app starts.
+#
+# - At most MAX_TRANSCODES processes run at once; the rest wait in a priority queue.
+#   Playback (what a viewer is waiting for) beats thumbnails, which beat prefetch, and a
+#   playback job that finds every slot taken preempts a running prefetch job.
+# - Identical requests (same key: path, offset, profile) join the running job instead of
+#   starting another. Stream output is fanned out from a shared backlog, so a late
+#   joiner still receives the stream from its first byte.
+# - A stream job's process is killed as soon as its last consumer (HTTP generator) closes.
+#
+# Job stats: /api/admin/transcodes
+
+import os
+import time
+import heapq
+import logging
+import itertools
+import threading
+import subprocess
+
+from flask import Blueprint, jsonify
+
+logger = logging.getLogger(__name__)
+
+MAX_TRANSCODES = int(os.environ.get('FLYINGFAWK_MAX_TRANSCODES', '3'))
+# Output kept per stream job for joiners / slow consumers before the encoder is paused
+BACKLOG_MAX_BYTES = int(os.environ.get('FLYINGFAWK_TRANSCODE_BACKLOG_MB', '32')) * 1024 * 1024
+READ_CHUNK = 64 * 1024
+# Finished jobs kept for the admin listing
+HISTORY_SIZE = 50
+
+PRIORITY_PLAYBACK = 0
+PRIORITY_THUMBNAIL = 5
+PRIORITY_PREFETCH = 10
+
+
+class TranscodeError(Exception):
+    pass
+
+
+class TranscodeJob:
+    def __init__(self, job_id, key, command, priority, kind, shell=False):
+        self.id = job_id
+        self.key = key
+        self.command = command
+        self.priority = priority
+        self.kind = kind            # 'stream' (stdout is served) or 'file' (writes its own output)
+        self.shell = shell
+        self.state = 'queued'       # queued -> running -> done / failed / killed
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.returncode = None
+        self.error = None
+        self.process = None
+        self.consumers = 0
+        self.joined = 0
+        self.bytes_out = 0
+        self.chunks = []            # stream backlog
+        self.first_chunk = 0        # index of chunks[0] in the whole stream
+        self.backlog_bytes = 0
+        self.positions = {}         # consumer id -> next chunk index
+        self.eof = False
+        self.cond = threading.Condition()
+
+    @property
+    def finished_or_killed(self):
+        return self.state in ('done', 'failed', 'killed')
+
+    @property
+    def joinable(self):
+        # Joiners need the stream from its start (the fMP4 header)
+        return not self.finished_or_killed and self.first_chunk == 0
+
+    def describe(self):
+        now = time.time()
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'state': self.state,
+            'priority': self.priority,
+            'key': [str(part) for part in self.key],
+            'pid': self.process.pid if self.process else None,
+            'consumers': self.consumers,
+            'joined': self.joined,
+            'bytes_out': self.bytes_out,
+            'queued_for': round((self.started or now) - self.created, 3),
+            'running_for': round((self.finished or now) - self.started, 3) if self.started else None,
+            'returncode': self.returncode,
+            'error': self.error,
+        }
+
+
+class TranscodeManager:
+    def __init__(self, max_jobs=MAX_TRANSCODES):
+        self.max_jobs = max_jobs
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._queue = []        # heap of (priority, seq, job)
+        self._running = set()
+        self._by_key = {}       # key -> active job
+        self._history = []
+        self.started = 0
+        self.joins = 0
+        self.preempted = 0
+        self.killed_orphans = 0
+
+    # --- public API --------------------------------------------------------
+
+    def stream(self, key, command, priority=PRIORITY_PLAYBACK, shell=False):
+        """
+        Returns a generator over the encoder's stdout. Joins a running job with the same key.
+        Closing the generator detaches; the last consumer to leave kills the process.
+        """
+        job, consumer = self._attach(key, command, priority, 'stream', shell)
+        return self._consume(job, consumer)
+
+    def run(self, key, command, priority=PRIORITY_PLAYBACK):
+        """
+        Runs a command that writes its own output (e.g. a segment file) and waits for it.
+        Raises TranscodeError if it fails, is preempted or killed.
+        """
+        job, consumer = self._attach(key, command, priority, 'file', False)
+        try:
+            with job.cond:
+                while not job.finished_or_killed:
+                    job.cond.wait()
+        finally:
+            self._detach(job, consumer, kill_if_orphaned=False)
+        if job.state != 'done':
+            raise TranscodeError(job.error or f"{job.command[0]} exited with {job.returncode}")
+
+    def promote(self, key, priority=PRIORITY_PLAYBACK):
+        """
+        Raises the priority of the active job for `key`, for callers that wait on its
+        result some other way (e.g. a cache producer). Returns False if there is none.
+        """
+        with self._lock:
+            job = self._by_key.get(key)
+            if job is None or job.finished_or_killed:
+                return False
+            self._raise_priority(job, priority)
+        self._schedule()
+        return True
+
+    def stats(self):
+        with self._lock:
+            queued = [job for _, _, job in sorted(self._queue) if job.state == 'queued']
+            return {
+                'max_jobs': self.max_jobs,
+                'running': [job.describe() for job in self._running],
+                'queued': [job.describe() for job in queued],
+                'recent': [job.describe() for job in reversed(self._history)],
+                'totals': {
+                    'started': self.started,
+                    'joins': self.joins,
+                    'preempted': self.preempted,
+                    'killed_orphans': self.killed_orphans,
+                },
+            }
+
+    # --- scheduling --------------------------------------------------------
+
+    def _attach(self, key, command, priority, kind, shell):
+        with self._lock:
+            job = self._by_key.get(key)
+            if job is not None and job.kind == kind and job.joinable:
+                self.joins += 1
+                job.joined += 1
+                self._raise_priority(job, priority)
+            else:
+                job = TranscodeJob(next(self._ids), key, command, priority, kind, shell)
+                self._by_key[key] = job
+                heapq.heappush(self._queue, (priority, job.id, job))
+
+            consumer = next(self._ids)
+            job.consumers += 1
+            with job.cond:
+                job.positions[consumer] = 0
+        self._schedule()
+        return job, consumer
+
+    def _raise_priority(self, job, priority):
+        """
+        Someone is now waiting on `job`: a queued job moves up the queue, and a running
+        one is no longer preempted as background work. Caller holds self._lock.
+        """
+        if priority >= job.priority:
+            return
+        job.priority = priority
+        if job.state == 'queued':
+            self._queue = [(priority if j is job else p, seq, j) for p, seq, j in self._queue]
+            heapq.heapify(self._queue)
+
+    def _schedule(self):
+        to_start = []
+        to_preempt = []
+        with self._lock:
+            while self._queue and len(self._running) < self.max_jobs:
+                _, _, job = heapq.heappop(self._queue)
+                if job.state != 'queued':
+                    continue
+                job.state = 'running'
+                self._running.add(job)
+                to_start.append(job)
+
+            if self._queue and self._queue[0][0] == PRIORITY_PLAYBACK:
+                # A viewer is waiting and all slots are busy: make room by dropping prefetch work
+                background = sorted((job for job in self._running
+                                     if job.state == 'running' and job.priority >= PRIORITY_PREFETCH),
+                                    key=lambda job: job.started or 0, reverse=True)
+                waiting = sum(1 for p, _, job in self._queue if p == PRIORITY_PLAYBACK and job.state == 'queued')
+                to_preempt = background[:waiting]
+
+        for job in to_preempt:
+            self.preempted += 1
+            self._kill(job, 'preempted by playback')
+        for job in to_start:
+            self._start(job)
+
+    def _start(self, job):
+        job.started = time.time()
+        self.started += 1
+        try:
+            job.process = subprocess.Popen(
+                job.command,
+                stdout=subprocess.PIPE if job.kind == 'stream' else subprocess.DEVNULL,
+                stderr=subprocess.PIPE,
+                shell=job.shell,
+            )
+        except (OSError, ValueError) as e:
+            logger.error(f"transcode: could not start job {job.id}: {e}")
+            self._finish(job, 'failed', error=str(e))
+            return
+
+        logger.debug(f"transcode: job {job.id} started (pid {job.process.pid}): {job.command}")
+        if job.kind == 'stream':
+            threading.Thread(target=self._pump_stdout, args=(job,), daemon=True).start()
+        else:
+            threading.Thread(target=self._wait_file_job, args=(job,), daemon=True).start()
+
+    def _pump_stdout(self, job):
+        """Reads the encoder's stdout into the shared backlog, pausing while consumers are behind."""
+        process = job.process
+        try:
+            while True:
+                with job.cond:
+                    while not job.finished_or_killed and self._unread_bytes(job) > BACKLOG_MAX_BYTES:
+                        job.cond.wait()
+                    if job.finished_or_killed:
+                        break
+                # Green pipe: returns whatever the encoder has written so far
+                chunk = process.stdout.read(READ_CHUNK)
+                with job.cond:
+                    if not chunk:
+                        job.eof = True
+                        job.cond.notify_all()
+                        break
+                    job.chunks.append(chunk)
+                    job.bytes_out += len(chunk)
+                    job.backlog_bytes += len(chunk)
+                    self._trim_backlog(job)
+                    job.cond.notify_all()
+        except (OSError, ValueError) as e:
+            logger.debug(f"transcode: job {job.id} stdout closed: {e}")
+        self._reap(job)
+
+    def _wait_file_job(self, job):
+        self._reap(job)
+
+    def _reap(self, job):
+        process = job.process
+        stderr = b''
+        try:
+            stderr = process.stderr.read() or b''
+        except (OSError, ValueError):
+            pass
+        try:
+            returncode = process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            returncode = process.wait()
+        if job.state == 'killed':
+            self._finish(job, 'killed', returncode=returncode)
+        elif returncode == 0:
+            self._finish(job, 'done', returncode=returncode)
+        else:
+            self._finish(job, 'failed', returncode=returncode,
+                         error=stderr.decode('utf8', 'replace')[-500:].strip() or None)
+
+    def _finish(self, job, state, returncode=None, error=None):
+        with self._lock:
+            if job.finished is not None:
+                return
+            if job.state != 'killed':
+                job.state = state
+            job.returncode = returncode
+            job.error = job.error or error
+            job.finished = time.time()
+            self._running.discard(job)
+            if self._by_key.get(job.key) is job:
+                del self._by_key[job.key]
+            self._history.append(job)
+            del self._history[:-HISTORY_SIZE]
+        with job.cond:
+            job.eof = True
+            job.cond.notify_all()
+        if job.state == 'failed':
+            logger.error(f"transcode: job {job.id} failed ({returncode}): {job.error}")
+        self._schedule()
+
+    def _kill(self, job, reason):
+        with self._lock:
+            if job.finished_or_killed:
+                return
+            was_queued = job.state == 'queued'
+            job.state = 'killed'
+            job.error = reason
+            if self._by_key.get(job.key) is job:
+                del self._by_key[job.key]
+        with job.cond:
+            job.cond.notify_all()
+
+        if was_queued or job.process is None:
+            self._finish(job, 'killed')
+            return
+        logger.debug(f"transcode: killing job {job.id} (pid {job.process.pid}): {reason}")
+        try:
+            job.process.terminate()
+        except OSError:
+            pass
+
+    # --- consumers ---------------------------------------------------------
+
+    @staticmethod
+    def _slowest(job):
+        return min(job.positions.values(), default=job.first_chunk + len(job.chunks))
+
+    @staticmethod
+    def _unread_bytes(job):
+        """Bytes the slowest consumer still has to read. Caller holds job.cond."""
+        return sum(len(chunk) for chunk in job.chunks[TranscodeManager._slowest(job) - job.first_chunk:])
+
+    @staticmethod
+    def _trim_backlog(job):
+        """
+        Drops chunks every consumer has read, but only once the backlog is over its limit:
+        until then the stream head is kept so identical requests can still join.
+        Caller holds job.cond.
+        """
+        readable = TranscodeManager._slowest(job) - job.first_chunk
+        drop = 0
+        while drop < readable and job.backlog_bytes > BACKLOG_MAX_BYTES:
+            job.backlog_bytes -= len(job.chunks[drop])
+            drop += 1
+        if drop:
+            del job.chunks[:drop]
+            job.first_chunk += drop
+
+    def _consume(self, job, consumer):
+        try:
+            while True:
+                with job.cond:
+                    while True:
+                        position = job.positions[consumer]
+                        if position < job.first_chunk + len(job.chunks):
+                            chunk = job.chunks[position - job.first_chunk]
+                            job.positions[consumer] = position + 1
+                            self._trim_backlog(job)
+                            job.cond.notify_all()
+                            break
+                        if job.eof or job.state in ('killed', 'failed'):
+                            return
+                        job.cond.wait()
+                yield chunk
+        finally:
+            self._detach(job, consumer, kill_if_orphaned=True)
+
+    def _detach(self, job, consumer, kill_if_orphaned):
+        with self._lock:
+            job.consumers -= 1
+            orphaned = job.consumers == 0 and not job.finished_or_killed and not job.eof
+        with job.cond:
+            job.positions.pop(consumer, None)
+            self._trim_backlog(job)
+            job.cond.notify_all()
+        if orphaned and kill_if_orphaned:
+            self.killed_orphans += 1
+            self._kill(job, 'all consumers disconnected')
+
+
+transcodes = TranscodeManager()
+
+transcode_bp = Blueprint('transcode', __name__, url_prefix='/api/admin')
+
+
+@transcode_bp.route('/transcodes')
+def transcode_stats():
+    return jsonify(transcodes.stats())
@@ -0,0 +1,453 @@
+# transfers.py
+# Background copy/move jobs for the Copy and Move buttons.
+#
+# - A job copies or moves a list of sources into a destination directory. At most
+#   TRANSFER_JOBS jobs run at once, the rest wait in submission order.
+# - A job walks its sources once, creating the target directories as it goes, then
+#   copies the files COPY_THREADS at a time on real threads (eventlet.tpool) through
+#   copyfast.copy_file: reflink, copy_file_range or sendfile where the filesystem
+#   supports them, a large-buffer loop where not. Moves are a rename when source and
+#   destination share a filesystem, and a copy followed by removal when they don't.
+# - 'duplicate' jobs copy their one source to the destination path itself (/api/duplicate).
+# - Progress {files, bytes, throughput, state} is pushed as 'transfer_progress' on the
+#   '/fs' Socket.IO namespace every TRANSFER_PROGRESS_INTERVAL seconds and on every state
+#   change, so the UI doesn't have to poll.
+# - Name conflicts follow the job's policy: 'skip' keeps what's there, 'overwrite'
+#   replaces files, 'rename' gives a top-level item a free name_2 style name. Directories
+#   are merged in the first two cases.
+#
+# Endpoints: POST /api/transfers (submit), GET /api/transfers (list),
+#            GET /api/transfers/<id>, POST /api/transfers/<id>/cancel
+
+import os
+import time
+import errno
+import shutil
+import logging
+import itertools
+from collections import OrderedDict
+
+import eventlet
+import eventlet.semaphore
+from eventlet import tpool, patcher
+from flask import Blueprint, request, jsonify
+
+from copyfast import copy_file, CopyCancelled
+from fsevents import FS_NAMESPACE
+
+logger = logging.getLogger(__name__)
+
+transfers_bp = Blueprint('transfers', __name__, url_prefix='/api/transfers')
+
+HOSTROOT = os.environ.get('GUI_ROOT', '/hostroot')
+TRANSFER_JOBS = int(os.environ.get('FLYINGFAWK_TRANSFER_JOBS', '2'))
+# Files of one job copied at the same time (each on a tpool thread; keep it within
+# EVENTLET_THREADPOOL_SIZE, 20 by default)
+COPY_THREADS = int(os.environ.get('FLYINGFAWK_COPY_THREADS', '8'))
+# Files handed to a thread at once: small files go in groups, large ones alone
+COPY_BATCH_FILES = 64
+COPY_BATCH_BYTES = 32 * 1024 * 1024
+TRANSFER_PROGRESS_INTERVAL = 0.5
+# Finished jobs kept for the listing
+HISTORY_SIZE = 50
+# Per-file errors kept on a job (the count is always complete)
+MAX_ERRORS = 100
+
+# Kinds accepted by POST /api/transfers; 'duplicate' jobs come from /api/duplicate
+TRANSFER_KINDS = ('copy', 'move')
+CONFLICT_POLICIES = ('skip', 'overwrite', 'rename')
+
+_native_threading = patcher.original('threading')
+
+
+def _same_item(source, target):
+    """True if `target` is `source` itself (same inode, whatever the path), symlinks not followed."""
+    try:
+        return os.path.samestat(os.lstat(source), os.lstat(target))
+    except OSError:
+        return False
+
+
+def _free_name(path):
+    number = 2
+    stem, ext = os.path.splitext(path)
+    candidate = path
+    while os.path.lexists(candidate):
+        candidate = f"{stem}_{number}{ext}"
+        number += 1
+    return candidate
+
+
+class TransferJob:
+    def __init__(self, job_id, kind, sources, destination, conflict):
+        self.id = job_id
+        self.kind = kind
+        self.sources = sources
+        self.destination = destination
+        self.conflict = conflict
+        self.state = 'queued'       # queued -> running -> done / failed / cancelled
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.error = None
+        self.cancel_requested = False
+        self.total_files = 0
+        self.total_bytes = 0
+        self.done_files = 0
+        self.done_bytes = 0
+        self.skipped = 0
+        self.error_count = 0
+        self.errors = []
+        self.methods = {}           # copy method -> files
+        # The copy threads update the counters at the same time; only they take it
+        self._counters_lock = _native_threading.Lock()
+
+    @property
+    def finished_or_cancelled(self):
+        return self.state in ('done', 'failed', 'cancelled')
+
+    def add_bytes(self, count):
+        with self._counters_lock:
+            self.done_bytes += count
+
+    def file_done(self, size=0, method=None, skipped=False):
+        """Counts a finished file; `size` is added for bytes not reported through add_bytes."""
+        with self._counters_lock:
+            self.done_files += 1
+            self.done_bytes += size
+            if skipped:
+                self.skipped += 1
+            if method is not None:
+                self.methods[method] = self.methods.get(method, 0) + 1
+
+    def add_error(self, path, error):
+        with self._counters_lock:
+            self.error_count += 1
+            if len(self.errors) < MAX_ERRORS:
+                self.errors.append({'path': path, 'error': str(error)})
+
+    def describe(self):
+        end = self.finished or time.time()
+        elapsed = end - self.started if self.started else 0
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'state': self.state,
+            'sources': self.sources,
+            'destination': self.destination,
+            'conflict': self.conflict,
+            'total_files': self.total_files,
+            'total_bytes': self.total_bytes,
+            'done_files': self.done_files,
+            'done_bytes': self.done_bytes,
+            'skipped': self.skipped,
+            'error_count': self.error_count,
+            'errors': self.errors[:20],
+            'error': self.error,
+            'methods': dict(self.methods),
+            'elapsed': round(elapsed, 2),
+            'bytes_per_second': int(self.done_bytes / elapsed) if elapsed > 0 else 0,
+            'created': self.created,
+        }
+
+
+class TransferManager:
+    def __init__(self, max_jobs=TRANSFER_JOBS, copy_threads=COPY_THREADS):
+        self.max_jobs = max_jobs
+        self.copy_threads = copy_threads
+        self.socketio = None
+        self._ids = itertools.count(1)
+        self._jobs = OrderedDict()  # id -> TransferJob, oldest first
+        self._slots = eventlet.semaphore.Semaphore(max_jobs)
+
+    def submit(self, kind, sources, destination, conflict='skip'):
+        job = TransferJob(next(self._ids), kind, sources, destination, conflict)
+        self._jobs[job.id] = job
+        self._prune()
+        eventlet.spawn_n(self._run, job)
+        logger.info(f"transfers: job {job.id} queued: {kind} {len(sources)} item(s) to {destination}")
+        self._emit(job)
+        return job
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def list(self):
+        return [job.describe() for job in reversed(self._jobs.values())]
+
+    def cancel(self, job_id):
+        job = self._jobs.get(job_id)
+        if job is not None and not job.finished_or_cancelled:
+            job.cancel_requested = True
+            if job.state == 'queued':
+                self._finish(job, 'cancelled')
+        return job
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished_or_cancelled]
+        for job_id in finished[:max(0, len(finished) - HISTORY_SIZE)]:
+            del self._jobs[job_id]
+
+    def _emit(self, job):
+        if self.socketio is not None:
+            self.socketio.emit('transfer_progress', job.describe(), namespace=FS_NAMESPACE)
+
+    def _tick(self, job):
+        while True:
+            eventlet.sleep(TRANSFER_PROGRESS_INTERVAL)
+            self._emit(job)
+
+    def _run(self, job):
+        with self._slots:
+            if job.finished_or_cancelled:
+                return
+            job.state = 'running'
+            job.started = time.time()
+            self._emit(job)
+            ticker = eventlet.spawn(self._tick, job)
+            try:
+                files, directories = tpool.execute(self._plan, job)
+                self._copy_files(job, files)
+                tpool.execute(self._finish_directories, job, directories)
+                state = 'cancelled' if job.cancel_requested else 'done'
+            except CopyCancelled:
+                state = 'cancelled'
+            except Exception as e:
+                logger.exception(f"transfers: job {job.id} failed")
+                job.error = str(e)
+                state = 'failed'
+            finally:
+                ticker.kill()
+            self._finish(job, state)
+
+    def _finish(self, job, state):
+        job.state = state
+        job.finished = time.time()
+        logger.info(f"transfers: job {job.id} {state}: {job.done_files}/{job.total_files} files, "
+                    f"{job.done_bytes} bytes, {job.skipped} skipped, {job.error_count} errors, methods {job.methods}")
+        for error in job.errors[:5]:
+            logger.warning(f"transfers: job {job.id}: {error['path']}: {error['error']}")
+        self._emit(job)
+
+    def _copy_files(self, job, files):
+        """Copies the planned files copy_threads at a time, in batches to keep the thread hand-offs cheap."""
+        def copy_batch(batch):
+            try:
+                tpool.execute(self._transfer_batch, job, batch)
+            except CopyCancelled:
+                pass
+
+        pool = eventlet.GreenPool(self.copy_threads)
+        batch, batch_bytes = [], 0
+        for entry in files:
+            batch.append(entry)
+            batch_bytes += entry[2]
+            if len(batch) >= COPY_BATCH_FILES or batch_bytes >= COPY_BATCH_BYTES:
+                if job.cancel_requested:
+                    break
+                pool.spawn_n(copy_batch, batch)
+                batch, batch_bytes = [], 0
+        if batch and not job.cancel_requested:
+            pool.spawn_n(copy_batch, batch)
+        pool.waitall()
+        if job.cancel_requested:
+            raise CopyCancelled()
+
+    # --- Everything below runs on tpool threads: plain os calls only, no logging ---
+
+    def _plan(self, job):
+        """
+        Walks the sources once: renames what a move can rename outright, creates the target
+        directories and returns (files [(source, target, size)], directories [(source, target)]).
+        """
+        files, directories = [], []
+        for source in job.sources:
+            if job.cancel_requested:
+                raise CopyCancelled()
+            if job.kind == 'duplicate':
+                target = job.destination
+            else:
+                target = os.path.join(job.destination, os.path.basename(source.rstrip(os.sep)))
+            if job.conflict == 'rename' and os.path.lexists(target):
+                target = _free_name(target)
+            elif _same_item(source, target):
+                # Would copy onto itself: 'overwrite' truncates it, 'skip' does nothing
+                job.add_error(source, OSError(errno.EINVAL, 'Source and target are the same', target))
+                continue
+            if job.kind == 'move' and not os.path.lexists(target):
+                try:
+                    handled = self._rename(source, target)
+                except OSError as e:
+                    job.add_error(source, e)
+                    handled = True
+                if handled:
+                    job.total_files += 1
+                    job.file_done()
+                    continue
+
+            if not os.path.isdir(source) or os.path.islink(source):
+                self._plan_file(job, files, source, target)
+                continue
+
+            for root, dirs, names in os.walk(source):
+                target_root = os.path.join(target, os.path.relpath(root, source))
+                try:
+                    os.makedirs(target_root, exist_ok=True)
+                except OSError as e:
+                    job.add_error(target_root, e)
+                    dirs[:] = []
+                    continue
+                directories.append((root, target_root))
+                # Symlinked directories show up in dirs but are copied as links
+                for name in [name for name in dirs if os.path.islink(os.path.join(root, name))]:
+                    dirs.remove(name)
+                    names.append(name)
+                for name in names:
+                    self._plan_file(job, files, os.path.join(root, name), os.path.join(target_root, name))
+        return files, directories
+
+    @staticmethod
+    def _plan_file(job, files, source, target):
+        try:
+            size = os.lstat(source).st_size
+        except OSError as e:
+            job.add_error(source, e)
+            return
+        files.append((source, target, size))
+        job.total_files += 1
+        job.total_bytes += size
+
+    @staticmethod
+    def _rename(source, target):
+        try:
+            os.rename(source, target)
+            return True
+        except OSError as e:
+            if e.errno == errno.EXDEV:
+                return False  # other filesystem: copy, then remove
+            raise
+
+    def _transfer_batch(self, job, batch):
+        for source, target, size in batch:
+            if job.cancel_requested:
+                raise CopyCancelled()
+            self._transfer_file(job, source, target, size)
+
+    def _transfer_file(self, job, source, target, size):
+        method = None
+        try:
+            overwrite = False
+            if os.path.lexists(target):
+                if job.conflict == 'skip':
+                    job.file_done(size, skipped=True)
+                    return
+                if _same_item(source, target):
+                    # A hard link or another path to the source: overwriting would empty it
+                    raise OSError(errno.EINVAL, 'Source and target are the same file', target)
+                overwrite = True
+            if job.kind == 'move' and self._rename(source, target):
+                # Merging into an existing directory on the same filesystem
+                job.add_bytes(size)
+                method = 'rename'
+            else:
+                method = copy_file(source, target, job.add_bytes, lambda: job.cancel_requested, overwrite)
+                if method == 'symlink':
+                    job.add_bytes(size)
+                if job.kind == 'move':
+                    os.remove(source)
+        except CopyCancelled:
+            raise
+        except OSError as e:
+            method = None
+            job.add_error(source, e)
+        job.file_done(method=method)
+
+    @staticmethod
+    def _finish_directories(job, directories):
+        # Bottom-up, so copying files into a directory doesn't bump its mtime afterwards
+        for root, target_root in reversed(directories):
+            try:
+                shutil.copystat(root, target_root)
+                if job.kind == 'move':
+                    os.rmdir(root)
+            except OSError as e:
+                if job.kind != 'move' or e.errno != errno.ENOTEMPTY:
+                    job.add_error(root, e)
+
+
+transfer_manager = TransferManager()
+
+
+def init_transfers(socketio):
+    transfer_manager.socketio = socketio
+
+
+def _resolve(path):
+    """Absolute path under /hostroot, or None."""
+    if not isinstance(path, str) or not path:
+        return None
+    hostroot = os.path.abspath(HOSTROOT)
+    resolved = os.path.normpath(path)
+    if resolved != hostroot and not resolved.startswith(hostroot + os.sep):
+        return None
+    return resolved
+
+
+@transfers_bp.route('', methods=['POST'])
+def submit_transfer():
+    """
+    Expected JSON: { "kind": "copy" | "move", "sources": ["/hostroot/..."],
+                     "destination": "/hostroot/dir", "conflict": "skip" | "overwrite" | "rename" }
+    """
+    data = request.get_json(silent=True) or {}
+    kind = data.get('kind')
+    conflict = data.get('conflict', 'skip')
+    if kind not in TRANSFER_KINDS:
+        return jsonify({"error": f"'kind' must be one of {', '.join(TRANSFER_KINDS)}."}), 400
+    if conflict not in CONFLICT_POLICIES:
+        return jsonify({"error": f"'conflict' must be one of {', '.join(CONFLICT_POLICIES)}."}), 400
+
+    destination = _resolve(data.get('destination'))
+    if destination is None or not os.path.isdir(destination):
+        return jsonify({"error": "'destination' must be an existing directory."}), 400
+
+    raw_sources = data.get('sources')
+    if not isinstance(raw_sources, list) or not raw_sources:
+        return jsonify({"error": "'sources' must be a non-empty list."}), 400
+    sources = []
+    real_destination = os.path.realpath(destination)
+    for raw in raw_sources:
+        source = _resolve(raw)
+        if source is None or not os.path.lexists(source):
+            return jsonify({"error": f"Source path does not exist: {raw}"}), 404
+        real_source = os.path.realpath(source)
+        if os.path.isdir(source) and (real_destination + os.sep).startswith(real_source + os.sep):
+            return jsonify({"error": f"Cannot {kind} a directory into itself: {raw}"}), 400
+        if os.path.dirname(source) == destination and (kind == 'move' or conflict != 'rename'):
+            # Only a renamed copy makes sense there: anything else targets the source itself
+            return jsonify({"error": f"Source is already in the destination: {raw}"}), 400
+        sources.append(source)
+
+    job = transfer_manager.submit(kind, sources, destination, conflict)
+    return jsonify(job.describe()), 202
+
+
+@transfers_bp.route('', methods=['GET'])
+def list_transfers():
+    return jsonify({'max_jobs': transfer_manager.max_jobs, 'jobs': transfer_manager.list()})
+
+
+@transfers_bp.route('/<int:job_id>', methods=['GET'])
+def get_transfer(job_id):
+    job = transfer_manager.get(job_id)
+    if job is None:
+        return jsonify({"error": "No such transfer."}), 404
+    return jsonify(job.describe())
+
+
+@transfers_bp.route('/<int:job_id>/cancel', methods=['POST'])
+def cancel_transfer(job_id):
+    job = transfer_manager.cancel(job_id)
+    if job is None:
+        return jsonify({"error": "No such transfer."}), 404
+    return jsonify(job.describe())
@@ -0,0 +1,325 @@
+# trash.py
+# Deleting without waiting for the disk: items are renamed into a trash directory on
+# their own filesystem and a background reaper unlinks them later.
+#
+# - The rename is atomic and costs the same for one file or a tree of a million, so
+#   the delete request (and the UI) returns at once. The trash directory is
+#   TRASH_DIR_NAME at the top of the filesystem the item lives on (as far up as
+#   /hostroot goes); where a rename there crosses a mount anyway (bind mounts of one
+#   filesystem) it falls back to one in the item's parent directory.
+# - Each trashed item has a state file under DATA_DIR/trash with its original path, so
+#   the trash survives a restart and items can be restored until they are reaped.
+# - The reaper greenthread unlinks items older than TRASH_RETENTION_HOURS, or purged
+#   ones right away, at no more than TRASH_REAP_RATE entries a second in small tpool
+#   batches, so a huge tree doesn't starve other I/O.
+#
+# trash_item/restore_item only do blocking os calls and may run on tpool threads
+# (batchops does); they leave logging to their callers.
+#
+# Endpoints: GET /api/trash (list), POST /api/trash/<id>/restore, POST /api/trash/purge
+# The delete itself is POST /api/delete (fileoperations.py) or a batch 'delete'.
+
+import os
+import json
+import time
+import uuid
+import errno
+import logging
+
+import eventlet
+import eventlet.queue
+from eventlet import tpool
+from flask import Blueprint, request, jsonify
+
+from appdata import DATA_DIR
+
+logger = logging.getLogger(__name__)
+
+trash_bp = Blueprint('trash', __name__, url_prefix='/api/trash')
+
+HOSTROOT = os.environ.get('GUI_ROOT', '/hostroot')
+TRASH_DIR_NAME = '.flyingfawk-trash'
+# Restorable for this long, then reaped; 0 reaps on the next pass
+TRASH_RETENTION_HOURS = float(os.environ.get('FLYINGFAWK_TRASH_RETENTION_HOURS', '24'))
+# Upper bound on files/directories unlinked per second by the reaper
+TRASH_REAP_RATE = float(os.environ.get('FLYINGFAWK_TRASH_REAP_RATE', '2000'))
+REAP_BATCH = 200
+REAP_INTERVAL_SECONDS = 60
+
+STATE_DIR = DATA_DIR / 'trash'
+STATE_DIR.mkdir(parents=True, exist_ok=True)
+
+
+def _state_path(entry_id):
+    return STATE_DIR / f"{entry_id}.json"
+
+
+def load_entry(entry_id):
+    try:
+        uuid.UUID(entry_id)
+        with open(_state_path(entry_id)) as f:
+            return json.load(f)
+    except (ValueError, OSError):
+        return None
+
+
+def _save_entry(entry):
+    tmp = _state_path(entry['id']).with_suffix('.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(entry, f)
+    os.replace(tmp, _state_path(entry['id']))
+
+
+def _drop_entry(entry_id):
+    try:
+        os.remove(_state_path(entry_id))
+    except FileNotFoundError:
+        pass
+
+
+def list_entries():
+    entries = []
+    for state_file in STATE_DIR.glob('*.json'):
+        entry = load_entry(state_file.stem)
+        if entry is not None:
+            entries.append(entry)
+    entries.sort(key=lambda entry: entry['trashed'], reverse=True)
+    return entries
+
+
+def trash_dir_for(path):
+    """Trash directory at the top of the filesystem holding `path`, within /hostroot."""
+    hostroot = os.path.abspath(HOSTROOT)
+    top = os.path.dirname(path)
+    device = os.stat(top).st_dev
+    while top != hostroot and top != os.path.dirname(top):
+        parent = os.path.dirname(top)
+        if os.stat(parent).st_dev != device:
+            break
+        top = parent
+    return os.path.join(top, TRASH_DIR_NAME)
+
+
+def _is_in_trash(path):
+    return TRASH_DIR_NAME in path.split(os.sep)
+
+
+def _rename_into(trash_dir, path, entry_id):
+    os.makedirs(trash_dir, mode=0o700, exist_ok=True)
+    target = os.path.join(trash_dir, entry_id)
+    os.rename(path, target)
+    return target
+
+
+def trash_item(path):
+    """Moves `path` to the trash; returns its entry. Raises OSError like os.rename."""
+    if not os.path.lexists(path):
+        raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), path)
+    if _is_in_trash(path):
+        raise OSError(errno.EINVAL, 'Already in the trash', path)
+
+    entry_id = uuid.uuid4().hex
+    is_dir = os.path.isdir(path) and not os.path.islink(path)
+    try:
+        trashed_path = _rename_into(trash_dir_for(path), path, entry_id)
+    except OSError as e:
+        if e.errno not in (errno.EXDEV, errno.EACCES, errno.EROFS, errno.EPERM):
+            raise
+        # The filesystem top isn't reachable by rename or writable: stay in the parent
+        trashed_path = _rename_into(os.path.join(os.path.dirname(path), TRASH_DIR_NAME), path, entry_id)
+
+    entry = {
+        'id': entry_id,
+        'original': path,
+        'name': os.path.basename(path),
+        'path': trashed_path,
+        'is_dir': is_dir,
+        'trashed': time.time(),
+        'purge': False,
+    }
+    try:
+        _save_entry(entry)
+    except OSError:
+        os.rename(trashed_path, path)
+        raise
+    return entry
+
+
+def _free_name(path):
+    number = 2
+    stem, ext = os.path.splitext(path)
+    candidate = path
+    while os.path.lexists(candidate):
+        candidate = f"{stem}_{number}{ext}"
+        number += 1
+    return candidate
+
+
+def restore_item(entry, rename_on_conflict=True):
+    """
+    Moves a trashed item back to where it was; returns the path it got. With
+    `rename_on_conflict` an occupied original path gives a name_2 style name instead
+    of FileExistsError. Missing parent directories are recreated.
+    """
+    destination = entry['original']
+    if os.path.lexists(destination):
+        if not rename_on_conflict:
+            raise FileExistsError(errno.EEXIST, os.strerror(errno.EEXIST), destination)
+        destination = _free_name(destination)
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    os.rename(entry['path'], destination)
+    _drop_entry(entry['id'])
+    return destination
+
+
+def _iter_unlinks(path):
+    """Yields once per entry removed from the tree at `path`, deepest first."""
+    if not os.path.isdir(path) or os.path.islink(path):
+        os.remove(path)
+        yield
+        return
+    for root, dirs, files in os.walk(path, topdown=False):
+        for name in files:
+            os.remove(os.path.join(root, name))
+            yield
+        for name in dirs:
+            child = os.path.join(root, name)
+            if os.path.islink(child):
+                os.remove(child)
+            else:
+                os.rmdir(child)
+            yield
+    os.rmdir(path)
+    yield
+
+
+def _unlink_some(unlinks, count):
+    """Advances the removal by up to `count` entries; returns how many it removed."""
+    removed = 0
+    for _ in unlinks:
+        removed += 1
+        if removed == count:
+            break
+    return removed
+
+
+class TrashReaper:
+    def __init__(self, rate=TRASH_REAP_RATE, retention_hours=TRASH_RETENTION_HOURS):
+        self.rate = rate
+        self.retention = retention_hours * 3600
+        self.reaping = None       # id of the entry being unlinked
+        self.reaped = 0
+        self._wakeup = eventlet.queue.LightQueue()
+        self._greenthread = None
+
+    def start(self):
+        if self._greenthread is None:
+            self._greenthread = eventlet.spawn(self._reap_forever)
+        return self._greenthread
+
+    def wake(self):
+        self._wakeup.put(None)
+
+    def purge(self, entry_ids=None):
+        """Marks entries (all of them without ids) for reaping now; returns how many."""
+        marked = 0
+        for entry in list_entries():
+            if entry_ids is not None and entry['id'] not in entry_ids:
+                continue
+            if not entry['purge']:
+                entry['purge'] = True
+                _save_entry(entry)
+            marked += 1
+        self.wake()
+        return marked
+
+    def due_entries(self):
+        cutoff = time.time() - self.retention
+        entries = [entry for entry in list_entries() if entry['purge'] or entry['trashed'] <= cutoff]
+        # Purged ones first, then oldest first
+        entries.sort(key=lambda entry: (not entry['purge'], entry['trashed']))
+        return entries
+
+    def _reap_forever(self):
+        while True:
+            try:
+                for entry in self.due_entries():
+                    self._reap(entry)
+            except Exception:
+                logger.exception("trash: reaper pass failed")
+            try:
+                self._wakeup.get(timeout=REAP_INTERVAL_SECONDS)
+            except eventlet.queue.Empty:
+                pass
+
+    def _reap(self, entry):
+        # Still there and not restored in the meantime?
+        if load_entry(entry['id']) is None:
+            return
+        self.reaping = entry['id']
+        started = time.time()
+        try:
+            if os.path.lexists(entry['path']):
+                unlinks = _iter_unlinks(entry['path'])
+                while True:
+                    batch_started = time.time()
+                    removed = tpool.execute(_unlink_some, unlinks, REAP_BATCH)
+                    self.reaped += removed
+                    if removed < REAP_BATCH:
+                        break
+                    # Stay under TRASH_REAP_RATE
+                    eventlet.sleep(max(0.0, REAP_BATCH / self.rate - (time.time() - batch_started)))
+            _drop_entry(entry['id'])
+            logger.info(f"trash: reaped {entry['original']} in {time.time() - started:.1f}s")
+        except OSError as e:
+            # Left in the trash; the next pass tries again
+            logger.warning(f"trash: could not reap {entry['path']} ({entry['original']}): {e}")
+        finally:
+            self.reaping = None
+
+
+trash_reaper = TrashReaper()
+
+
+def _describe(entry):
+    described = dict(entry)
+    described['expires'] = entry['trashed'] + trash_reaper.retention
+    described['reaping'] = entry['id'] == trash_reaper.reaping
+    return described
+
+
+@trash_bp.route('', methods=['GET'])
+def list_trash():
+    return jsonify({"entries": [_describe(entry) for entry in list_entries()]})
+
+
+@trash_bp.route('/<entry_id>/restore', methods=['POST'])
+def restore_trash(entry_id):
+    entry = load_entry(entry_id)
+    if entry is None:
+        return jsonify({"error": "No such trash entry."}), 404
+    if entry_id == trash_reaper.reaping or entry['purge']:
+        return jsonify({"error": "Item is already being deleted."}), 409
+    try:
+        restored = restore_item(entry)
+    except OSError as e:
+        logger.error(f"trash: restore of {entry['original']} failed: {e}")
+        return jsonify({"error": str(e)}), 500
+    logger.info(f"trash: restored {entry['original']} to {restored}")
+    return jsonify({"status": "success", "path": restored}), 200
+
+
+@trash_bp.route('/purge', methods=['POST'])
+def purge_trash():
+    """
+    Deletes trashed items for good, in the background.
+    Expected JSON: { "ids": ["<entry id>", ...] }, or no ids to empty the whole trash.
+    """
+    data = request.get_json(silent=True) or {}
+    entry_ids = data.get('ids')
+    if entry_ids is not None and (not isinstance(entry_ids, list)
+                                  or not all(isinstance(entry_id, str) for entry_id in entry_ids)):
+        return jsonify({"error": "'ids' must be a list of entry ids."}), 400
+    marked = trash_reaper.purge(set(entry_ids) if entry_ids is not None else None)
+    logger.info(f"trash: {marked} item(s) queued for purging")
+    return jsonify({"status": "purging", "count": marked}), 202
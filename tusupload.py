@@ -0,0 +1,286 @@
+# tusupload.py
+# Resumable uploads over the tus 1.0.0 protocol (core, creation, termination), which
+# Uppy's Tus plugin speaks.
+#
+# POST /up/tus creates an upload: the file goes to a hidden part file in its destination
+# directory, and its state (length, destination, metadata) is kept under
+# DATA_DIR/tus so uploads survive a restart. PATCH requests write the body straight
+# into the part file at Upload-Offset, as it arrives; the offset is the part file's size,
+# so whatever made it to disk before a dropped connection counts and the client resumes
+# from there (HEAD). When the last byte lands the part file is renamed to the final
+# name, which is atomic as both are in the same directory, and never replaces an
+# existing file: a taken name gets the name_2.ext treatment /up uses. Nothing is copied
+# twice.
+
+import os
+import json
+import time
+import uuid
+import base64
+import logging
+from urllib.parse import quote
+
+import eventlet.semaphore
+from flask import Blueprint, request, Response
+from werkzeug.exceptions import ClientDisconnected
+
+from appdata import DATA_DIR
+from updownapi import NameAllocator
+
+logger = logging.getLogger(__name__)
+
+tus_bp = Blueprint('tus', __name__, url_prefix='/up/tus')
+
+TUS_VERSION = '1.0.0'
+TUS_EXTENSIONS = 'creation,termination'
+HOSTROOT = os.environ.get('GUI_ROOT', '/hostroot')
+# 0 = no limit beyond the disk
+TUS_MAX_SIZE = int(os.environ.get('FLYINGFAWK_TUS_MAX_SIZE', '0'))
+# Unfinished uploads untouched for this long are dropped, part file and all
+TUS_EXPIRE_HOURS = float(os.environ.get('FLYINGFAWK_TUS_EXPIRE_HOURS', '72'))
+WRITE_CHUNK = 1024 * 1024
+
+STATE_DIR = DATA_DIR / 'tus'
+STATE_DIR.mkdir(parents=True, exist_ok=True)
+_locks = {}  # upload id -> Semaphore, one PATCH at a time per upload
+
+
+def _tus_response(status=204, **headers):
+    response = Response(status=status)
+    response.headers['Tus-Resumable'] = TUS_VERSION
+    response.headers['Cache-Control'] = 'no-store'
+    for name, value in headers.items():
+        response.headers[name.replace('_', '-')] = str(value)
+    return response
+
+
+def _tus_error(status, message):
+    response = _tus_response(status)
+    response.set_data(message)
+    response.mimetype = 'text/plain'
+    return response
+
+
+def parse_metadata(header):
+    """Upload-Metadata: comma separated `key base64(value)` pairs."""
+    metadata = {}
+    for pair in (header or '').split(','):
+        parts = pair.strip().split(' ', 1)
+        if not parts[0]:
+            continue
+        value = ''
+        if len(parts) == 2:
+            value = base64.b64decode(parts[1]).decode('utf-8')
+        metadata[parts[0]] = value
+    return metadata
+
+
+def _state_path(upload_id):
+    return STATE_DIR / f"{upload_id}.json"
+
+
+def load_upload(upload_id):
+    try:
+        uuid.UUID(upload_id)
+        with open(_state_path(upload_id)) as f:
+            return json.load(f)
+    except (ValueError, OSError):
+        return None
+
+
+def _save_upload(upload):
+    tmp = _state_path(upload['id']).with_suffix('.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(upload, f)
+    os.replace(tmp, _state_path(upload['id']))
+
+
+def _drop_upload(upload):
+    for path in (upload['part_path'], _state_path(upload['id'])):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+    _locks.pop(upload['id'], None)
+
+
+def upload_offset(upload):
+    try:
+        return os.path.getsize(upload['part_path'])
+    except OSError:
+        return None
+
+
+def expire_uploads():
+    """Drops unfinished uploads whose part file hasn't been written to in TUS_EXPIRE_HOURS."""
+    cutoff = time.time() - TUS_EXPIRE_HOURS * 3600
+    for state_file in STATE_DIR.glob('*.json'):
+        upload = load_upload(state_file.stem)
+        if upload is None:
+            continue
+        try:
+            last_write = os.path.getmtime(upload['part_path'])
+        except OSError:
+            last_write = upload['created']
+        if last_write < cutoff:
+            logger.info(f"tus: expiring unfinished upload {upload['id']} ({upload['destination']})")
+            _drop_upload(upload)
+
+
+def resolve_destination(target_path, relative_path):
+    """The final path for an upload, or None when it would land outside /hostroot."""
+    hostroot = os.path.abspath(HOSTROOT)
+    target_dir = os.path.normpath(target_path)
+    if target_dir != hostroot and not target_dir.startswith(hostroot + os.sep):
+        return None
+    destination = os.path.normpath(os.path.join(target_dir, relative_path))
+    if not destination.startswith(target_dir + os.sep):
+        return None
+    return destination
+
+
+def finish_upload(upload):
+    """Moves the complete part file into place; returns its path as /up reports it (URL-quoted)."""
+    # Same naming as /up: the free name is created with O_EXCL, then the part file
+    # replaces that empty placeholder, so nothing that appeared meanwhile is overwritten
+    fd, destination = NameAllocator().create(upload['destination'])
+    os.close(fd)
+    try:
+        os.replace(upload['part_path'], destination)
+    except OSError:
+        os.remove(destination)
+        raise
+    try:
+        os.remove(_state_path(upload['id']))
+    except FileNotFoundError:
+        pass
+    _locks.pop(upload['id'], None)
+    logger.info(f"tus: upload {upload['id']} saved as {destination}")
+    return quote('/' + os.path.relpath(destination, os.path.abspath(HOSTROOT)))
+
+
+@tus_bp.route('', methods=['OPTIONS'])
+def tus_options():
+    headers = {'Tus-Version': TUS_VERSION, 'Tus-Extension': TUS_EXTENSIONS}
+    if TUS_MAX_SIZE:
+        headers['Tus-Max-Size'] = TUS_MAX_SIZE
+    return _tus_response(204, **headers)
+
+
+@tus_bp.route('', methods=['POST'])
+def tus_create():
+    expire_uploads()
+
+    try:
+        length = int(request.headers.get('Upload-Length', ''))
+    except ValueError:
+        return _tus_error(400, 'Upload-Length is required')
+    if length < 0:
+        return _tus_error(400, 'Invalid Upload-Length')
+    if TUS_MAX_SIZE and length > TUS_MAX_SIZE:
+        return _tus_error(413, f'Upload exceeds {TUS_MAX_SIZE} bytes')
+
+    try:
+        metadata = parse_metadata(request.headers.get('Upload-Metadata'))
+    except ValueError:
+        return _tus_error(400, 'Invalid Upload-Metadata')
+    target_path = metadata.get('targetPath')
+    relative_path = metadata.get('relativePath') or metadata.get('filename') or metadata.get('name')
+    if not target_path or not relative_path:
+        return _tus_error(400, 'targetPath and filename metadata are required')
+
+    destination = resolve_destination(target_path, relative_path)
+    if destination is None:
+        return _tus_error(403, 'Invalid path')
+    if os.path.isdir(destination):
+        return _tus_error(409, 'Directory with that name already exists')
+
+    upload_id = uuid.uuid4().hex
+    directory, name = os.path.split(destination)
+    os.makedirs(directory, exist_ok=True)
+    # Hidden, in the destination directory, so the final rename stays on one filesystem
+    part_path = os.path.join(directory, f".{name}.{upload_id}.part")
+    fd = os.open(part_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+    os.close(fd)
+
+    upload = {
+        'id': upload_id,
+        'length': length,
+        'destination': destination,
+        'part_path': part_path,
+        'metadata': metadata,
+        'created': time.time(),
+    }
+    _save_upload(upload)
+    logger.info(f"tus: created upload {upload_id} for {destination} ({length} bytes)")
+
+    if length == 0:
+        saved = finish_upload(upload)
+        return _tus_response(201, Location=f"{request.path}/{upload_id}", Upload_Offset=0, X_Saved_Path=saved)
+    return _tus_response(201, Location=f"{request.path}/{upload_id}")
+
+
+@tus_bp.route('/<upload_id>', methods=['HEAD'])
+def tus_status(upload_id):
+    upload = load_upload(upload_id)
+    offset = upload_offset(upload) if upload else None
+    if offset is None:
+        return _tus_response(404)
+    return _tus_response(200, Upload_Offset=offset, Upload_Length=upload['length'])
+
+
+@tus_bp.route('/<upload_id>', methods=['PATCH'])
+def tus_patch(upload_id):
+    if request.headers.get('Content-Type') != 'application/offset+octet-stream':
+        return _tus_error(415, 'Content-Type must be application/offset+octet-stream')
+    upload = load_upload(upload_id)
+    if upload is None:
+        return _tus_response(404)
+
+    lock = _locks.setdefault(upload_id, eventlet.semaphore.Semaphore())
+    if not lock.acquire(blocking=False):
+        return _tus_error(409, 'Upload is already being written to')
+    try:
+        offset = upload_offset(upload)
+        if offset is None:
+            return _tus_response(404)
+        try:
+            requested_offset = int(request.headers.get('Upload-Offset', ''))
+        except ValueError:
+            return _tus_error(400, 'Upload-Offset is required')
+        if requested_offset != offset:
+            return _tus_error(409, f'Upload-Offset mismatch, the upload is at {offset}')
+
+        fd = os.open(upload['part_path'], os.O_WRONLY)
+        try:
+            while offset < upload['length']:
+                chunk = request.stream.read(min(WRITE_CHUNK, upload['length'] - offset))
+                if not chunk:
+                    break
+                view = memoryview(chunk)
+                while view:
+                    written = os.pwrite(fd, view, offset)
+                    offset += written
+                    view = view[written:]
+        except ClientDisconnected:
+            # What arrived is on disk; the client resumes from the new offset
+            logger.info(f"tus: upload {upload_id} interrupted at {offset} of {upload['length']}")
+        finally:
+            os.close(fd)
+
+        if offset < upload['length']:
+            return _tus_response(204, Upload_Offset=offset)
+        saved = finish_upload(upload)
+        return _tus_response(204, Upload_Offset=offset, X_Saved_Path=saved)
+    finally:
+        lock.release()
+
+
+@tus_bp.route('/<upload_id>', methods=['DELETE'])
+def tus_terminate(upload_id):
+    upload = load_upload(upload_id)
+    if upload is None:
+        return _tus_response(404)
+    _drop_upload(upload)
+    logger.info(f"tus: upload {upload_id} terminated")
+    return _tus_response(204)
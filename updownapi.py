@@ -1,43 +1,95 @@
 # updownapi.py
 import os
-from flask import Blueprint, request, send_file, current_app
+import shutil
+import logging
 
+import eventlet
+from eventlet import tpool
+from flask import Blueprint, request, Response, stream_with_context, current_app
+
+from fileserve import serve_file, content_disposition
+from zipstream import iter_zip, COMPRESSION_METHODS
+from fsevents import FS_NAMESPACE
+
+logger = logging.getLogger(__name__)
 
 updown_bp = Blueprint('updown', __name__)  # no url_prefix
-UPLOAD_DIR = os.path.join(os.getcwd(), 'uploads')
-os.makedirs(UPLOAD_DIR, exist_ok=True)
+HOSTROOT = os.environ.get('GUI_ROOT', '/hostroot')
+# Files of one /up/batch request written at the same time
+UPLOAD_WORKERS = int(os.environ.get('FLYINGFAWK_UPLOAD_WORKERS', '8'))
+COPY_CHUNK = 1024 * 1024
+
+
+class NameAllocator:
+    """
+    Picks free names for uploads: name.ext, name_2.ext, name_3.ext, ...
+    Each directory is listed once; candidates are checked against that listing in
+    memory and created with O_EXCL, so a name that appeared since is simply skipped.
+    """
+
+    def __init__(self):
+        self._taken = {}  # directory -> names in it (plus the ones handed out)
+
+    def _names(self, directory):
+        if directory not in self._taken:
+            try:
+                self._taken[directory] = set(os.listdir(directory))
+            except FileNotFoundError:
+                self._taken[directory] = set()
+        return self._taken[directory]
+
+    def create(self, path):
+        """Creates the first free variant of `path`; returns (fd, path)."""
+        directory, filename = os.path.split(path)
+        taken = self._names(directory)
+        stem, ext = os.path.splitext(filename)
+        number = 1
+        while True:
+            candidate = filename if number == 1 else f"{stem}_{number}{ext}"
+            number += 1
+            if candidate in taken:
+                continue
+            # Reserved before anything can yield, so concurrent saves never pick the same name
+            taken.add(candidate)
+            candidate_path = os.path.join(directory, candidate)
+            try:
+                return os.open(candidate_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644), candidate_path
+            except FileExistsError:
+                continue
+
+
+def _upload_target(target_path):
+    """The upload directory for a targetPath form value, or None if it's outside /hostroot."""
+    if not target_path:
+        return None
+    hostroot = os.path.abspath(HOSTROOT)
+    full_path = os.path.normpath(target_path)
+    if full_path != hostroot and not full_path.startswith(hostroot + os.sep):
+        return None
+    return full_path
 
-def stream_to_file(total_content_length, content_type, filename, content_length=None):
-    file_path = os.path.join(UPLOAD_DIR, filename)
-    current_app.logger.debug(f"Streaming upload to: {file_path}")
-    return open(file_path, 'wb')
 
-@updown_bp.before_app_request
-def set_stream_factory():
-    if request.method == 'POST' and request.path == '/up':
-        request.stream_factory = stream_to_file
+def _write_stream(fd, stream):
+    """Copies an uploaded part into `fd` and closes it. Runs on a tpool thread."""
+    with os.fdopen(fd, 'wb') as f:
+        shutil.copyfileobj(stream, f, COPY_CHUNK)
 
+
+# Plain multipart uploads; the UI uploads through the resumable /up/tus (tusupload.py)
 @updown_bp.route('/up', methods=['POST'])
 def upload_file():
-
-    print("=== UPLOAD DEBUG ===")
-    print("FILES:", request.files)
-    print("FORM:", request.form)
-    print("META:", request.form.to_dict())
-    print("====================")
-    
     target_path = request.form.get('targetPath')
     if not target_path:
         return {"error": "No target path provided"}, 400
 
-    full_path = os.path.normpath(target_path)
-    hostroot = os.path.abspath('/hostroot')
-
-    if not full_path.startswith(hostroot):
+    full_path = _upload_target(target_path)
+    if full_path is None:
         return {"error": "Invalid path"}, 403
 
     os.makedirs(full_path, exist_ok=True)
 
+    hostroot = os.path.abspath(HOSTROOT)
+    allocator = NameAllocator()
     saved_files = []
 
     for file_key in request.files:
@@ -45,19 +97,16 @@ def upload_file():
         relative_path = request.form.get('relativePath', file.filename)
         save_path = os.path.normpath(os.path.join(full_path, relative_path))
 
-        if not save_path.startswith(full_path):
+        if not save_path.startswith(full_path + os.sep):
             return {"error": "Invalid nested path"}, 403
 
         if os.path.isdir(save_path):
             return {"error": "Directory with that name already exists", "filename": file.filename}, 409
 
-        while os.path.exists(save_path):
-            name, ext = os.path.splitext(os.path.basename(save_path))
-            new_name = f"{name}_2{ext}"
-            save_path = os.path.join(os.path.dirname(save_path), new_name)
-
         os.makedirs(os.path.dirname(save_path), exist_ok=True)
-        file.save(save_path)
+        fd, save_path = allocator.create(save_path)
+        with os.fdopen(fd, 'wb') as f:
+            file.save(f)
 
         rel_path = os.path.relpath(save_path, hostroot)
         saved_files.append('/' + rel_path)
@@ -65,13 +114,133 @@ def upload_file():
     return {"status": "ok", "saved": saved_files}
 
 
+@updown_bp.route('/up/batch', methods=['POST'])
+def upload_batch():
+    """
+    Many files in one multipart request ('file' parts, optional 'relativePath' fields in
+    the same order), written concurrently. Names that are taken get _2, _3, ... instead
+    of failing. With a 'socketId' (the client's /fs Socket.IO sid), every finished file
+    is reported as an 'upload_progress' event {batch, name, saved | error, done, total}.
+    """
+    full_path = _upload_target(request.form.get('targetPath'))
+    if full_path is None:
+        return {"error": "Invalid or missing target path"}, 403
+
+    files = request.files.getlist('file')
+    relative_paths = request.form.getlist('relativePath')
+    socket_id = request.form.get('socketId')
+    batch_id = request.form.get('batchId', '')
+    socketio = current_app.extensions.get('socketio')
+
+    hostroot = os.path.abspath(HOSTROOT)
+    jobs = []
+    for index, file in enumerate(files):
+        relative_path = relative_paths[index] if index < len(relative_paths) else file.filename
+        save_path = os.path.normpath(os.path.join(full_path, relative_path or ''))
+        if not relative_path or not save_path.startswith(full_path + os.sep):
+            return {"error": "Invalid nested path", "filename": relative_path}, 403
+        jobs.append((relative_path, save_path, file))
+
+    allocator = NameAllocator()
+    results = []
+
+    def save(job):
+        relative_path, save_path, file = job
+        result = {'batch': batch_id, 'name': relative_path}
+        try:
+            os.makedirs(os.path.dirname(save_path), exist_ok=True)
+            fd, save_path = allocator.create(save_path)
+            try:
+                tpool.execute(_write_stream, fd, file.stream)
+            except Exception:
+                os.remove(save_path)
+                raise
+            result['saved'] = '/' + os.path.relpath(save_path, hostroot)
+        except OSError as e:
+            logger.warning(f"upload batch: failed to save {relative_path}: {e}")
+            result['error'] = str(e)
+        results.append(result)
+
+        if socket_id and socketio is not None:
+            socketio.emit('upload_progress', dict(result, done=len(results), total=len(jobs)),
+                          to=socket_id, namespace=FS_NAMESPACE)
+
+    pool = eventlet.GreenPool(UPLOAD_WORKERS)
+    for job in jobs:
+        pool.spawn_n(save, job)
+    pool.waitall()
+
+    saved = [result['saved'] for result in results if 'saved' in result]
+    failed = [{'name': result['name'], 'error': result['error']} for result in results if 'error' in result]
+    return {"status": "ok" if not failed else "partial", "saved": saved, "failed": failed}
+
+
+def _resolve_hostroot_path(filename):
+    """Maps the /down and /raw URL path to a file under /hostroot, or None if it's outside."""
+    hostroot = os.path.abspath(HOSTROOT)
+    safe_path = os.path.normpath('/' + filename.lstrip('/'))
+    if safe_path != hostroot and not safe_path.startswith(hostroot + os.sep):
+        return None
+    return safe_path
+
+
+@updown_bp.route('/down/zip', methods=['GET', 'POST'])
+def download_zip():
+    """
+    Streams a ZIP of one or more `path` values (files or directories, /hostroot/...).
+    POST takes the same fields as a form, for selections too long for a URL.
+    `compression` is 'store' (default) or 'deflate'; `name` overrides the archive name.
+    """
+    requested = request.values.getlist('path')
+    compression = request.values.get('compression', 'store')
+    if not requested:
+        return {"error": "No path provided"}, 400
+    if compression not in COMPRESSION_METHODS:
+        return {"error": f"Unknown compression: {compression}"}, 400
+
+    paths = []
+    for item in requested:
+        safe_path = _resolve_hostroot_path(item)
+        if safe_path is None:
+            return {"error": "Invalid path"}, 403
+        if not os.path.exists(safe_path):
+            return {"error": "File not found", "path": item}, 404
+        paths.append(safe_path)
+
+    # Entries are named relative to the directory holding the selection
+    base_dir = os.path.commonpath([os.path.dirname(path) for path in paths])
+    if len(paths) == 1:
+        default_name = os.path.basename(paths[0]) or 'archive'
+    else:
+        default_name = os.path.basename(base_dir) or 'archive'
+    archive_name = request.values.get('name') or f"{default_name}.zip"
+
+    response = Response(stream_with_context(iter_zip(paths, base_dir, compression)), mimetype='application/zip')
+    response.headers['Content-Disposition'] = content_disposition(archive_name, True)
+    response.headers['Cache-Control'] = 'no-store'
+    # Don't let a reverse proxy buffer the whole archive before passing it on
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
 @updown_bp.route('/down/<path:filename>', methods=['GET'])
 def download_file(filename):
-    hostroot = os.path.abspath('/hostroot')
-    safe_path = os.path.normpath('/' + filename.lstrip('/'))
+    safe_path = _resolve_hostroot_path(filename)
+    if safe_path is None:
+        return {"error": "Invalid path"}, 403
+    if not os.path.isfile(safe_path):
+        return {"error": "File not found"}, 404
+
+    return serve_file(safe_path, as_attachment=True)
+
 
-    hostroot = os.path.abspath('/hostroot')
-    if not safe_path.startswith(hostroot):
+@updown_bp.route('/raw/<path:filename>', methods=['GET'])
+def raw_file(filename):
+    """The file itself, inline, for media elements and viewers that range-seek into it."""
+    safe_path = _resolve_hostroot_path(filename)
+    if safe_path is None:
         return {"error": "Invalid path"}, 403
+    if not os.path.isfile(safe_path):
+        return {"error": "File not found"}, 404
 
-    return send_file(safe_path, as_attachment=True)
\ No newline at end of file
+    return serve_file(safe_path)
\ No newline at end of file
@@ -6,13 +6,13 @@
 
 
 import os
-import subprocess
 from flask import Blueprint, request, Response, stream_with_context, jsonify # Import jsonify
 import re
-import json
 import urllib.parse
 import time
 import logging
+from transcode import transcodes
+from videoprobe import plan_stream, get_duration, probe, choose_transcode_mode, can_direct_play, probe_cache, TRANSCODE_MODE_HEADER
 
 # Configure logging for this blueprint
 logger = logging.getLogger(__name__)
@@ -76,26 +76,10 @@ def get_video_metadata(filepath):
     Returns duration in seconds (float).
     Returns None if ffprobe fails or duration is not found/invalid.
     """
-    duration = None
-    try:
-        command = [
-            'ffprobe',
-            '-v', 'error', # Suppress verbose output
-            '-show_entries', 'format=duration', # Only get duration from format section
-            '-of', 'json', # Output in JSON format
-            filepath # Input file path
-        ]
-        # check=True raises CalledProcessError if ffprobe exits with a non-zero status
-        result = subprocess.run(command, capture_output=True, text=True, check=True)
-        metadata = json.loads(result.stdout)
-        # Safely get duration, default to 0 if not found
-        duration_str = metadata.get('format', {}).get('duration', '0')
-        duration = float(duration_str)
-        if duration < 0: duration = 0 # Ensure duration is not negative
-
-    except (FileNotFoundError, subprocess.CalledProcessError, json.JSONDecodeError, ValueError) as e:
-        logger.error(f"ffprobe error getting duration for {filepath}: {e}")
-        duration = None # Ensure duration is None on error
+    # Served from videoprobe's probe cache, shared with the stream endpoints
+    duration = get_duration(filepath)
+    if duration is None:
+        logger.error(f"ffprobe error getting duration for {filepath}")
 
     logger.debug(f"Metadata: Duration={duration}s")
     return duration
@@ -145,13 +129,21 @@ def get_video_metadata_api():
          # get_video_metadata already logs the ffprobe error
          return jsonify({"error": "Could not retrieve video metadata (e.g., duration). FFprobe failed."}), 500
 
+    info = probe(validated_path)
     # Return metadata as JSON
     return jsonify({
         "validated_path": validated_path, # Return the validated server path
-        "duration_seconds": duration
+        "duration_seconds": duration,
+        "transcode_mode": choose_transcode_mode(info),
+        "direct_play": can_direct_play(validated_path, info)
     }), 200
 
 
+@video_bp.route('/probecache/stats', methods=['GET'])
+def probe_cache_stats_api():
+    return jsonify(probe_cache.stats())
+
+
 @video_bp.route('/') # <--- STREAMING ENDPOINT (Root of the blueprint)
 def stream_video():
     """
@@ -204,88 +196,38 @@ def stream_video():
         seek_time = 0.0
 
 
+    transcode_mode, command = plan_stream(validated_path, seek_time)
+    file_stat = os.stat(validated_path)
+    stream_key = ('video', validated_path, file_stat.st_size, file_stat.st_mtime_ns, round(seek_time, 3), transcode_mode)
+
     def generate():
         """
         Generator function to stream video data chunk by chunk using FFmpeg.
         """
-        # FFmpeg command to transcode and stream the video
-        # -ss {seek_time} : Seeks to the specified time (applied before -i for faster seeking)
-        # -i {input_file} : Input file
-        # -f mp4 : Output format is MP4
-        # -vcodec libx264 : Video codec (H.264)
-        # -acodec aac : Audio codec (AAC)
-        # -movflags frag_keyframe+empty_moov : Ensures fragmented MP4 output suitable for streaming
-        # pipe:1 : Output to standard output (which Flask reads from)
-        command = [
-            'ffmpeg',
-            *(['-ss', f"{seek_time:.3f}"] if seek_time > 0 else []), # Add -ss only if seek_time > 0
-            '-i', validated_path,
-            '-f', 'mp4',
-            '-vcodec', 'libx264', # You might need to ensure libx264 is available in your FFmpeg build
-            '-preset', 'ultrafast',
-            '-acodec', 'aac',   # You might need to ensure aac encoder is available
-            '-movflags', 'frag_keyframe+empty_moov',
-            'pipe:1' # Output to stdout
-        ]
-
-        logger.debug(f"FFmpeg command: {' '.join(command)}")
-
-        process = None # Initialize process variable
+        # The command comes from videoprobe.plan_stream(): -c copy remux, audio-only
+        # re-encode or full libx264/aac transcode, depending on the source codecs.
+        # -ss before -i seeks on the input, output is fragmented MP4 on stdout.
+        logger.debug(f"FFmpeg command ({transcode_mode}): {' '.join(command)}")
+
+        # The encoder runs under the transcode manager: it counts against the global
+        # limit, an identical request (same file/offset/mode) joins this one, and the
+        # process is killed once every client reading it has disconnected.
+        stream = transcodes.stream(stream_key, command)
         try:
-            # Start the FFmpeg subprocess
-            process = subprocess.Popen(
-                command,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                bufsize=-1 # Use default buffer size
-            )
-
-            # Stream data chunk by chunk from FFmpeg's stdout
-            try:
-                while True:
-                    chunk = process.stdout.read(4096) # Read in chunks (e.g., 4KB)
-                    if not chunk:
-                        # No more data from stdout, process might have finished or errored
-                        break
-                    yield chunk # Yield the chunk to the Flask response
-
-            finally:
-                 # Ensure FFmpeg process is terminated if the client disconnects early
-                 # process.poll() returns the exit code, or None if still running
-                 if process and process.poll() is None:
-                      logger.warning("Client disconnected, terminating FFmpeg process.")
-                      process.terminate(); # Send SIGTERM
-                 if process:
-                     process.wait(); # Wait for the process to exit
-
-            # Read any remaining stderr output after the process finishes
-            if process:
-                 stderr_output = process.stderr.read().decode('utf8')
-                 if process.returncode != 0:
-                      # Log FFmpeg errors, but exclude termination signal (-15) which is expected on early disconnect
-                      if process.returncode != -15:
-                           logger.error('FFmpeg Error (subprocess):', stderr_output)
-                      else:
-                           logger.debug('FFmpeg process terminated by signal -15 (expected on client disconnect).')
-                 else:
-                      logger.debug('FFmpeg process finished successfully.')
-                 if stderr_output:
-                      logger.debug('FFmpeg stderr output:\n' + stderr_output)
-
-
-        except FileNotFoundError:
-            logger.error("Error: FFmpeg executable not found. Is FFmpeg installed in the container and in PATH?")
-            # You might want to yield an error message chunk here or return an error response
-            # For now, the stream will just end.
+            for chunk in stream:
+                yield chunk # Yield the chunk to the Flask response
         except Exception as e:
             logger.error(f"An unexpected error occurred during streaming: {e}")
-            # Handle other potential exceptions during subprocess management
+        finally:
+            stream.close()
+            logger.debug("FFmpeg stream closed.")
 
 
     # Set appropriate headers for video streaming
     headers = {
         "Content-Type": "video/mp4",
         "Accept-Ranges": "bytes",
+        TRANSCODE_MODE_HEADER: transcode_mode,
         # "Content-Length": os.path.getsize(validated_path) # Optional: include if you can get size without blocking
         # Note: Content-Length is hard to get accurately for transcoded streams without buffering the whole thing
     }
@@ -0,0 +1,314 @@
+# videoprobe.py
+# Decides how little work ffmpeg has to do to make a file playable in the browser.
+#
+# The streams are probed with ffprobe and one of three paths is picked:
+#   copy  - the streams are browser-safe already, only remux into fragmented MP4
+#   audio - the video stream is safe, only the audio is re-encoded to AAC
+#   full  - the video has to be re-encoded (libx264 + AAC)
+# The chosen mode is reported to the client in the X-Transcode-Mode header.
+#
+# Probe results are cached by (path, size, mtime_ns) in an in-process LRU, backed by
+# JSON files under DATA_DIR/probecache so they survive restarts. Repeat previews and
+# seeks then skip ffprobe's startup entirely. Concurrent requests for the same file
+# share a single ffprobe run.
+
+import os
+import json
+import hashlib
+import logging
+import subprocess
+from collections import OrderedDict
+
+import eventlet.event
+
+from appdata import DATA_DIR, data_path
+
+logger = logging.getLogger(__name__)
+
+TRANSCODE_MODE_HEADER = 'X-Transcode-Mode'
+
+MODE_COPY = 'copy'
+MODE_AUDIO = 'audio'
+MODE_FULL = 'full'
+
+# What every browser can decode out of a fragmented MP4
+BROWSER_VIDEO_CODECS = {'h264'}
+BROWSER_PIX_FMTS = {'yuv420p', 'yuvj420p'}
+BROWSER_AUDIO_CODECS = {'aac', 'mp3'}
+
+AUDIO_ONLY_EXTENSIONS = ['.mp3', '.m4a', '.aac', '.flac', '.wav', '.ogg', '.oga', '.opus']
+# Containers the browser opens itself; with copy-mode codecs these play straight from /raw
+DIRECT_PLAY_EXTENSIONS = ['.mp4', '.m4v', '.mov', '.mp3', '.m4a', '.aac']
+
+FRAGMENTED_MP4_FLAGS = 'frag_keyframe+empty_moov+default_base_moof'
+
+PROBE_CACHE_ENTRIES = int(os.environ.get('FLYINGFAWK_PROBE_CACHE_ENTRIES', '512'))
+PROBE_CACHE_DISK = os.environ.get('FLYINGFAWK_PROBE_CACHE_DISK', '1') == '1'
+PROBE_CACHE_DISK_ENTRIES = int(os.environ.get('FLYINGFAWK_PROBE_CACHE_DISK_ENTRIES', '5000'))
+# Keyframe positions are sampled from the start of the first video stream
+KEYFRAME_SAMPLE_SECONDS = 60
+
+
+def is_audio_only(path):
+    ext = os.path.splitext(path)[1].lower()
+    return ext in AUDIO_ONLY_EXTENSIONS
+
+
+def _run_ffprobe(path):
+    """
+    One ffprobe run for format, streams and the packet flags of the first
+    KEYFRAME_SAMPLE_SECONDS (packets are only demuxed, not decoded).
+    """
+    command = [
+        'ffprobe',
+        '-v', 'error',
+        '-show_format',
+        '-show_streams',
+        '-show_entries', 'packet=stream_index,pts_time,flags',
+        '-read_intervals', f"%+{KEYFRAME_SAMPLE_SECONDS}",
+        '-of', 'json',
+        path
+    ]
+    result = subprocess.run(command, capture_output=True, text=True, check=True)
+    raw = json.loads(result.stdout)
+
+    info = {
+        'format': raw.get('format', {}),
+        'streams': raw.get('streams', []),
+    }
+
+    try:
+        duration = float(info['format'].get('duration', 0))
+        info['duration'] = max(0.0, duration)
+    except (TypeError, ValueError):
+        info['duration'] = None
+
+    video = first_stream(info, 'video')
+    keyframes = []
+    if video is not None:
+        for packet in raw.get('packets', []):
+            if packet.get('stream_index') == video.get('index') and 'K' in packet.get('flags', '') \
+                    and packet.get('pts_time') not in (None, 'N/A'):
+                keyframes.append(round(float(packet['pts_time']), 3))
+    info['keyframes'] = keyframes
+    return info
+
+
+class ProbeCache:
+    """LRU of probe results keyed by (path, size, mtime_ns), optionally persisted as JSON files."""
+
+    def __init__(self, max_entries=PROBE_CACHE_ENTRIES, persist=PROBE_CACHE_DISK,
+                 max_disk_entries=PROBE_CACHE_DISK_ENTRIES):
+        self.max_entries = max_entries
+        self.persist = persist
+        self.max_disk_entries = max_disk_entries
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._inflight = {}  # key -> eventlet Event shared by concurrent callers
+        self._writes = 0
+
+    def get(self, path):
+        """Returns the probe result for `path` or None if it can't be probed."""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        key = (path, st.st_size, st.st_mtime_ns)
+
+        info = self._entries.get(key)
+        if info is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return info
+
+        waiting = self._inflight.get(key)
+        if waiting is not None:
+            return waiting.wait()
+
+        event = eventlet.event.Event()
+        self._inflight[key] = event
+        info = None
+        try:
+            info = self._load(key)
+            if info is not None:
+                self.disk_hits += 1
+            else:
+                self.misses += 1
+                try:
+                    info = _run_ffprobe(path)
+                except (FileNotFoundError, subprocess.CalledProcessError, json.JSONDecodeError) as e:
+                    logger.error(f"ffprobe failed for {path}: {e}")
+                    return None
+                self._save(key, info)
+            self._remember(key, info)
+            return info
+        finally:
+            del self._inflight[key]
+            event.send(info)
+
+    def stats(self):
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            'hits': self.hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'hit_ratio': round((self.hits + self.disk_hits) / lookups, 3) if lookups else None,
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'persist': self.persist,
+        }
+
+    def _remember(self, key, info):
+        self._entries[key] = info
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    @staticmethod
+    def _disk_path(key):
+        digest = hashlib.sha1(repr(key).encode('utf-8', 'surrogateescape')).hexdigest()
+        return data_path('probecache', digest[:2], digest + '.json')
+
+    def _load(self, key):
+        if not self.persist:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                info = json.load(f)
+            os.utime(path)  # pruning keeps the most recently used files
+            return info
+        except (OSError, ValueError):
+            return None
+
+    def _save(self, key, info):
+        if not self.persist:
+            return
+        try:
+            target = self._disk_path(key)
+            tmp = target.with_suffix(f".{os.getpid()}.tmp")
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(info, f)
+            os.replace(tmp, target)
+        except OSError as e:
+            logger.warning(f"videoprobe: could not persist probe result: {e}")
+            return
+
+        self._writes += 1
+        if self._writes % 100 == 0:
+            self._prune_disk()
+
+    def _prune_disk(self):
+        """Keeps the newest max_disk_entries files on disk."""
+        root = DATA_DIR / 'probecache'
+        files = []
+        for directory, _, names in os.walk(root):
+            for name in names:
+                full = os.path.join(directory, name)
+                try:
+                    files.append((os.stat(full).st_mtime, full))
+                except OSError:
+                    continue
+        files.sort(reverse=True)
+        for _, full in files[self.max_disk_entries:]:
+            try:
+                os.remove(full)
+            except OSError:
+                pass
+
+
+probe_cache = ProbeCache()
+
+
+def probe(path):
+    """
+    Format, streams, duration and a keyframe sample for a file, from the probe cache.
+    Returns {'format', 'streams', 'duration', 'keyframes'} or None if ffprobe fails.
+    """
+    return probe_cache.get(path)
+
+
+def get_duration(path):
+    info = probe(path)
+    return info.get('duration') if info else None
+
+
+def first_stream(info, codec_type):
+    """Returns the first stream of a type ('video' / 'audio'), skipping embedded cover art."""
+    for stream in (info or {}).get('streams', []):
+        if stream.get('codec_type') != codec_type:
+            continue
+        if codec_type == 'video' and stream.get('disposition', {}).get('attached_pic'):
+            continue
+        return stream
+    return None
+
+
+def choose_transcode_mode(info):
+    """Picks copy / audio / full for a probe result; anything unknown falls back to full."""
+    if not info:
+        return MODE_FULL
+
+    video = first_stream(info, 'video')
+    audio = first_stream(info, 'audio')
+
+    video_ok = video is None or (
+        video.get('codec_name') in BROWSER_VIDEO_CODECS and
+        video.get('pix_fmt') in BROWSER_PIX_FMTS
+    )
+    audio_ok = audio is None or audio.get('codec_name') in BROWSER_AUDIO_CODECS
+
+    if not video_ok:
+        return MODE_FULL
+    if not audio_ok:
+        return MODE_AUDIO
+    return MODE_COPY
+
+
+def can_direct_play(path, info):
+    """True when the browser can play the file as-is, range-seeking into it without ffmpeg."""
+    ext = os.path.splitext(path)[1].lower()
+    return ext in DIRECT_PLAY_EXTENSIONS and choose_transcode_mode(info) == MODE_COPY
+
+
+def build_ffmpeg_command(path, seek_time, mode, info=None):
+    """
+    ffmpeg command streaming `path` from `seek_time` as fragmented MP4 on stdout.
+    Files without a video stream get a tiny black video track so the <video> element can play them.
+    """
+    has_video = first_stream(info, 'video') is not None if info else not is_audio_only(path)
+
+    command = ['ffmpeg', '-v', 'error']
+    if seek_time and seek_time > 0:
+        command += ['-ss', f"{seek_time:.3f}"]
+    command += ['-i', path]
+
+    if has_video:
+        command += ['-map', '0:v:0', '-map', '0:a:0?']
+        if mode == MODE_FULL:
+            command += ['-vcodec', 'libx264', '-preset', 'ultrafast', '-tune', 'zerolatency']
+        else:
+            command += ['-vcodec', 'copy']
+    else:
+        command += [
+            '-f', 'lavfi',
+            '-t', '600',  # dummy length if duration unknown
+            '-i', 'color=size=16x16:rate=10:color=black',
+            '-shortest',
+            '-map', '1:v:0', '-map', '0:a:0',
+            '-vcodec', 'libx264', '-preset', 'ultrafast', '-tune', 'zerolatency',
+        ]
+
+    command += ['-acodec', 'copy' if mode == MODE_COPY else 'aac']
+    command += ['-f', 'mp4', '-movflags', FRAGMENTED_MP4_FLAGS, 'pipe:1']
+    return command
+
+
+def plan_stream(path, seek_time=0.0):
+    """Returns (mode, ffmpeg command) for streaming `path`."""
+    info = probe(path)
+    mode = choose_transcode_mode(info)
+    logger.debug(f"videoprobe: {path} -> {mode}")
+    return mode, build_ffmpeg_command(path, seek_time, mode, info)
@@ -0,0 +1,133 @@
+# videosegments.py
+# Segmented playback for sources that need a full transcode.
+#
+# The timeline is cut into fixed SEGMENT_SECONDS pieces; each piece is encoded on demand
+# into a standalone fragmented MP4 (its own init + fragments, timestamps starting at 0)
+# and kept in a size-bounded disk cache keyed by (path, size, mtime, index, profile).
+# The browser appends the pieces to a MediaSource at index * SEGMENT_SECONDS (see
+# static/segmentplayer.js), so seeking back to a watched region is a cache hit, and
+# viewers of the same file share segments. Serving a segment also starts encoding
+# the next PREFETCH_SEGMENTS in the background.
+
+import os
+import logging
+
+import eventlet
+
+from diskcache import DiskCache
+from transcode import transcodes, PRIORITY_PLAYBACK, PRIORITY_PREFETCH
+from videoprobe import probe, first_stream, choose_transcode_mode, MODE_FULL
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_SECONDS = 6
+PREFETCH_SEGMENTS = int(os.environ.get('FLYINGFAWK_SEGMENT_PREFETCH', '2'))
+SEGMENT_CACHE_MAX_BYTES = int(os.environ.get('FLYINGFAWK_SEGMENT_CACHE_MB', '2048')) * 1024 * 1024
+# Transcode modes served as segments; copy/audio remuxes are cheap to restart on seek
+SEGMENTED_MODES = set(filter(None, os.environ.get('FLYINGFAWK_SEGMENTED_MODES', MODE_FULL).split(',')))
+
+# Bumped whenever the encoder settings below change, so stale segments aren't reused
+SEGMENT_PROFILE = 'h264-main-aac-v1'
+VIDEO_MIME = 'video/mp4; codecs="avc1.4D4029, mp4a.40.2"'
+VIDEO_MIME_NO_AUDIO = 'video/mp4; codecs="avc1.4D4029"'
+
+segment_cache = DiskCache('segments', SEGMENT_CACHE_MAX_BYTES, suffix='.mp4')
+
+
+def _source_key(path):
+    st = os.stat(path)
+    return (path, st.st_size, st.st_mtime_ns)
+
+
+def get_manifest(path):
+    """
+    Describes the segmented stream for `path`:
+    {'segmented', 'transcode_mode', 'duration', 'segment_seconds', 'count', 'mime'}.
+    segmented is False when the file should use the plain /video stream instead.
+    """
+    info = probe(path)
+    mode = choose_transcode_mode(info)
+    duration = (info or {}).get('duration') or 0
+    manifest = {
+        'segmented': bool(info) and mode in SEGMENTED_MODES and duration > 0,
+        'transcode_mode': mode,
+        'duration': duration,
+        'segment_seconds': SEGMENT_SECONDS,
+        'count': int(-(-duration // SEGMENT_SECONDS)) if duration else 0,
+    }
+    if manifest['segmented']:
+        manifest['mime'] = VIDEO_MIME if first_stream(info, 'audio') else VIDEO_MIME_NO_AUDIO
+    return manifest
+
+
+def build_segment_command(path, index, output, info):
+    start = index * SEGMENT_SECONDS
+    has_video = first_stream(info, 'video') is not None
+    has_audio = first_stream(info, 'audio') is not None
+
+    command = ['ffmpeg', '-v', 'error', '-y', '-ss', f"{start:.3f}", '-i', path]
+    if has_video:
+        command += ['-map', '0:v:0']
+    else:
+        command += ['-f', 'lavfi', '-i', 'color=size=16x16:rate=10:color=black', '-map', '1:v:0']
+    if has_audio:
+        command += ['-map', '0:a:0']
+
+    command += [
+        '-t', str(SEGMENT_SECONDS),
+        '-vf', "scale='min(1920,iw)':-2",
+        '-vcodec', 'libx264', '-preset', 'ultrafast', '-profile:v', 'main', '-level', '4.1',
+        '-pix_fmt', 'yuv420p',
+        # One keyframe at the very start so every segment decodes on its own
+        '-force_key_frames', 'expr:eq(n,0)',
+    ]
+    if has_audio:
+        command += ['-acodec', 'aac', '-ac', '2', '-ar', '48000']
+    command += [
+        '-f', 'mp4',
+        '-movflags', 'frag_keyframe+empty_moov+default_base_moof',
+        str(output)
+    ]
+    return command
+
+
+def _encode_segment(key, path, index, info, output, priority):
+    command = build_segment_command(path, index, output, info)
+    logger.debug(f"videosegments: encoding {path} #{index}: {' '.join(command)}")
+    # Raises TranscodeError on failure (or when a prefetch is preempted by playback)
+    transcodes.run(('segment',) + key, command, priority)
+
+
+def get_segment(path, index, prefetch=True, priority=PRIORITY_PLAYBACK):
+    """Returns the cache path of segment `index` of `path`, encoding it if needed (None on failure)."""
+    info = probe(path)
+    if not info:
+        return None
+    duration = info.get('duration') or 0
+    if index < 0 or index * SEGMENT_SECONDS >= duration:
+        return None
+
+    key = _source_key(path) + (index, SEGMENT_SECONDS, SEGMENT_PROFILE)
+
+    def produce(output):
+        _encode_segment(key, path, index, info, output, priority)
+
+    joined_prefetch = priority == PRIORITY_PLAYBACK and segment_cache.is_pending(key)
+    if joined_prefetch:
+        # A prefetch of this segment is in flight and a viewer now waits on it: it must
+        # not stay queued behind other work, nor be preempted by the next playback
+        transcodes.promote(('segment',) + key, PRIORITY_PLAYBACK)
+    segment = segment_cache.get_or_create(key, produce)
+    if segment is None and joined_prefetch:
+        # The prefetch was killed before the promotion reached it: encode for the viewer
+        segment = segment_cache.get_or_create(key, produce)
+
+    if prefetch and segment is not None:
+        for ahead in range(index + 1, index + 1 + PREFETCH_SEGMENTS):
+            if ahead * SEGMENT_SECONDS >= duration:
+                break
+            ahead_key = _source_key(path) + (ahead, SEGMENT_SECONDS, SEGMENT_PROFILE)
+            if segment_cache.get(ahead_key) is None and not segment_cache.is_pending(ahead_key):
+                eventlet.spawn_n(get_segment, path, ahead, False, PRIORITY_PREFETCH)
+
+    return segment
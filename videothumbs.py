@@ -0,0 +1,146 @@
+# videothumbs.py
+# Poster frames and scrub sprite sheets for videos, without running the stream encoder.
+#
+# Both come from keyframe-only decodes: each timestamp is an input seek (-ss before -i)
+# with -skip_frame nokey, so ffmpeg jumps to the nearest keyframe and decodes just that
+# frame. The sprite sheet opens the file once per tile inside a single ffmpeg run and
+# tiles the frames into one JPEG. Results are kept in size-bounded disk caches keyed by
+# (path, size, mtime) and the layout, so a repeat preview is a plain file send.
+
+import os
+import logging
+
+from diskcache import DiskCache
+from transcode import transcodes, PRIORITY_THUMBNAIL
+from videoprobe import probe, first_stream
+
+logger = logging.getLogger(__name__)
+
+SPRITE_TILES = int(os.environ.get('FLYINGFAWK_SPRITE_TILES', '40'))
+SPRITE_COLUMNS = 8
+TILE_WIDTH = 160
+POSTER_WIDTH = 640
+THUMB_CACHE_MAX_BYTES = int(os.environ.get('FLYINGFAWK_THUMB_CACHE_MB', '256')) * 1024 * 1024
+
+# Bumped whenever the ffmpeg settings below change, so stale images aren't reused
+THUMB_PROFILE = 'jpeg-v1'
+
+thumb_cache = DiskCache('videothumbs', THUMB_CACHE_MAX_BYTES, suffix='.jpg')
+
+
+def _source_key(path):
+    st = os.stat(path)
+    return (path, st.st_size, st.st_mtime_ns)
+
+
+def _even(value):
+    return max(2, int(round(value / 2)) * 2)
+
+
+def _frame_height(video, width):
+    """Height of a `width` wide frame with the stream's display aspect ratio."""
+    try:
+        w, h = int(video['width']), int(video['height'])
+        sar_num, sar_den = (int(part) for part in video.get('sample_aspect_ratio', '1:1').split(':'))
+        if sar_num > 0 and sar_den > 0:
+            w = w * sar_num / sar_den
+        return _even(width * h / w)
+    except (KeyError, TypeError, ValueError, ZeroDivisionError):
+        return _even(width * 9 / 16)
+
+
+def sprite_layout(path):
+    """
+    Describes the sprite sheet for `path`, or None if it has no video stream:
+    {'duration', 'tiles', 'columns', 'rows', 'tile_width', 'tile_height', 'times'}.
+    Tile i shows the keyframe at or before times[i].
+    """
+    info = probe(path)
+    video = first_stream(info, 'video')
+    duration = (info or {}).get('duration') or 0
+    if video is None or duration <= 0:
+        return None
+
+    tiles = max(1, min(SPRITE_TILES, int(duration)))
+    step = duration / tiles
+    return {
+        'duration': duration,
+        'tiles': tiles,
+        'columns': min(SPRITE_COLUMNS, tiles),
+        'rows': -(-tiles // SPRITE_COLUMNS),
+        'tile_width': TILE_WIDTH,
+        'tile_height': _frame_height(video, TILE_WIDTH),
+        # Middle of each slice, so the first tile isn't the (often black) very first frame
+        'times': [round(step * (i + 0.5), 3) for i in range(tiles)],
+    }
+
+
+def _keyframe_input(path, seek_time):
+    return ['-skip_frame', 'nokey', '-noaccurate_seek', '-ss', f"{seek_time:.3f}", '-i', path]
+
+
+def build_poster_command(path, seek_time, width, height, output):
+    return ['ffmpeg', '-v', 'error', '-y'] + _keyframe_input(path, seek_time) + [
+        '-map', '0:v:0', '-frames:v', '1',
+        '-vf', f"scale={width}:{height}",
+        '-q:v', '4', '-f', 'mjpeg', str(output)
+    ]
+
+
+def build_sprite_command(path, layout, output):
+    width, height = layout['tile_width'], layout['tile_height']
+    command = ['ffmpeg', '-v', 'error', '-y']
+    filters = []
+    for i, seek_time in enumerate(layout['times']):
+        command += _keyframe_input(path, seek_time)
+        # First frame of each input only, letterboxed into the tile
+        filters.append(
+            f"[{i}:v:0]trim=end_frame=1,setpts=PTS-STARTPTS,"
+            f"scale={width}:{height}:force_original_aspect_ratio=decrease,"
+            f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2,setsar=1[t{i}]"
+        )
+    labels = ''.join(f"[t{i}]" for i in range(layout['tiles']))
+    filters.append(
+        f"{labels}concat=n={layout['tiles']}:v=1:a=0,"
+        f"tile={layout['columns']}x{layout['rows']}[sheet]"
+    )
+    command += [
+        '-filter_complex', ';'.join(filters),
+        '-map', '[sheet]', '-frames:v', '1',
+        '-q:v', '5', '-f', 'mjpeg', str(output)
+    ]
+    return command
+
+
+def _render(key, command):
+    logger.debug(f"videothumbs: {' '.join(command)}")
+    # Raises TranscodeError on failure
+    transcodes.run(('thumb',) + key, command, PRIORITY_THUMBNAIL)
+
+
+def get_poster(path):
+    """Returns the cache path of the poster frame for `path` (None for files without video)."""
+    info = probe(path)
+    video = first_stream(info, 'video')
+    duration = (info or {}).get('duration') or 0
+    if video is None:
+        return None
+
+    # A tenth in (capped), past intros and fade-ins
+    seek_time = min(duration * 0.1, 30.0) if duration > 0 else 0.0
+    height = _frame_height(video, POSTER_WIDTH)
+    key = _source_key(path) + ('poster', POSTER_WIDTH, THUMB_PROFILE)
+    return thumb_cache.get_or_create(key, lambda output: _render(
+        key, build_poster_command(path, seek_time, POSTER_WIDTH, height, output)))
+
+
+def get_sprite(path):
+    """Returns (cache path, layout) of the sprite sheet for `path`, or (None, None)."""
+    layout = sprite_layout(path)
+    if layout is None:
+        return None, None
+
+    key = _source_key(path) + ('sprite', layout['tiles'], SPRITE_COLUMNS, TILE_WIDTH, THUMB_PROFILE)
+    sheet = thumb_cache.get_or_create(key, lambda output: _render(
+        key, build_sprite_command(path, layout, output)))
+    return sheet, layout
@@ -0,0 +1,140 @@
+# zipstream.py
+# Streams a ZIP of files and directory trees to the client as it reads them.
+#
+# zipfile writes to any object with write(); on an unseekable one it emits data
+# descriptors after each entry instead of seeking back to patch the local headers. The
+# sink below just collects what zipfile wrote since the last drain, so the generator
+# hands the archive out block by block: memory stays at about one FILE_CHUNK whatever
+# the size of the tree, nothing is written to disk, and the download starts with the
+# first file. Entries get zip64 records when their size calls for it.
+
+import os
+import logging
+import zipfile
+
+import eventlet
+
+logger = logging.getLogger(__name__)
+
+FILE_CHUNK = 256 * 1024
+# Deflate runs on the hub thread; the fast level keeps other requests responsive
+ZIP_DEFLATE_LEVEL = int(os.environ.get('FLYINGFAWK_ZIP_DEFLATE_LEVEL', '1'))
+
+COMPRESSION_METHODS = {
+    'store': zipfile.ZIP_STORED,
+    'deflate': zipfile.ZIP_DEFLATED,
+}
+
+
+class _ZipSink:
+    """Write-only file object: zipfile writes into it, the generator drains it."""
+
+    def __init__(self):
+        self._parts = []
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._parts)
+        self._parts = []
+        return data
+
+
+def _archive_name(path, base_dir):
+    name = os.path.relpath(path, base_dir).replace(os.sep, '/')
+    # zipfile wants str; undecodable bytes in a name become U+FFFD instead of failing
+    return os.fsencode(name).decode('utf-8', 'replace')
+
+
+def _walk_tree(top, base_dir, seen):
+    """
+    Members of the tree at `top`, following symlinked directories. `seen` holds the
+    (st_dev, st_ino) of every directory archived so far, so a link back up the tree
+    (or a second link to one directory) is left out instead of looping.
+    """
+    for root, dirs, files in os.walk(top, followlinks=True):
+        kept = []
+        for name in sorted(dirs):
+            directory = os.path.join(root, name)
+            try:
+                st = os.stat(directory)
+            except OSError as e:
+                logger.warning(f"zipstream: skipping {directory}: {e}")
+                continue
+            if (st.st_dev, st.st_ino) in seen:
+                logger.warning(f"zipstream: skipping {directory}: links to a directory already in the archive")
+                continue
+            seen.add((st.st_dev, st.st_ino))
+            kept.append(name)
+        dirs[:] = kept
+        if not dirs and not files:
+            yield root, _archive_name(root, base_dir) + '/'
+        for name in sorted(files):
+            yield os.path.join(root, name), _archive_name(os.path.join(root, name), base_dir)
+
+
+def iter_archive_members(paths, base_dir):
+    """
+    Yields (path, archive name) for every file and empty directory under `paths`.
+    Symlinks are archived as what they point to; anything else is logged and left out.
+    """
+    seen = set()
+    for path in paths:
+        if os.path.isdir(path):
+            st = os.stat(path)
+            if (st.st_dev, st.st_ino) in seen:
+                logger.warning(f"zipstream: skipping {path}: directory already in the archive")
+                continue
+            seen.add((st.st_dev, st.st_ino))
+            yield from _walk_tree(path, base_dir, seen)
+        elif os.path.isfile(path):
+            yield path, _archive_name(path, base_dir)
+        else:
+            logger.warning(f"zipstream: skipping {path}: not a file or directory (broken link?)")
+
+
+def iter_zip(paths, base_dir, compression='store'):
+    """
+    Generator of ZIP bytes for `paths`, named relative to `base_dir`.
+    Files that can't be read are logged and left out; the archive is still valid.
+    """
+    method = COMPRESSION_METHODS[compression]
+    sink = _ZipSink()
+    archive = zipfile.ZipFile(sink, 'w', compression=method, compresslevel=ZIP_DEFLATE_LEVEL, allowZip64=True)
+    entries = 0
+
+    for path, name in iter_archive_members(paths, base_dir):
+        try:
+            info = zipfile.ZipInfo.from_file(path, name, strict_timestamps=False)
+            if info.is_dir():
+                archive.writestr(info, b'')
+            else:
+                info.compress_type = method
+                with open(path, 'rb') as source, archive.open(info, 'w') as target:
+                    while True:
+                        chunk = source.read(FILE_CHUNK)
+                        if not chunk:
+                            break
+                        target.write(chunk)
+                        data = sink.drain()
+                        if data:
+                            yield data
+            entries += 1
+        except OSError as e:
+            logger.warning(f"zipstream: skipping {path}: {e}")
+            continue
+
+        data = sink.drain()
+        if data:
+            yield data
+        # Directories full of tiny files never block on the socket; let others run
+        eventlet.sleep(0)
+
+    archive.close()
+    logger.debug(f"zipstream: archived {entries} entries from {base_dir}")
+    yield sink.drain()